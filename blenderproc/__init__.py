@@ -25,6 +25,7 @@
     from .python.utility.Initializer import init, clean_up
     from .api import postprocessing
     from .api import writer
+    from .api import reader
     from .api import material
     from .api import lighting
     from .api import camera
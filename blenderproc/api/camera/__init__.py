@@ -1,7 +1,8 @@
 from blenderproc.python.camera.CameraUtility import add_camera_pose, get_camera_pose, rotation_from_forward_vec, \
     set_intrinsics_from_blender_params, set_stereo_parameters, set_intrinsics_from_K_matrix, get_sensor_size, \
     get_view_fac_in_px, get_intrinsics_as_K_matrix, get_fov, add_depth_of_field, set_resolution, \
-    get_camera_frustum, get_camera_frustum_as_object, is_point_inside_camera_frustum
+    get_camera_frustum, get_camera_frustum_as_object, is_point_inside_camera_frustum, \
+    rotation_from_forward_vecs
 from blenderproc.python.camera.CameraValidation import perform_obstacle_in_view_check, visible_objects, \
-    scene_coverage_score, decrease_interest_score, check_novel_pose
+    scene_coverage_score, decrease_interest_score, check_novel_pose, SceneRayCaster, camera_ray_bundle
 from blenderproc.python.camera.LensDistortionUtility import set_lens_distortion, set_camera_parameters_from_config_file
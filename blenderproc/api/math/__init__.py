@@ -1,2 +1,3 @@
-from blenderproc.python.utility.MathUtility import build_transformation_mat, change_coordinate_frame_of_point, \
-    change_source_coordinate_frame_of_transformation_matrix, change_target_coordinate_frame_of_transformation_matrix
+from blenderproc.python.utility.MathUtility import build_transformation_mat, build_transformation_mats, \
+    change_coordinate_frame_of_point, change_source_coordinate_frame_of_transformation_matrix, \
+    change_target_coordinate_frame_of_transformation_matrix
@@ -8,6 +8,7 @@
     create_from_blender_mesh, create_with_empty_mesh, create_primitive, disable_all_rigid_bodies, \
     create_bvh_tree_multi_objects, compute_poi, scene_ray_cast
 from blenderproc.python.types.EntityUtility import create_empty, delete_multiple, convert_to_entities
+from blenderproc.python.utility.CollisionUtility import CollisionIndex, BvhCache
 
 
 class Object:
@@ -0,0 +1,2 @@
+from blenderproc.python.reader.Hdf5DatasetReader import Hdf5Dataset, Hdf5Frame
+from blenderproc.python.reader.CocoAnnotationReader import CocoAnnotationIndex
@@ -8,3 +8,4 @@
 from blenderproc.python.sampler.Front3DPointInRoomSampler import Front3DPointInRoomSampler
 from blenderproc.python.sampler.ReplicaPointInRoomSampler import ReplicaPointInRoomSampler
 from blenderproc.python.sampler.SuncgPointInRoomSampler import SuncgPointInRoomSampler
+from blenderproc.python.sampler.ArmaturePoseSampler import ArmaturePoseSampler
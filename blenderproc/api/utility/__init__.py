@@ -2,3 +2,4 @@
     set_keyframe_render_interval, reset_keyframes, UndoAfterExecution, BlockStopWatch
 from blenderproc.python.utility.LabelIdMapping import LabelIdMapping
 from blenderproc.python.utility.PatternUtility import generate_random_pattern_img
+from blenderproc.python.utility.MetricsUtility import MetricsRegistry, StageTimer, measure_stage
@@ -1,4 +1,5 @@
 from blenderproc.python.writer.GifWriterUtility import write_gif_animation
 from blenderproc.python.writer.BopWriterUtility import write_bop
-from blenderproc.python.writer.CocoWriterUtility import write_coco_annotations
-from blenderproc.python.writer.WriterUtility import write_hdf5
+from blenderproc.python.writer.CocoWriterUtility import write_coco_annotations, CocoStreamWriter
+from blenderproc.python.writer.WriterUtility import write_hdf5, Hdf5StreamWriter
+from blenderproc.python.writer.AsyncWriterUtility import AsyncWriterPool
@@ -42,6 +42,8 @@ def cli():
             'uninstall': "Uninstalls package in the Blender python environment"
         },
         "quickstart": {
+        },
+        "generate": {
         }
     }
 
@@ -68,6 +70,8 @@ def cli():
     parser_extract = subparsers.add_parser('extract', help="Extract the raw images from generated containers such "
                                                            "as hdf5. \nOptions: {', '.join(options['extract'])}",
                                            formatter_class=argparse.RawTextHelpFormatter)
+    subparsers.add_parser('generate', help="Generates a dataset with multiple BlenderProc processes running in "
+                                           "parallel and merges their coco and hdf5 outputs.", add_help=False)
     parser_pip = subparsers.add_parser('pip', help="Can be used to install/uninstall pip packages in the Blender "
                                                    "python environment. \nOptions: {', '.join(options['pip'])}",
                                        formatter_class=argparse.RawTextHelpFormatter)
@@ -218,9 +222,11 @@ def handle_sigterm(_signum, _frame):
 
         sys.exit(p.returncode)
     # Import the required entry point
-    elif args.mode in ["vis", "extract", "download"]:
+    elif args.mode in ["vis", "extract", "download", "generate"]:
         # pylint: disable=import-outside-toplevel
-        if args.mode == "vis" and args.vis_mode == "hdf5":
+        if args.mode == "generate":
+            from blenderproc.scripts.generate import cli as current_cli
+        elif args.mode == "vis" and args.vis_mode == "hdf5":
             from blenderproc.scripts.visHdf5Files import cli as current_cli
         elif args.mode == "vis" and args.vis_mode == "coco":
             from blenderproc.scripts.vis_coco_annotation import cli as current_cli
@@ -135,6 +135,46 @@ def rotation_from_forward_vec(forward_vec: Union[np.ndarray, Vector], up_axis: s
     return np.array(rotation_matrix)
 
 
+def rotation_from_forward_vecs(forward_vecs: Union[np.ndarray, List[List[float]]], up_axis: str = 'Y',
+                               inplane_rots: Optional[Union[np.ndarray, List[float]]] = None) -> np.ndarray:
+    """ Returns the camera rotation matrices for multiple forward vectors at once.
+
+    This is the batch counterpart of rotation_from_forward_vec() and returns the same rotations.
+
+    :param forward_vecs: An (N,3) array of forward vectors, which specify the directions the camera should look.
+    :param up_axis: The up axis, usually Y.
+    :param inplane_rots: The N inplane rotations in radians. If None is given, the inplane rotations are determined
+                         only based on the up vector.
+    :return: The (N,3,3) rotation matrices.
+    """
+    if up_axis not in ['X', 'Y']:
+        raise ValueError(f"Invalid up axis {up_axis}, the up axis of a camera looking along -Z must be X or Y")
+    forward_vecs = np.asarray(forward_vecs, dtype=np.float64)
+
+    # The camera looks along its -Z axis and its up axis is kept in the vertical plane through the forward vector
+    z_axes = -forward_vecs / np.linalg.norm(forward_vecs, axis=1, keepdims=True)
+    x_axes = np.stack([-z_axes[:, 1], z_axes[:, 0], np.zeros(len(z_axes))], axis=1)
+    # Blender handles looking (nearly) straight up or down differently, these rotations are computed one by one
+    vertical = np.abs(forward_vecs[:, 0]) + np.abs(forward_vecs[:, 1]) < 1e-4
+    x_axes[vertical] = [1, 0, 0]
+    x_axes /= np.linalg.norm(x_axes, axis=1, keepdims=True)
+    y_axes = np.cross(z_axes, x_axes)
+    if up_axis == 'X':
+        x_axes, y_axes = y_axes, -x_axes
+    rotation_matrices = np.stack([x_axes, y_axes, z_axes], axis=2)
+
+    for i in np.flatnonzero(vertical):
+        rotation_matrices[i] = rotation_from_forward_vec(forward_vecs[i], up_axis)
+
+    if inplane_rots is not None:
+        inplane_rots = np.asarray(inplane_rots, dtype=np.float64)
+        cos_rot, sin_rot = np.cos(inplane_rots), np.sin(inplane_rots)
+        x_axes = rotation_matrices[:, :, 0].copy()
+        rotation_matrices[:, :, 0] = cos_rot[:, None] * x_axes + sin_rot[:, None] * rotation_matrices[:, :, 1]
+        rotation_matrices[:, :, 1] = cos_rot[:, None] * rotation_matrices[:, :, 1] - sin_rot[:, None] * x_axes
+    return rotation_matrices
+
+
 def set_resolution(image_width: int = None, image_height: int = None):
     """ Sets the camera resolution.
 
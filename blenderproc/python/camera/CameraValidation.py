@@ -2,19 +2,257 @@
 
 import numbers
 import sys
-from typing import Union, List, Set
+from typing import Union, List, Set, Optional, Tuple, Any, Dict, NamedTuple
 from collections import defaultdict
 
 import bpy
 import numpy as np
-from mathutils import Matrix
+from mathutils import Matrix, Vector
 from mathutils.bvhtree import BVHTree
 
-from blenderproc.python.types.MeshObjectUtility import MeshObject
+from blenderproc.python.types.MeshObjectUtility import MeshObject, get_all_mesh_objects
+
+
+class _RayCasterGeometry(NamedTuple):
+    """ The evaluated geometry of one object of a SceneRayCaster """
+    # The mesh pointer, number of vertices and world matrix the geometry was extracted for
+    key: Tuple[int, int, bytes]
+    local_vertices: np.ndarray
+    world_vertices: np.ndarray
+    triangles: np.ndarray
+
+
+class _RayCasterTrees(NamedTuple):
+    """ The BVH trees of a SceneRayCaster, which are None if they do not contain any triangles """
+    static_tree: Optional[BVHTree]
+    dynamic_tree: Optional[BVHTree]
+    static_triangle_owners: np.ndarray
+    # Maps each triangle of the static and then the dynamic tree to the index of its object
+    triangle_owners: np.ndarray
+
+
+class SceneRayCaster:
+    """ Casts rays against the evaluated geometry of mesh objects, using BVH trees in world space.
+
+    In contrast to bpy.context.scene.ray_cast(), the depsgraph is not fetched for every ray and the trees are reused
+    for all rays, until one of the objects changes. So validating many camera poses of the same scene state only
+    builds the trees once.
+
+    The objects are split into two trees: the objects which have not changed since the trees were built first and
+    the objects which have changed at least once, e.g. a robot whose pose is sampled before every camera check.
+    If only the latter change, only their own tree is rebuilt.
+
+    An object counts as changed if its pose, its mesh or its number of vertices changes. The evaluated vertices of
+    objects with modifiers or shape keys, e.g. meshes deformed by an armature, are compared as well. Other edits of
+    a mesh, which keep its number of vertices, are only detected with update(force=True).
+
+    Usage:
+
+    .. code-block:: python
+
+        ray_caster = SceneRayCaster()
+        for cam2world_matrix in candidate_poses:
+            if bproc.camera.perform_obstacle_in_view_check(cam2world_matrix, {"min": 0.5}, ray_caster):
+                objects = bproc.camera.visible_objects(cam2world_matrix, ray_caster=ray_caster)
+    """
+
+    def __init__(self, objects: Optional[List[MeshObject]] = None):
+        """
+        :param objects: The objects to cast the rays against. If None is given, all visible mesh objects of the scene
+                        are used.
+        """
+        self._objects_to_use = objects
+        # The objects in the order of the current trees
+        self.objects: List[MeshObject] = []
+        self._pointers: Optional[List[int]] = None
+        # Maps the pointer of every object to its evaluated geometry
+        self._geometries: Dict[int, _RayCasterGeometry] = {}
+        # The pointers of the objects, which have changed since the trees were built first
+        self._dynamic_pointers: Set[int] = set()
+        self._trees = _RayCasterTrees(None, None, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def update(self, force: bool = False):
+        """ Rebuilds the trees of the objects, which have changed since the trees were built.
+
+        :param force: If True, the geometry of all objects is extracted again and all trees are rebuilt.
+        """
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        if self._objects_to_use is None:
+            objects = [obj for obj in get_all_mesh_objects() if obj.blender_obj.visible_get()]
+        else:
+            objects = self._objects_to_use
+        pointers = [obj.blender_obj.as_pointer() for obj in objects]
+        rebuild_static = force or pointers != self._pointers
+        if rebuild_static:
+            # Start over with all objects in the static tree
+            self.objects = list(objects)
+            self._pointers = pointers
+            self._geometries = {}
+            self._dynamic_pointers = set()
+
+        changed_pointers = set()
+        for pointer, obj in zip(pointers, objects):
+            evaluated_obj = obj.blender_obj.evaluated_get(depsgraph)
+            mesh = obj.get_mesh()
+            key = (mesh.as_pointer(), len(mesh.vertices), np.array(evaluated_obj.matrix_world).tobytes())
+            geometry = self._geometries.get(pointer)
+            deformable = len(obj.blender_obj.modifiers) > 0 or mesh.shape_keys is not None
+            if geometry is not None and geometry.key == key and not deformable:
+                continue
+            local_vertices, triangles = SceneRayCaster._evaluated_geometry(evaluated_obj)
+            if geometry is not None and geometry.key == key and \
+                    np.array_equal(geometry.local_vertices, local_vertices) and \
+                    np.array_equal(geometry.triangles, triangles):
+                continue
+            local2world = np.array(evaluated_obj.matrix_world)
+            self._geometries[pointer] = _RayCasterGeometry(key, local_vertices,
+                                                           local_vertices @ local2world[:3, :3].T + local2world[:3, 3],
+                                                           triangles)
+            if geometry is not None:
+                changed_pointers.add(pointer)
+
+        if not rebuild_static and not changed_pointers:
+            return
+        if not changed_pointers <= self._dynamic_pointers:
+            # Objects, which have been static so far, are moved into the dynamic tree
+            self._dynamic_pointers |= changed_pointers
+            rebuild_static = True
+        static_tree, static_triangle_owners = self._trees.static_tree, self._trees.static_triangle_owners
+        if rebuild_static:
+            static_tree, static_triangle_owners = self._build_tree(
+                [i for i, pointer in enumerate(pointers) if pointer not in self._dynamic_pointers])
+        dynamic_tree, dynamic_triangle_owners = self._build_tree(
+            [i for i, pointer in enumerate(pointers) if pointer in self._dynamic_pointers])
+        self._trees = _RayCasterTrees(static_tree, dynamic_tree, static_triangle_owners,
+                                      np.concatenate([static_triangle_owners, dynamic_triangle_owners]))
+
+    def ray_cast(self, origin: Union[Vector, np.ndarray, List[float]],
+                 direction: Union[Vector, np.ndarray, List[float]], distance: Optional[float] = None) \
+            -> Tuple[Optional[Vector], Optional[Vector], Optional[int], Optional[float]]:
+        """ Casts a single ray, this has the same interface as BVHTree.ray_cast().
+
+        The trees are not updated, call update() first if the scene might have changed.
+
+        :param origin: The origin of the ray.
+        :param direction: The direction of the ray.
+        :param distance: The maximum distance to search for hits, if None is given the distance is not limited.
+        :return: The location, normal, triangle index and distance of the hit, all of them are None if nothing was hit.
+        """
+        hit = (None, None, None, None)
+        for tree, index_offset in [(self._trees.static_tree, 0),
+                                   (self._trees.dynamic_tree, len(self._trees.static_triangle_owners))]:
+            if tree is None:
+                continue
+            if distance is None:
+                location, normal, index, hit_distance = tree.ray_cast(origin, direction)
+            else:
+                location, normal, index, hit_distance = tree.ray_cast(origin, direction, distance)
+            if index is not None:
+                hit = (location, normal, index + index_offset, hit_distance)
+                # The next tree only has to be searched up to this hit
+                distance = hit_distance
+        return hit
+
+    def hit_object(self, triangle_index: int) -> MeshObject:
+        """ Returns the object of the given triangle of the trees.
+
+        :param triangle_index: The triangle index returned by ray_cast().
+        :return: The mesh object.
+        """
+        return self.objects[self._trees.triangle_owners[triangle_index]]
+
+    def cast(self, origins: np.ndarray, directions: np.ndarray, distance: Optional[float] = None) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """ Casts a bundle of rays, e.g. the rays of camera_ray_bundle().
+
+        The trees are updated before, if the scene has changed.
+
+        :param origins: The origins of the rays in the shape (..., 3), they are broadcasted against the directions.
+        :param directions: The directions of the rays in the shape (..., 3).
+        :param distance: The maximum distance to search for hits, if None is given the distance is not limited.
+        :return: The distances of the hits, which are inf for rays without a hit, and the indices of the hit objects
+                 in the objects list, which are -1 for rays without a hit. Both have the shape (...).
+        """
+        self.update()
+        origins, directions = np.broadcast_arrays(np.asarray(origins, dtype=np.float64),
+                                                  np.asarray(directions, dtype=np.float64))
+        shape = directions.shape[:-1]
+        distances = np.full(int(np.prod(shape)), np.inf)
+        hit_objects = np.full(int(np.prod(shape)), -1, dtype=np.int64)
+        if len(self._trees.triangle_owners) > 0:
+            for i, (origin, direction) in enumerate(zip(origins.reshape(-1, 3).tolist(),
+                                                        directions.reshape(-1, 3).tolist())):
+                _, _, index, hit_distance = self.ray_cast(origin, direction, distance)
+                if index is not None:
+                    distances[i] = hit_distance
+                    hit_objects[i] = self._trees.triangle_owners[index]
+        return distances.reshape(shape), hit_objects.reshape(shape)
+
+    def _build_tree(self, object_indices: List[int]) -> Tuple[Optional[BVHTree], np.ndarray]:
+        """ Builds one tree of the world space geometry of the given objects.
+
+        :param object_indices: The indices of the objects in the objects list.
+        :return: The tree, which is None if there are no triangles, and the object index of each of its triangles.
+        """
+        vertices, triangles, triangle_owners = [], [], []
+        num_vertices = 0
+        for object_index in object_indices:
+            geometry = self._geometries[self._pointers[object_index]]
+            vertices.append(geometry.world_vertices)
+            triangles.append(geometry.triangles + num_vertices)
+            triangle_owners.append(np.full(len(geometry.triangles), object_index, dtype=np.int64))
+            num_vertices += len(geometry.world_vertices)
+
+        if not triangles or sum(len(object_triangles) for object_triangles in triangles) == 0:
+            return None, np.empty(0, dtype=np.int64)
+        return BVHTree.FromPolygons(np.concatenate(vertices).tolist(), np.concatenate(triangles).tolist(),
+                                    all_triangles=True), np.concatenate(triangle_owners)
+
+    @staticmethod
+    def _evaluated_geometry(evaluated_obj: bpy.types.Object) -> Tuple[np.ndarray, np.ndarray]:
+        """ Extracts the vertices and triangles of the evaluated mesh, i.e. after all modifiers and shape keys.
+
+        :param evaluated_obj: The evaluated blender object.
+        :return: The vertices in local space in the shape (N, 3) and the vertex indices of the triangles (T, 3).
+        """
+        mesh = evaluated_obj.to_mesh()
+        mesh.calc_loop_triangles()
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", vertices)
+        triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+        mesh.loop_triangles.foreach_get("vertices", triangles)
+        evaluated_obj.to_mesh_clear()
+        return vertices.reshape(-1, 3), triangles.reshape(-1, 3)
+
+
+def camera_ray_bundle(cam2world_matrices: Union[Matrix, np.ndarray], sqrt_number_of_rays: int = 10) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns the rays from the camera position through a grid on the camera frame.
+
+    The rays are ordered like the loops of the validation functions: the x steps are the outer and the y steps the
+    inner loop.
+
+    :param cam2world_matrices: One camera pose as 4x4 matrix or multiple poses as (M,4,4) array.
+    :param sqrt_number_of_rays: The square root of the number of rays per camera pose.
+    :return: The origins of the rays in the shape (3,) or (M,3) and the not normalized directions of the rays in the
+             shape (R,3) or (M,R,3) with R = sqrt_number_of_rays².
+    """
+    cam2world_matrices = np.array(cam2world_matrices, dtype=np.float64)
+    # Get position of the corners of the near plane in camera space
+    frame = np.array([list(corner) for corner in bpy.context.scene.camera.data.view_frame(scene=bpy.context.scene)])
+
+    # Go in discrete grid-like steps over plane
+    steps = np.arange(sqrt_number_of_rays) / float(sqrt_number_of_rays - 1)
+    steps_x, steps_y = np.meshgrid(steps, steps, indexing="ij")
+    points = frame[0] + steps_x.reshape(-1, 1) * (frame[1] - frame[0]) + steps_y.reshape(-1, 1) * (frame[3] - frame[0])
+
+    # The rays are sent from the camera position through the points on the plane
+    directions = points @ np.swapaxes(cam2world_matrices[..., :3, :3], -1, -2)
+    return cam2world_matrices[..., :3, 3], directions
 
 
 def perform_obstacle_in_view_check(cam2world_matrix: Union[Matrix, np.ndarray], proximity_checks: dict,
-                                   bvh_tree: BVHTree, sqrt_number_of_rays: int = 10) -> bool:
+                                   bvh_tree: Union[BVHTree, SceneRayCaster], sqrt_number_of_rays: int = 10) -> bool:
     """ Check if there are obstacles in front of the camera which are too far or too close based on the given
         proximity_checks.
 
@@ -24,7 +262,8 @@ def perform_obstacle_in_view_check(cam2world_matrix: Union[Matrix, np.ndarray],
                              threshold in case of max or min. The operators are combined in conjunction
                              (i.e boolean AND). This can also be used to avoid the background in images, with the
                              no_background: True option.
-    :param bvh_tree: A bvh tree containing all objects that should be considered here.
+    :param bvh_tree: A bvh tree containing all objects that should be considered here. A SceneRayCaster can be
+                     used instead, which is updated if the scene changed.
     :param sqrt_number_of_rays: The square root of the number of rays which will be used to determine the
                                 visible objects.
     :return: True, if the given camera pose does not violate any of the specified proximity_checks.
@@ -32,18 +271,9 @@ def perform_obstacle_in_view_check(cam2world_matrix: Union[Matrix, np.ndarray],
     if not proximity_checks:  # if no checks are in the settings all positions are accepted
         return True
 
-    cam2world_matrix = Matrix(cam2world_matrix)
-
-    cam_ob = bpy.context.scene.camera
-    cam = cam_ob.data
-    # Get position of the corners of the near plane
-    frame = cam.view_frame(scene=bpy.context.scene)
-    # Bring to world space
-    frame = [cam2world_matrix @ v for v in frame]
-
-    # Compute vectors along both sides of the plane
-    vec_x = frame[1] - frame[0]
-    vec_y = frame[3] - frame[0]
+    position, directions = camera_ray_bundle(cam2world_matrix, sqrt_number_of_rays)
+    if isinstance(bvh_tree, SceneRayCaster):
+        bvh_tree.update()
 
     sum_value = 0.0
     sum_sq = 0.0
@@ -75,32 +305,28 @@ def perform_obstacle_in_view_check(cam2world_matrix: Union[Matrix, np.ndarray],
         # when no background is on, it can not be combined with a reduced range distance
         no_range_distance = True
 
-    # Go in discrete grid-like steps over plane
-    position = cam2world_matrix.to_translation()
-    for x in range(0, sqrt_number_of_rays):
-        for y in range(0, sqrt_number_of_rays):
-            # Compute current point on plane
-            end = frame[0] + vec_x * x / float(sqrt_number_of_rays - 1) + vec_y * y / float(sqrt_number_of_rays - 1)
-            # Send ray from the camera position through the current point on the plane
-            if no_range_distance:
-                _, _, _, dist = bvh_tree.ray_cast(position, end - position)
-            else:
-                _, _, _, dist = bvh_tree.ray_cast(position, end - position, range_distance)
-
-            # Check if something was hit and how far it is away
-            if dist is not None:
-                if "min" in proximity_checks and dist <= proximity_checks["min"]:
-                    return False
-                if "max" in proximity_checks and dist >= proximity_checks["max"]:
-                    return False
-                if "avg" in proximity_checks:
-                    sum_value += dist
-                if "var" in proximity_checks:
-                    if not "avg" in proximity_checks:
-                        sum_value += dist
-                    sum_sq += dist * dist
-            elif "no_background" in proximity_checks and proximity_checks["no_background"]:
+    # Send the rays one after another, so the check can stop at the first ray which violates a threshold
+    position = position.tolist()
+    for direction in directions.tolist():
+        if no_range_distance:
+            _, _, _, dist = bvh_tree.ray_cast(position, direction)
+        else:
+            _, _, _, dist = bvh_tree.ray_cast(position, direction, range_distance)
+
+        # Check if something was hit and how far it is away
+        if dist is not None:
+            if "min" in proximity_checks and dist <= proximity_checks["min"]:
+                return False
+            if "max" in proximity_checks and dist >= proximity_checks["max"]:
                 return False
+            if "avg" in proximity_checks:
+                sum_value += dist
+            if "var" in proximity_checks:
+                if not "avg" in proximity_checks:
+                    sum_value += dist
+                sum_sq += dist * dist
+        elif "no_background" in proximity_checks and proximity_checks["no_background"]:
+            return False
 
     if "avg" in proximity_checks:
         avg = sum_value / (sqrt_number_of_rays * sqrt_number_of_rays)
@@ -123,7 +349,8 @@ def perform_obstacle_in_view_check(cam2world_matrix: Union[Matrix, np.ndarray],
     return True
 
 
-def visible_objects(cam2world_matrix: Union[Matrix, np.ndarray], sqrt_number_of_rays: int = 10) -> Set[MeshObject]:
+def visible_objects(cam2world_matrix: Union[Matrix, np.ndarray], sqrt_number_of_rays: int = 10,
+                    ray_caster: Optional[SceneRayCaster] = None) -> Set[MeshObject]:
     """ Returns a set of objects visible from the given camera pose.
 
     Sends a grid of rays through the camera frame and returns all objects hit by at least one ray.
@@ -131,41 +358,17 @@ def visible_objects(cam2world_matrix: Union[Matrix, np.ndarray], sqrt_number_of_
     :param cam2world_matrix: The world matrix which describes the camera orientation to check.
     :param sqrt_number_of_rays: The square root of the number of rays which will be used to determine the
                                 visible objects.
+    :param ray_caster: If given, its cached tree is used instead of casting the rays against the scene.
     :return: A set of objects visible hit by the sent rays.
     """
-    cam2world_matrix = Matrix(cam2world_matrix)
-
-    visible_objects_set = set()
-    cam_ob = bpy.context.scene.camera
-    cam = cam_ob.data
-
-    # Get position of the corners of the near plane
-    frame = cam.view_frame(scene=bpy.context.scene)
-    # Bring to world space
-    frame = [cam2world_matrix @ v for v in frame]
-
-    # Compute vectors along both sides of the plane
-    vec_x = frame[1] - frame[0]
-    vec_y = frame[3] - frame[0]
-
-    # Go in discrete grid-like steps over plane
-    position = cam2world_matrix.to_translation()
-    for x in range(0, sqrt_number_of_rays):
-        for y in range(0, sqrt_number_of_rays):
-            # Compute current point on plane
-            end = frame[0] + vec_x * x / float(sqrt_number_of_rays - 1) + vec_y * y / float(sqrt_number_of_rays - 1)
-            # Send ray from the camera position through the current point on the plane
-            _, _, _, _, hit_object, _ = bpy.context.scene.ray_cast(bpy.context.evaluated_depsgraph_get(),
-                                                                   position, end - position)
-            # Add hit object to set
-            if hit_object:
-                visible_objects_set.add(MeshObject(hit_object))
-
-    return visible_objects_set
+    return {MeshObject(hit_object) if ray_caster is None else hit_object
+            for hit_object in _CameraValidation.hit_objects(cam2world_matrix, sqrt_number_of_rays, ray_caster)
+            if hit_object is not None}
 
 
 def scene_coverage_score(cam2world_matrix: Union[Matrix, np.ndarray], special_objects: list = None,
-                         special_objects_weight: float = 2, sqrt_number_of_rays: int = 10) -> float:
+                         special_objects_weight: float = 2, sqrt_number_of_rays: int = 10,
+                         ray_caster: Optional[SceneRayCaster] = None) -> float:
     """ Evaluate the interestingness/coverage of the scene.
 
     This module tries to look at as many objects at possible, this might lead to
@@ -181,64 +384,48 @@ def scene_coverage_score(cam2world_matrix: Union[Matrix, np.ndarray], special_ob
                                    scene is. Default: 2.0.
     :param sqrt_number_of_rays: The square root of the number of rays which will be used to determine the
                                 visible objects.
+    :param ray_caster: If given, its cached tree is used instead of casting the rays against the scene.
     :return: the scoring of the scene.
     """
-    cam2world_matrix = Matrix(cam2world_matrix)
-
     if special_objects is None:
         special_objects = []
-    cam_ob = bpy.context.scene.camera
-    cam = cam_ob.data
 
     num_of_rays = sqrt_number_of_rays * sqrt_number_of_rays
     score = 0.0
     objects_hit: defaultdict = defaultdict(int)
 
-    # Get position of the corners of the near plane
-    frame = cam.view_frame(scene=bpy.context.scene)
-    # Bring to world space
-    frame = [cam2world_matrix @ v for v in frame]
-
-    # Compute vectors along both sides of the plane
-    vec_x = frame[1] - frame[0]
-    vec_y = frame[3] - frame[0]
-
-    # Go in discrete grid-like steps over plane
-    position = cam2world_matrix.to_translation()
-    for x in range(0, sqrt_number_of_rays):
-        for y in range(0, sqrt_number_of_rays):
-            # Compute current point on plane
-            end = frame[0] + vec_x * x / float(sqrt_number_of_rays - 1) + vec_y * y / float(sqrt_number_of_rays - 1)
-            # Send ray from the camera position through the current point on the plane
-            hit, _, _, _, hit_object, _ = bpy.context.scene.ray_cast(bpy.context.evaluated_depsgraph_get(),
-                                                                     position, end - position)
-
-            if hit:
-                is_of_special_dataset = "is_suncg" in hit_object or "is_3d_front" in hit_object
-                is_suncg_object = "suncg_type" in hit_object and hit_object["suncg_type"] == "Object"
-                is_front_3d_object = "3D_future_type" in hit_object and hit_object["3D_future_type"] == "Object"
-                if is_of_special_dataset and is_suncg_object or is_of_special_dataset and is_front_3d_object:
-                    # calculate the score based on the type of the object,
-                    # wall, floor and ceiling objects have 0 score
-                    if "coarse_grained_class" in hit_object:
-                        object_class = hit_object["coarse_grained_class"]
-                        objects_hit[object_class] += 1
-                        if object_class in special_objects:
-                            score += special_objects_weight
-                        else:
-                            score += 1
-                    else:
-                        score += 1
-                elif "category_id" in hit_object:
-                    object_class = hit_object["category_id"]
-                    if object_class in special_objects:
-                        score += special_objects_weight
-                    else:
-                        score += 1
-                    objects_hit[object_class] += 1
+    # Count the rays per hit object, so the custom properties of each object are only read once
+    rays_per_object: defaultdict = defaultdict(int)
+    for hit_object in _CameraValidation.hit_objects(cam2world_matrix, sqrt_number_of_rays, ray_caster):
+        if hit_object is not None:
+            rays_per_object[hit_object if ray_caster is None else hit_object.blender_obj] += 1
+
+    for hit_object, num_rays in rays_per_object.items():
+        is_of_special_dataset = "is_suncg" in hit_object or "is_3d_front" in hit_object
+        is_suncg_object = "suncg_type" in hit_object and hit_object["suncg_type"] == "Object"
+        is_front_3d_object = "3D_future_type" in hit_object and hit_object["3D_future_type"] == "Object"
+        if is_of_special_dataset and is_suncg_object or is_of_special_dataset and is_front_3d_object:
+            # calculate the score based on the type of the object,
+            # wall, floor and ceiling objects have 0 score
+            if "coarse_grained_class" in hit_object:
+                object_class = hit_object["coarse_grained_class"]
+                objects_hit[object_class] += num_rays
+                if object_class in special_objects:
+                    score += special_objects_weight * num_rays
                 else:
-                    objects_hit[hit_object] += 1
-                    score += 1
+                    score += num_rays
+            else:
+                score += num_rays
+        elif "category_id" in hit_object:
+            object_class = hit_object["category_id"]
+            if object_class in special_objects:
+                score += special_objects_weight * num_rays
+            else:
+                score += num_rays
+            objects_hit[object_class] += num_rays
+        else:
+            objects_hit[hit_object] += num_rays
+            score += num_rays
     # For a scene with three different objects, the starting variance is 1.0, increases/decreases by '1/3' for
     # each object more/less, excluding floor, ceiling and walls
     scene_variance = len(objects_hit) / 3.0
@@ -314,3 +501,31 @@ def _variance_constraint(array, new_val, old_var, diff_threshold, mode):
                 return False
 
     return True
+
+
+class _CameraValidation:
+
+    @staticmethod
+    def hit_objects(cam2world_matrix: Union[Matrix, np.ndarray], sqrt_number_of_rays: int,
+                    ray_caster: Optional[SceneRayCaster]) -> List[Any]:
+        """ Sends a grid of rays through the camera frame and returns the first object hit by each ray.
+
+        :param cam2world_matrix: The world matrix which describes the camera pose.
+        :param sqrt_number_of_rays: The square root of the number of rays.
+        :param ray_caster: If given, its cached tree is used. Otherwise, the rays are cast against the scene.
+        :return: For each ray the hit object or None. These are MeshObjects, if a ray_caster is given, otherwise
+                 blender objects.
+        """
+        position, directions = camera_ray_bundle(cam2world_matrix, sqrt_number_of_rays)
+        if ray_caster is not None:
+            _, hit_objects = ray_caster.cast(position, directions)
+            return [ray_caster.objects[index] if index >= 0 else None for index in hit_objects]
+
+        # The depsgraph is only fetched once for all rays
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        position = Vector(position)
+        hit_objects = []
+        for direction in directions:
+            _, _, _, _, hit_object, _ = bpy.context.scene.ray_cast(depsgraph, position, Vector(direction))
+            hit_objects.append(hit_object)
+        return hit_objects
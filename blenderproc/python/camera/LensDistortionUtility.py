@@ -9,12 +9,13 @@
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, List, Tuple, Optional
 
+import cv2
 import numpy as np
 import yaml
 import bpy
-from scipy.ndimage import map_coordinates
 
 from blenderproc.python.modules.main.GlobalStorage import GlobalStorage
 from blenderproc.python.camera import CameraUtility
@@ -196,6 +197,8 @@ def set_lens_distortion(k1: float, k2: float, k3: float = 0.0, p1: float = 0.0,
     if use_global_storage:
         GlobalStorage.set("_lens_distortion_is_used", {"mapping_coords": mapping_coords,
                                                     "original_image_res": original_image_resolution})
+    # Prepare the remap tables once, they are reused by every apply_lens_distortion() call with this mapping
+    _LensDistortionUtility.get_remap_tables(mapping_coords, *original_image_resolution)
     return mapping_coords
 
 
@@ -203,7 +206,8 @@ def apply_lens_distortion(image: Union[List[np.ndarray], np.ndarray],
                           mapping_coords: Optional[np.ndarray] = None,
                           orig_res_x: Optional[int] = None,
                           orig_res_y: Optional[int] = None,
-                          use_interpolation: bool = True) -> Union[List[np.ndarray], np.ndarray]:
+                          use_interpolation: bool = True,
+                          num_workers: int = 1) -> Union[List[np.ndarray], np.ndarray]:
     """
     This functions applies the lens distortion mapping that needs to be precalculated by
     `bproc.camera.set_lens_distortion()`.
@@ -211,12 +215,16 @@ def apply_lens_distortion(image: Union[List[np.ndarray], np.ndarray],
     Without calling this function the `set_lens_distortion` fct. only increases the image resolution and
     changes the K matrix of the camera.
 
+    The remap tables are computed once per mapping and reused for all following images. All channels of an image
+    are distorted in one pass.
+
     :param image: a list of images or an image to be distorted
     :param mapping_coords: an array of pixel mappings from undistorted to distorted image
     :param orig_res_x: original and output width resolution of the image
     :param orig_res_y: original and output height resolution of the image
-    :param use_interpolation: if this is True, for each pixel an interpolation will be performed, if this is false
-                              the nearest pixel will be used
+    :param use_interpolation: if this is True, for each pixel a bilinear interpolation will be performed, if this is
+                              false the nearest pixel will be used, e.g. for segmentation maps
+    :param num_workers: The number of threads, which distort the images of a list of images in parallel.
     :return: a list of images or an image that have been distorted, now in the desired (original) resolution
     """
 
@@ -233,7 +241,7 @@ def apply_lens_distortion(image: Union[List[np.ndarray], np.ndarray],
                             "'orig_res_x' + 'orig_res_x' to bproc.postprocessing.apply_lens_distortion(...). "
                             "Previously this could also have been done via the CameraInterface module, "
                             "see the example on lens_distortion.")
-    interpolation_order = 2 if use_interpolation else 0
+    remap_tables = _LensDistortionUtility.get_remap_tables(mapping_coords, orig_res_y, orig_res_x)
 
     def _internal_apply(input_image: np.ndarray) -> np.ndarray:
         """
@@ -241,35 +249,14 @@ def _internal_apply(input_image: np.ndarray) -> np.ndarray:
         :param input_image: input image, which will be distorted
         :return: distorted input image
         """
-        amount_of_output_channels = 1
-        if len(input_image.shape) == 3:
-            amount_of_output_channels = input_image.shape[2]
-        image_distorted = np.zeros((orig_res_y, orig_res_x, amount_of_output_channels))
-        used_dtpye = input_image.dtype
-        data = input_image.astype(np.float)
-        # Forward mapping in order to distort the undistorted image coordinates
-        # and reshape the arrays into the image shape grid.
-        # The reference frame for coords is as in DLR CalDe etc. (the upper-left pixel center is at [0,0])
-        for i in range(image_distorted.shape[2]):
-            if len(input_image.shape) == 3:
-                image_distorted[:, :, i] = np.reshape(map_coordinates(data[:, :, i], mapping_coords,
-                                                                      order=interpolation_order,
-                                                                      mode='nearest'), image_distorted[:, :, i].shape)
-            else:
-                image_distorted[:, :, i] = np.reshape(map_coordinates(data, mapping_coords, order=interpolation_order,
-                                                                      mode='nearest'),
-                                                      image_distorted[:, :, i].shape)
-        # Other options are:
-        # - map_coordinates() in all channels at the same time (turns out to be slower)
-        # - use torch.nn.functional.grid_sample() instead to do it on the GPU (even in batches)
-
-        if used_dtpye == np.uint8:
-            image_distorted = np.clip(image_distorted, 0, 255)
-        data = image_distorted.astype(used_dtpye)
-        if len(input_image.shape) == 2:
-            return data[:, :, 0]
-        return data
+        if use_interpolation:
+            return remap_tables.remap_bilinear(input_image)
+        return remap_tables.remap_nearest(input_image)
+
     if isinstance(image, list):
+        if num_workers > 1 and len(image) > 1:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                return list(executor.map(_internal_apply, image))
         return [_internal_apply(img) for img in image]
     if isinstance(image, np.ndarray):
         return _internal_apply(image)
@@ -373,3 +360,96 @@ def _is_number(value: str) -> bool:
         cam2world = change_source_coordinate_frame_of_transformation_matrix(cam2world, ["X", "-Y", "-Z"])
         CameraUtility.add_camera_pose(cam2world)
     return extracted_camera_parameters["width"], extracted_camera_parameters["height"], mapping_coords
+
+
+class _RemapTables:
+    """ The precomputed lookup tables of one lens distortion mapping. """
+
+    # The dtypes cv2.remap interpolates exactly, all others are interpolated as float32 (cv2 quantizes the
+    # coordinates for float64 images)
+    _cv2_dtypes = (np.uint8, np.uint16, np.int16, np.float32)
+
+    def __init__(self, mapping_coords: np.ndarray, orig_res_y: int, orig_res_x: int):
+        """
+        :param mapping_coords: The mapping coordinates as returned by set_lens_distortion().
+        :param orig_res_y: The height of the distorted image.
+        :param orig_res_x: The width of the distorted image.
+        """
+        self.mapping_coords = mapping_coords
+        self.output_shape = (orig_res_y, orig_res_x)
+        # cv2 maps: the column and the row in the undistorted image of every distorted pixel
+        self.map_x = mapping_coords[1].reshape(self.output_shape).astype(np.float32)
+        self.map_y = mapping_coords[0].reshape(self.output_shape).astype(np.float32)
+        self._nearest_rows: Optional[np.ndarray] = None
+        self._nearest_cols: Optional[np.ndarray] = None
+        self._nearest_input_shape: Optional[Tuple[int, int]] = None
+
+    def remap_nearest(self, image: np.ndarray) -> np.ndarray:
+        """ Uses the value of the nearest pixel, which keeps labels like in segmentation maps intact.
+
+        This gives exactly the same result as scipy's map_coordinates with order=0 and mode='nearest'.
+
+        :param image: The undistorted image with two or three dimensions.
+        :return: The distorted image with the same dtype.
+        """
+        if self._nearest_input_shape != image.shape[:2]:
+            # Round half up and clamp to the border, computed on the float64 coordinates
+            rows = np.floor(self.mapping_coords[0] + 0.5).reshape(self.output_shape)
+            cols = np.floor(self.mapping_coords[1] + 0.5).reshape(self.output_shape)
+            self._nearest_rows = np.clip(rows, 0, image.shape[0] - 1).astype(np.intp)
+            self._nearest_cols = np.clip(cols, 0, image.shape[1] - 1).astype(np.intp)
+            self._nearest_input_shape = image.shape[:2]
+        return image[self._nearest_rows, self._nearest_cols]
+
+    def remap_bilinear(self, image: np.ndarray) -> np.ndarray:
+        """ Interpolates bilinearly between the four surrounding pixels, repeating the border pixels.
+
+        :param image: The undistorted image with two or three dimensions.
+        :return: The distorted image with the same dtype.
+        """
+        used_dtype = image.dtype
+        data = image if used_dtype in _RemapTables._cv2_dtypes else image.astype(np.float32)
+        num_channels = data.shape[2] if len(data.shape) == 3 else 1
+        if num_channels in (1, 3, 4):
+            image_distorted = cv2.remap(data, self.map_x, self.map_y, cv2.INTER_LINEAR,
+                                        borderMode=cv2.BORDER_REPLICATE)
+        else:
+            # cv2 only interpolates 1, 3 or 4 channels without quantizing the coordinates, so split the channels
+            channel_starts = list(range(0, num_channels - num_channels % 3, 3)) + \
+                list(range(num_channels - num_channels % 3, num_channels))
+            channel_ends = channel_starts[1:] + [num_channels]
+            image_distorted = np.concatenate([
+                cv2.remap(np.ascontiguousarray(data[:, :, start:end]), self.map_x, self.map_y, cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE).reshape(self.output_shape + (-1,))
+                for start, end in zip(channel_starts, channel_ends)], axis=2)
+        if len(image.shape) == 3 and len(image_distorted.shape) == 2:
+            # cv2 drops a single channel dimension
+            image_distorted = image_distorted[:, :, np.newaxis]
+
+        if image_distorted.dtype != used_dtype:
+            if np.issubdtype(used_dtype, np.integer):
+                info = np.iinfo(used_dtype)
+                image_distorted = np.clip(np.rint(image_distorted), info.min, info.max)
+            image_distorted = image_distorted.astype(used_dtype)
+        return image_distorted
+
+
+class _LensDistortionUtility:
+    # The remap tables of the last used mapping
+    remap_tables: Optional[_RemapTables] = None
+
+    @staticmethod
+    def get_remap_tables(mapping_coords: np.ndarray, orig_res_y: int, orig_res_x: int) -> _RemapTables:
+        """ Returns the remap tables of the given mapping, they are only computed if the mapping has changed.
+
+        :param mapping_coords: The mapping coordinates as returned by set_lens_distortion().
+        :param orig_res_y: The height of the distorted image.
+        :param orig_res_x: The width of the distorted image.
+        :return: The remap tables.
+        """
+        remap_tables = _LensDistortionUtility.remap_tables
+        if remap_tables is None or remap_tables.mapping_coords is not mapping_coords \
+                or remap_tables.output_shape != (orig_res_y, orig_res_x):
+            remap_tables = _RemapTables(mapping_coords, orig_res_y, orig_res_x)
+            _LensDistortionUtility.remap_tables = remap_tables
+        return remap_tables
@@ -5,7 +5,8 @@
 class NoiseRemoval(Module):
     """Removes noise pixels.
 
-    Assumes that noise pixel values won't occur more than 100 times.
+    Assumes that noise pixel values won't occur more than 100 times. If the image data contains multiple frames,
+    they are denoised together in one batch.
     """
 
     def __init__(self, config):
@@ -27,6 +27,9 @@ class OilPaintFilter(Module):
           - Apply the filter on an RGB image (if the image has 3 channels, they're assumed to not be replicated).
             Default: False
           - bool
+        * - num_workers
+          - The number of threads, which filter the images of multiple frames in parallel. Default: 1
+          - int
     """
 
     def __init__(self, config):
@@ -36,8 +39,9 @@ def run(self, image, key, version):
         filter_size = self.config.get_int("filter_size", 5)
         edges_only = self.config.get_bool("edges_only", True)
         rgb = self.config.get_bool("rgb", False)
+        num_workers = self.config.get_int("num_workers", 1)
 
-        filtered_img = oil_paint_filter(image, filter_size, edges_only, rgb)
+        filtered_img = oil_paint_filter(image, filter_size, edges_only, rgb, num_workers)
 
         return filtered_img, key, version
 
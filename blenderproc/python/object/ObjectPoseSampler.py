@@ -1,17 +1,16 @@
 """Allows the sampling of objects inside a sampling volume, while performing collision checks."""
 
-from typing import Callable, List, Dict, Tuple
+from typing import Callable, List, Dict, Tuple, Optional
 
-import mathutils
-
-from blenderproc.python.utility.CollisionUtility import CollisionUtility
+from blenderproc.python.utility.CollisionUtility import CollisionUtility, CollisionIndex, BvhCache
 from blenderproc.python.types.EntityUtility import Entity
 from blenderproc.python.types.MeshObjectUtility import MeshObject, get_all_mesh_objects
 
 
 def sample_poses(objects_to_sample: List[MeshObject], sample_pose_func: Callable[[MeshObject], None],
                  objects_to_check_collisions: List[MeshObject] = None, max_tries: int = 1000,
-                 mode_on_failure: str = "last_pose") -> Dict[Entity, Tuple[int, bool]]:
+                 mode_on_failure: str = "last_pose", collision_index: Optional[CollisionIndex] = None,
+                 bvh_cache: Optional[BvhCache] = None) -> Dict[Entity, Tuple[int, bool]]:
     """
     Samples positions and rotations of selected object inside the sampling volume while performing mesh and
     bounding box collision checks.
@@ -24,6 +23,11 @@ def sample_poses(objects_to_sample: List[MeshObject], sample_pose_func: Callable
     :param max_tries: Amount of tries before giving up on an object and moving to the next one.
     :param mode_on_failure: Define final state of objects that could not be placed without collisions within max_tries
                             attempts. Options: 'last_pose', 'initial_pose'
+    :param collision_index: The broad phase index of the bounding boxes, which can be shared between multiple calls.
+                            Objects whose pose changed since they have been indexed are updated. If None is given,
+                            a new index is used.
+    :param bvh_cache: The cache of the local bvh trees of the meshes, which can be shared between multiple calls.
+                      If None is given, a new cache is used.
 
     :return: A dict with the objects to sample as keys and a Tuple with the number of executed attempts to place the
              object as first element, and a bool whether it has been successfully placed without collisions.
@@ -46,8 +50,12 @@ def sample_poses(objects_to_sample: List[MeshObject], sample_pose_func: Callable
     if not objects_to_sample:
         raise RuntimeError("The list of objects_to_sample can not be empty!")
 
-    # cache to fasten collision detection
-    bvh_cache: Dict[str, mathutils.bvhtree.BVHTree] = {}
+    # cache to fasten collision detection, its local trees stay valid when the objects are moved
+    if bvh_cache is None:
+        bvh_cache = BvhCache()
+    if collision_index is None:
+        collision_index = CollisionIndex()
+    collision_index.sync(cur_objects_to_check_collisions)
 
     sample_results: Dict[Entity, Tuple[int, bool]] = {}
 
@@ -69,11 +77,10 @@ def sample_poses(objects_to_sample: List[MeshObject], sample_pose_func: Callable
             # Put the top object in queue at the sampled point in space
             sample_pose_func(obj)
 
-            # Remove bvh cache, as object has changed
-            if obj.get_name() in bvh_cache:
-                del bvh_cache[obj.get_name()]
+            collision_index.update(obj)
 
-            no_collision = CollisionUtility.check_intersections(obj, bvh_cache, cur_objects_to_check_collisions, [])
+            no_collision = CollisionUtility.check_intersections(obj, bvh_cache, cur_objects_to_check_collisions, [],
+                                                                collision_index)
 
             # If no collision then keep the position
             if no_collision:
@@ -92,6 +99,7 @@ def sample_poses(objects_to_sample: List[MeshObject], sample_pose_func: Callable
             if mode_on_failure == 'initial_pose':
                 obj.set_location(initial_location)
                 obj.set_rotation_euler(initial_rotation)
+                collision_index.update(obj)
 
         sample_results[obj] = (amount_of_tries_done, no_collision)
 
@@ -1,11 +1,10 @@
 """Sampling objects on a surface."""
 
-from typing import Callable, List, Optional, Dict
+from typing import Callable, List, Optional
 
-import mathutils
 import numpy as np
 
-from blenderproc.python.utility.CollisionUtility import CollisionUtility
+from blenderproc.python.utility.CollisionUtility import CollisionUtility, CollisionIndex, BvhCache
 from blenderproc.python.types.MeshObjectUtility import MeshObject
 
 
@@ -13,7 +12,9 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
                             sample_pose_func: Callable[[MeshObject], None], max_tries: int = 100,
                             min_distance: float = 0.25, max_distance: float = 0.6,
                             up_direction: Optional[np.ndarray] = None,
-                            check_all_bb_corners_over_surface: bool = True) -> List[MeshObject]:
+                            check_all_bb_corners_over_surface: bool = True,
+                            collision_index: Optional[CollisionIndex] = None,
+                            bvh_cache: Optional[BvhCache] = None) -> List[MeshObject]:
     """ Samples objects poses on a surface.
 
     The objects are positioned slightly above the surface due to the non-axis aligned nature of used bounding boxes
@@ -31,6 +32,10 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
     :param up_direction: Normal vector of the side of surface the objects should be placed on.
     :param check_all_bb_corners_over_surface: If this is True all bounding box corners have to be above the surface,
                                               else only the center of the object has to be above the surface
+    :param collision_index: The broad phase index of the bounding boxes, which can be shared between multiple calls.
+                            If None is given, a new index is used.
+    :param bvh_cache: The cache of the local bvh trees of the meshes, which can be shared between multiple calls.
+                      If None is given, a new cache is used.
     :return: The list of placed objects.
     """
     if up_direction is None:
@@ -41,8 +46,11 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
     surface_bounds = surface.get_bound_box()
     surface_height = max(up_direction.dot(corner) for corner in surface_bounds)
 
-    # cache to fasten collision detection
-    bvh_cache: Dict[str, mathutils.bvhtree.BVHTree] = {}
+    # cache to fasten collision detection, its local trees stay valid when the objects are moved
+    if bvh_cache is None:
+        bvh_cache = BvhCache()
+    if collision_index is None:
+        collision_index = CollisionIndex()
 
     placed_objects: List[MeshObject] = []
     for obj in objects_to_sample:
@@ -52,11 +60,9 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
 
         for i in range(max_tries):
             sample_pose_func(obj)
-            # Remove bvh cache, as object has changed
-            if obj.get_name() in bvh_cache:
-                del bvh_cache[obj.get_name()]
+            collision_index.update(obj)
 
-            if not CollisionUtility.check_intersections(obj, bvh_cache, placed_objects, []):
+            if not CollisionUtility.check_intersections(obj, bvh_cache, placed_objects, [], collision_index):
                 print("Collision detected, retrying!")
                 continue
 
@@ -65,9 +71,7 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
                 continue
 
             _OnSurfaceSampler.drop(obj, up_direction, surface_height)
-            # Remove bvh cache, as object has changed
-            if obj.get_name() in bvh_cache:
-                del bvh_cache[obj.get_name()]
+            collision_index.update(obj)
 
             if not _OnSurfaceSampler.check_above_surface(obj, surface, up_direction, check_all_bb_corners_over_surface):
                 print("Not above surface after drop, retrying!")
@@ -77,7 +81,7 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
                 print("Bad spacing after drop, retrying!")
                 continue
 
-            if not CollisionUtility.check_intersections(obj, bvh_cache, placed_objects, []):
+            if not CollisionUtility.check_intersections(obj, bvh_cache, placed_objects, [], collision_index):
                 print("Collision detected after drop, retrying!")
                 continue
 
@@ -89,6 +93,8 @@ def sample_poses_on_surface(objects_to_sample: List[MeshObject], surface: MeshOb
 
         if not placed_successfully:
             print(f"Giving up on {obj.get_name()}, deleting...")
+            collision_index.remove(obj)
+            bvh_cache.invalidate(obj)
             obj.delete()
 
     return placed_objects
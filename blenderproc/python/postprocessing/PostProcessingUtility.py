@@ -1,73 +1,49 @@
 """A set of function to post process the produced images."""
 
-from typing import Union, List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, List, Optional, Dict, Any, Callable, Tuple
 
 import numpy as np
 import bpy
 import mathutils
 import cv2
-from scipy import stats
 
 from blenderproc.python.camera import CameraUtility
 from blenderproc.python.utility.BlenderUtility import get_all_blender_mesh_objects
 
 
-def dist2depth(dist: Union[List[np.ndarray], np.ndarray]) -> Union[List[np.ndarray], np.ndarray]:
+def dist2depth(dist: Union[List[np.ndarray], np.ndarray], dtype: type = np.float64,
+               in_place: bool = False) -> Union[List[np.ndarray], np.ndarray]:
     """
-    Maps a distance image to depth image, also works with a list of images.
+    Maps a distance image to depth image, also works with a list of images or a stack of images.
+
+    The per pixel ray lengths are cached for the current intrinsics and resolution, so they are only computed
+    once for many frames.
 
     :param dist: The distance data.
-    :return: The depth data
+    :param dtype: The float dtype of the depth data, np.float32 halves the memory and time of the conversion.
+    :param in_place: If True, the distance data is overwritten with the depth data, whenever it already has the
+                     requested dtype. This avoids any allocation, e.g. for a whole (N, H, W) stack.
+    :return: The depth data, a list of images for a list or a stack of images.
     """
+    return _PostProcessingUtility.convert_with_ray_lengths(dist, True, dtype, in_place)
 
-    dist = trim_redundant_channels(dist)
-
-    if isinstance(dist, list) or hasattr(dist, "shape") and len(dist.shape) > 2:
-        return [dist2depth(img) for img in dist]
-
-    K = CameraUtility.get_intrinsics_as_K_matrix()
-    f, cx, cy = K[0, 0], K[0, 2], K[1, 2]
-
-    xs, ys = np.meshgrid(np.arange(dist.shape[1]), np.arange(dist.shape[0]))
 
-    # coordinate distances to principal point
-    x_opt = np.abs(xs - cx)
-    y_opt = np.abs(ys - cy)
-
-    # Solve 3 equations in Wolfram Alpha:
-    # Solve[{X == (x-c0)/f0*Z, Y == (y-c1)/f0*Z, X*X + Y*Y + Z*Z = d*d}, {X,Y,Z}]
-    depth = dist * f / np.sqrt(x_opt ** 2 + y_opt ** 2 + f ** 2)
-
-    return depth
-
-
-def depth2dist(depth: Union[List[np.ndarray], np.ndarray]) -> Union[List[np.ndarray], np.ndarray]:
+def depth2dist(depth: Union[List[np.ndarray], np.ndarray], dtype: type = np.float64,
+               in_place: bool = False) -> Union[List[np.ndarray], np.ndarray]:
     """
-    Maps a depth image to distance image, also works with a list of images.
+    Maps a depth image to distance image, also works with a list of images or a stack of images.
+
+    The per pixel ray lengths are cached for the current intrinsics and resolution, so they are only computed
+    once for many frames.
 
     :param depth: The depth data.
-    :return: The distance data
+    :param dtype: The float dtype of the distance data, np.float32 halves the memory and time of the conversion.
+    :param in_place: If True, the depth data is overwritten with the distance data, whenever it already has the
+                     requested dtype. This avoids any allocation, e.g. for a whole (N, H, W) stack.
+    :return: The distance data, a list of images for a list or a stack of images.
     """
-
-    depth = trim_redundant_channels(depth)
-
-    if isinstance(depth, list) or hasattr(depth, "shape") and len(depth.shape) > 2:
-        return [depth2dist(img) for img in depth]
-
-    K = CameraUtility.get_intrinsics_as_K_matrix()
-    f, cx, cy = K[0, 0], K[0, 2], K[1, 2]
-
-    xs, ys = np.meshgrid(np.arange(depth.shape[1]), np.arange(depth.shape[0]))
-
-    # coordinate distances to principal point
-    x_opt = np.abs(xs - cx)
-    y_opt = np.abs(ys - cy)
-
-    # Solve 3 equations in Wolfram Alpha:
-    # Solve[{X == (x-c0)/f0*Z, Y == (y-c1)/f0*Z, X*X + Y*Y + Z*Z = d*d}, {X,Y,Z}]
-    dist = depth * np.sqrt(x_opt ** 2 + y_opt ** 2 + f ** 2) / f
-
-    return dist
+    return _PostProcessingUtility.convert_with_ray_lengths(depth, False, dtype, in_place)
 
 
 def remove_segmap_noise(image: Union[list, np.ndarray]) -> Union[list, np.ndarray]:
@@ -78,93 +54,73 @@ def remove_segmap_noise(image: Union[list, np.ndarray]) -> Union[list, np.ndarra
 
     Assumes that noise pixel values won't occur more than 100 times.
 
-    :param image: ndarray of the .exr segmap
+    All noisy pixels of all given frames are processed together with array operations. The result is the same as
+    replacing the noisy pixels one after another in row-major order.
+
+    :param image: ndarray of the .exr segmap or a list of them. The images are changed in place.
     :return: The denoised segmap image
     """
+    frames = _PostProcessingUtility.collect_frames(image)
+    if frames:
+        if all(frame.shape == frames[0].shape and frame.dtype == frames[0].dtype for frame in frames):
+            stacked_frames = np.stack(frames)
+            _PostProcessingUtility.remove_noise_from_frames(stacked_frames)
+            for frame, denoised_frame in zip(frames, stacked_frames):
+                frame[...] = denoised_frame
+        else:
+            for frame in frames:
+                _PostProcessingUtility.remove_noise_from_frames(frame[np.newaxis])
 
-    if isinstance(image, list) or hasattr(image, "shape") and len(image.shape) > 3:
-        return [remove_segmap_noise(img) for img in image]
-
-    noise_indices = _PostProcessingUtility.determine_noisy_pixels(image)
-
-    for index in noise_indices:
-        neighbors = _PostProcessingUtility.get_pixel_neighbors(image, index[0], index[
-            1])  # Extracting the indices surrounding 3x3 neighbors
-        curr_val = image[index[0]][index[1]][0]  # Current value of the noisy pixel
-
-        neighbor_vals = [image[neighbor[0]][neighbor[1]] for neighbor in
-                         neighbors]  # Getting the values of the neighbors
-        # Getting the unique values only
-        neighbor_vals = np.unique(np.array([np.array(index) for index in neighbor_vals]))
-
-        min_val = 10000000000
-        min_idx = 0
-
-        # Here we iterate through the unique values of the neighbor and find the one closest to the current noisy value
-        for idx, n in enumerate(neighbor_vals):
-            # Is this closer than the current closest value?
-            if n - curr_val <= min_val:
-                # If so, update
-                min_val = n - curr_val
-                min_idx = idx
-
-        # Now that we have found the closest value, assign it to the noisy value
-        new_val = neighbor_vals[min_idx]
-        image[index[0]][index[1]] = np.array([new_val, new_val, new_val])
-
-    return image
+    return _PostProcessingUtility.split_frames_like(image)
 
 
 def oil_paint_filter(image: Union[list, np.ndarray], filter_size: int = 5, edges_only: bool = True,
-                     rgb: bool = False) -> Union[list, np.ndarray]:
+                     rgb: bool = False, num_workers: int = 1) -> Union[list, np.ndarray]:
     """ Applies the oil paint filter on a single channel image (or more than one channel, where each channel is a
         replica of the other). This could be desired for corrupting rendered depth maps to appear more realistic.
         Also trims the redundant channels if they exist.
 
+        The neighborhoods are read via strided views into one padded copy of the image and processed in bands of
+        rows, so the memory does not grow with filter_size². If edges_only is set, only the edge pixels are filtered.
+
         :param image: Input image or list of images
         :param filter_size: Filter size, should be an odd number.
         :param edges_only: If true, applies the filter on the edges only.
         :param rgb: Apply the filter on an RGB image (if the image has 3 channels, they're assumed to not be \
                     replicated).
+        :param num_workers: The number of threads, which filter the images of a list of images in parallel.
         :return: filtered image
     """
 
     if rgb:
         if isinstance(image, list) or hasattr(image, "shape") and len(image.shape) > 3:
-            return [oil_paint_filter(img, filter_size, edges_only, rgb) for img in image]
+            return _PostProcessingUtility.map_images(
+                lambda img: oil_paint_filter(img, filter_size, edges_only, rgb), image, num_workers)
 
         intensity_img = (np.sum(image, axis=2) / 3.0)
 
-        neighbors = np.array(
-            _PostProcessingUtility.get_pixel_neighbors_stacked(image, filter_size, return_list=True))
-        neighbors_intensity = _PostProcessingUtility.get_pixel_neighbors_stacked(intensity_img, filter_size)
-
-        mode_intensity = stats.mode(neighbors_intensity, axis=2)[0].reshape(image.shape[0], image.shape[1])
-
-        # keys here would match all instances of the mode value
-        mode_keys = np.argwhere(neighbors_intensity == np.expand_dims(mode_intensity, axis=3))
-        # Remove the duplicate keys, since they point to the same value, and to be able to use them for indexing
-        _, unique_indices = np.unique(mode_keys[:, 0:2], axis=0, return_index=True)
-        unique_keys = mode_keys[unique_indices]
-
-        filtered_img = neighbors[unique_keys[:, 2], unique_keys[:, 0], unique_keys[:, 1], :] \
-            .reshape(image.shape[0], image.shape[1], image.shape[2])
-
         if edges_only:
             edges = cv2.Canny(image, 0, np.max(image))  # Assuming "image" is an uint8 array.
-            image[edges > 0] = filtered_img[edges > 0]
+            rows, cols = np.nonzero(edges > 0)
+            _, neighbor_rows, neighbor_cols = _PostProcessingUtility.neighborhood_modes(intensity_img, filter_size,
+                                                                                        rows, cols)
+            # Pick the color of the first neighbor, which has the mode intensity
+            padded_image = _PostProcessingUtility.pad_for_neighborhood(image, filter_size)
+            image[rows, cols] = padded_image[neighbor_rows, neighbor_cols]
             filtered_img = image
+        else:
+            _, neighbor_rows, neighbor_cols = _PostProcessingUtility.neighborhood_modes(intensity_img, filter_size)
+            padded_image = _PostProcessingUtility.pad_for_neighborhood(image, filter_size)
+            filtered_img = padded_image[neighbor_rows, neighbor_cols].reshape(image.shape)
     else:
         image = trim_redundant_channels(image)
         if isinstance(image, list) or hasattr(image, "shape") and len(image.shape) > 2:
-            return [oil_paint_filter(img, filter_size, edges_only, rgb) for img in image]
+            return _PostProcessingUtility.map_images(
+                lambda img: oil_paint_filter(img, filter_size, edges_only, rgb), image, num_workers)
 
         if len(image.shape) == 3 and image.shape[2] > 1:
             image = image[:, :, 0]
 
-        filtered_img = stats.mode(_PostProcessingUtility.get_pixel_neighbors_stacked(image, filter_size), axis=2)[0]
-        filtered_img = filtered_img.reshape(filtered_img.shape[0], filtered_img.shape[1])
-
         if edges_only:
             # Handle inf and map input to the range: 0-255
             _image = np.copy(image)
@@ -175,13 +131,18 @@ def oil_paint_filter(image: Union[list, np.ndarray], filter_size: int = 5, edges
             __img = np.uint8(_image)
             edges = cv2.Canny(__img, 0, np.max(__img))
 
-            image[edges > 0] = filtered_img[edges > 0]
+            rows, cols = np.nonzero(edges > 0)
+            image[rows, cols] = _PostProcessingUtility.neighborhood_modes(image, filter_size, rows, cols)[0]
             filtered_img = image
+        else:
+            filtered_img = _PostProcessingUtility.neighborhood_modes(image, filter_size)[0].reshape(image.shape)
 
     return filtered_img
 
+
 def add_kinect_azure_noise(depth: Union[list, np.ndarray], color: Optional[Union[list, np.ndarray]] = None,
-                           missing_depth_darkness_thres: int = 15) -> Union[list, np.ndarray]:
+                           missing_depth_darkness_thres: int = 15, is_distance: bool = False) \
+        -> Union[list, np.ndarray]:
     """
     Add noise, holes and smooth depth maps according to the noise characteristics of the Kinect Azure sensor.
     https://www.mdpi.com/1424-8220/21/2/413
@@ -192,9 +153,14 @@ def add_kinect_azure_noise(depth: Union[list, np.ndarray], color: Optional[Union
     :param depth: Input depth image(s) in meters
     :param color: Optional color image(s) to add missing depth at close to black surfaces
     :param missing_depth_darkness_thres: uint8 gray value threshold at which depth becomes invalid, i.e. 0
+    :param is_distance: If True, the input are distance images, which are converted to depth with the cached
+                        ray length factors of the current camera before the noise is added.
     :return: Noisy depth image(s)
     """
 
+    if is_distance:
+        depth = dist2depth(depth)
+
     if isinstance(depth, list) or hasattr(depth, "shape") and len(depth.shape) > 2:
         if color is None:
             color = len(depth) * [None]
@@ -329,7 +295,7 @@ def segmentation_mapping(image: Union[List[np.ndarray], np.ndarray],
         for stereo_image in frame_image:
 
             # map object ids in the image to the used objects
-            object_ids = np.unique(stereo_image).astype(int)
+            object_ids = _PostProcessingUtility.unique_ids(stereo_image)
             object_ids_to_object = {}
             for obj in get_all_blender_mesh_objects():
                 if obj.pass_index in object_ids:
@@ -338,8 +304,8 @@ def segmentation_mapping(image: Union[List[np.ndarray], np.ndarray],
 
             for map_by_attribute in map_by:
 
-                # create result map
-                resulting_map = np.zeros((stereo_image.shape[0], stereo_image.shape[1]), dtype=np.float64)
+                # maps each object id to the value it gets in the result map
+                object_id_values: Dict[int, Any] = {}
 
                 # save the type of the stored variable in the resulting map
                 found_dtype = None
@@ -395,7 +361,7 @@ def segmentation_mapping(image: Union[List[np.ndarray], np.ndarray],
 
                         # save everything which is not instance also in the .csv
                         if isinstance(value, (int, float, np.integer, np.floating)):
-                            resulting_map[stereo_image == object_id] = value
+                            object_id_values[object_id] = value
                             found_dtype = type(value)
 
                         if isinstance(value, (mathutils.Vector, mathutils.Matrix)):
@@ -408,7 +374,12 @@ def segmentation_mapping(image: Union[List[np.ndarray], np.ndarray],
 
                     # if a value was found the resulting map should be stored
                     if found_dtype is not None:
-                        resulting_map = resulting_map.astype(found_dtype)
+                        # the values are converted via float64, as all of them are collected in one map
+                        object_id_values = {object_id: np.float64(value)
+                                            for object_id, value in object_id_values.items()}
+                        # map all pixels to their values in one lookup
+                        resulting_map = _PostProcessingUtility.map_ids_to_values(stereo_image, object_id_values,
+                                                                                 object_ids[-1] + 1, found_dtype)
                         mapped_results_stereo_dict.setdefault(f"{map_by_attribute}_segmaps", []).append(resulting_map)
                     elif "instance" not in map_by:
                         raise ValueError(f"The map_by key \"{map_by_attribute}\" requires that the instance map is "
@@ -438,6 +409,101 @@ def segmentation_mapping(image: Union[List[np.ndarray], np.ndarray],
 
 class _PostProcessingUtility:
 
+    # The per pixel ray lengths sqrt(x² + y² + f²) in pixels, keyed by intrinsics, resolution and dtype
+    ray_lengths: Dict[Tuple[float, float, float, int, int, str], np.ndarray] = {}
+    # The number of cached ray length images, older entries are dropped first
+    max_cached_ray_lengths = 8
+
+    @staticmethod
+    def get_ray_lengths(height: int, width: int, K: Optional[np.ndarray] = None,
+                        dtype: type = np.float64) -> Tuple[np.ndarray, float]:
+        """ Returns the length of the ray through every pixel up to the image plane at distance f.
+
+        The ratio between distance and depth of a pixel is its ray length divided by f, which only depends on the
+        intrinsics.
+
+        :param height: The height of the image.
+        :param width: The width of the image.
+        :param K: The 3x3 intrinsic matrix, if None the one of the current camera is used.
+        :param dtype: The float dtype of the ray lengths.
+        :return: The read-only ray lengths of shape (height, width) and the focal length f.
+        """
+        if K is None:
+            K = CameraUtility.get_intrinsics_as_K_matrix()
+        f, cx, cy = float(K[0, 0]), float(K[0, 2]), float(K[1, 2])
+        key = (f, cx, cy, height, width, np.dtype(dtype).str)
+        ray_lengths = _PostProcessingUtility.ray_lengths.get(key)
+        if ray_lengths is None:
+            # coordinate distances to principal point
+            x_opt = np.arange(width) - cx
+            y_opt = np.arange(height) - cy
+            # Solve 3 equations in Wolfram Alpha:
+            # Solve[{X == (x-c0)/f0*Z, Y == (y-c1)/f0*Z, X*X + Y*Y + Z*Z = d*d}, {X,Y,Z}]
+            ray_lengths = np.sqrt(x_opt[np.newaxis, :] ** 2 + y_opt[:, np.newaxis] ** 2 + f ** 2).astype(dtype)
+            ray_lengths.setflags(write=False)
+            cache = _PostProcessingUtility.ray_lengths
+            while len(cache) >= _PostProcessingUtility.max_cached_ray_lengths:
+                del cache[next(iter(cache))]
+            cache[key] = ray_lengths
+        return ray_lengths, f
+
+    @staticmethod
+    def convert_with_ray_lengths(image: Union[List[np.ndarray], np.ndarray], to_depth: bool, dtype: type,
+                                 in_place: bool) -> Union[List[np.ndarray], np.ndarray]:
+        """ Converts between distance and depth with the cached ray lengths.
+
+        :param image: An image, a list of images or a stack of images with shape (N, H, W).
+        :param to_depth: If True, distance is converted to depth, otherwise depth to distance.
+        :param dtype: The float dtype of the result.
+        :param in_place: Whether to write the result into the given arrays if they already have the dtype.
+        :return: The converted data, a list of images for a list or a stack and an array for a single image.
+        """
+        image = trim_redundant_channels(image)
+
+        if isinstance(image, list):
+            return [_PostProcessingUtility.convert_with_ray_lengths(img, to_depth, dtype, in_place) for img in image]
+
+        ray_lengths, f = _PostProcessingUtility.get_ray_lengths(image.shape[-2], image.shape[-1], dtype=dtype)
+        result = image if in_place and image.dtype == np.dtype(dtype) else image.astype(dtype)
+        # The ray lengths are broadcast over all frames of a stack, so a stack is converted at once. The order of
+        # the operations is the same as in dist * f / ray_length and depth * ray_length / f.
+        if to_depth:
+            np.multiply(result, f, out=result)
+            np.divide(result, ray_lengths, out=result)
+        else:
+            np.multiply(result, ray_lengths, out=result)
+            np.divide(result, f, out=result)
+        if result.ndim > 2:
+            return list(result)
+        return result
+
+    @staticmethod
+    def unique_ids(id_map: np.ndarray) -> np.ndarray:
+        """ Returns the sorted ids which occur in the given map of non-negative integer ids.
+
+        This gives the same result as np.unique(), but counts the ids instead of sorting all pixels.
+
+        :param id_map: An array of non-negative integer ids, e.g. an instance segmentation map.
+        :return: The sorted occurring ids.
+        """
+        return np.flatnonzero(np.bincount(id_map.ravel()))
+
+    @staticmethod
+    def map_ids_to_values(id_map: np.ndarray, id_values: Dict[int, Any], num_ids: int,
+                          dtype: np.dtype) -> np.ndarray:
+        """ Maps every id in the given id map to its value, using one lookup table for the whole map.
+
+        :param id_map: An array of non-negative integer ids, all smaller than num_ids.
+        :param id_values: The value per id, ids without a value are mapped to zero.
+        :param num_ids: The number of possible ids.
+        :param dtype: The dtype of the resulting map.
+        :return: An array with the shape of id_map containing the values.
+        """
+        lookup_table = np.zeros(num_ids, dtype=dtype)
+        for object_id, value in id_values.items():
+            lookup_table[object_id] = value
+        return lookup_table[id_map]
+
     @staticmethod
     def get_pixel_neighbors(data: np.ndarray, i: int, j: int) -> np.ndarray:
         """ Returns the valid neighbor pixel indices of the given pixel.
@@ -468,28 +534,125 @@ def get_pixel_neighbors_stacked(img: np.ndarray, filter_size: int = 3,
                             images along with the input image.
         :return: Either a tensor with the "neighbor" images stacked in a separate additional dimension, or a list of \
                  images of the same shape as the input image, containing the shifted images (simulating the neighbors) \
-                 and the input image.
+                 and the input image. The shifted images of the list are views into one zero padded copy of img.
+        """
+        rows, cols = img.shape[0], img.shape[1]
+        padded = _PostProcessingUtility.pad_for_neighborhood(img, filter_size)
+        offsets = _PostProcessingUtility.neighborhood_offsets(filter_size)
+        channels = [img] + [padded[row_offset:row_offset + rows, col_offset:col_offset + cols]
+                            for row_offset, col_offset in offsets[1:]]
+
+        if return_list:
+            return channels
+        return np.dstack(tuple(channels))
+
+    @staticmethod
+    def neighborhood_offsets(filter_size: int) -> np.ndarray:
+        """ Returns the offsets of the neighbors inside an image padded by pad_for_neighborhood().
+
+        The order is the one of get_pixel_neighbors_stacked(): first the pixel itself, then the image shifted by
+        p rows and q cols, with p and q in range(-int(filter_size / 2), -int(filter_size / 2) + filter_size).
+
+        :param filter_size: The filter size.
+        :return: The [filter_size², 2] row and col offsets.
         """
         _min = -int(filter_size / 2)
         _max = _min + filter_size
+        # A pixel in the image shifted by (p, q) has the value of the pixel at (-p, -q) relative to it
+        offsets = [(_max - 1, _max - 1)]
+        offsets += [(_max - 1 - p, _max - 1 - q) for p in range(_min, _max) for q in range(_min, _max)
+                    if not (p == 0 and q == 0)]
+        return np.array(offsets)
 
-        rows, cols = img.shape[0], img.shape[1]
+    @staticmethod
+    def pad_for_neighborhood(img: np.ndarray, filter_size: int) -> np.ndarray:
+        """ Pads the image with zeros, so every neighborhood of the given filter size lies inside.
 
-        channels = [img]
-        for p in range(_min, _max):
-            for q in range(_min, _max):
-                if p == 0 and q == 0:
-                    continue
-                shifted = np.zeros_like(img)
-                shifted[max(p, 0):min(rows, rows + p), max(q, 0):min(cols, cols + q)] = img[
-                                                                                        max(-p, 0):min(rows - p, rows),
-                                                                                        max(-q, 0):min(cols - q, cols)]
+        :param img: The image with two or three dimensions.
+        :param filter_size: The filter size.
+        :return: The padded image.
+        """
+        _min = -int(filter_size / 2)
+        _max = _min + filter_size
+        padding = [(_max - 1, -_min), (_max - 1, -_min)] + [(0, 0)] * (len(img.shape) - 2)
+        return np.pad(img, padding)
 
-                channels.append(shifted)
+    @staticmethod
+    def neighborhood_modes(img: np.ndarray, filter_size: int, rows: Optional[np.ndarray] = None,
+                           cols: Optional[np.ndarray] = None,
+                           max_chunk_elements: int = 1 << 20) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Computes the most common value in the neighborhood of the given pixels of a single channel image.
+
+        This gives the same result as stats.mode() on get_pixel_neighbors_stacked(): if multiple values are equally
+        common, the smallest one is used. The neighborhoods are strided views into a padded copy of the image, which
+        are only copied in chunks of at most max_chunk_elements values.
+
+        :param img: The image with two dimensions.
+        :param filter_size: The filter size.
+        :param rows: The rows of the pixels. If None, all pixels in row-major order are used.
+        :param cols: The cols of the pixels. If None, all pixels in row-major order are used.
+        :param max_chunk_elements: The maximum number of neighbor values copied at once.
+        :return: The modes and the row and col inside the padded image of the first neighbor (in the order of
+                 get_pixel_neighbors_stacked()) with the mode value.
+        """
+        height, width = img.shape
+        offsets = _PostProcessingUtility.neighborhood_offsets(filter_size)
+        # [height, width, filter_size, filter_size] view without copying the image
+        windows = np.lib.stride_tricks.sliding_window_view(
+            _PostProcessingUtility.pad_for_neighborhood(img, filter_size), (filter_size, filter_size))
+        window_indices = offsets[:, 0] * filter_size + offsets[:, 1]
+
+        num_pixels = height * width if rows is None else len(rows)
+        modes = np.empty(num_pixels, dtype=img.dtype)
+        neighbor_rows = np.empty(num_pixels, dtype=np.int64)
+        neighbor_cols = np.empty(num_pixels, dtype=np.int64)
+        chunk_size = max(width, max_chunk_elements // len(offsets))
+        if rows is None:
+            # Process bands of full rows
+            chunk_size = max(1, chunk_size // width) * width
+        for start in range(0, num_pixels, chunk_size):
+            end = min(start + chunk_size, num_pixels)
+            if rows is None:
+                chunk_rows, chunk_cols = np.divmod(np.arange(start, end), width)
+                neighbors = windows[start // width:end // width].reshape(end - start, -1)
+            else:
+                chunk_rows, chunk_cols = rows[start:end], cols[start:end]
+                neighbors = windows[chunk_rows, chunk_cols].reshape(end - start, -1)
+            # Bring the neighbors into the order of get_pixel_neighbors_stacked()
+            neighbors = neighbors[:, window_indices]
+
+            sorted_neighbors = np.sort(neighbors, axis=1)
+            is_run_start = np.ones(sorted_neighbors.shape, dtype=bool)
+            is_run_start[:, 1:] = sorted_neighbors[:, 1:] != sorted_neighbors[:, :-1]
+            positions = np.arange(len(offsets), dtype=np.int32)
+            run_starts = np.maximum.accumulate(np.where(is_run_start, positions, np.int32(0)), axis=1)
+            # The run lengths are largest at the end of each run, the first maximum belongs to the smallest value
+            mode_positions = np.argmax(positions - run_starts, axis=1)
+            chunk_modes = sorted_neighbors[np.arange(end - start), mode_positions]
+
+            first_mode_neighbor = np.argmax(neighbors == chunk_modes[:, np.newaxis], axis=1)
+            modes[start:end] = chunk_modes
+            neighbor_rows[start:end] = chunk_rows + offsets[first_mode_neighbor, 0]
+            neighbor_cols[start:end] = chunk_cols + offsets[first_mode_neighbor, 1]
+
+        return modes, neighbor_rows, neighbor_cols
 
-        if return_list:
-            return channels
-        return np.dstack(tuple(channels))
+    @staticmethod
+    def map_images(function: Callable[[np.ndarray], np.ndarray], images: Union[list, np.ndarray],
+                   num_workers: int = 1) -> list:
+        """ Applies the function on every image of the given list, optionally in a thread pool.
+
+        Numpy releases the GIL in most operations, so threads can filter multiple images in parallel.
+
+        :param function: The function to apply.
+        :param images: The list of images.
+        :param num_workers: The number of threads. If 1, the images are processed one after another.
+        :return: The list of results.
+        """
+        if num_workers > 1 and len(images) > 1:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                return list(executor.map(function, images))
+        return [function(img) for img in images]
 
     @staticmethod
     def is_in(element, test_elements, assume_unique=False, invert=False):
@@ -497,6 +660,107 @@ def is_in(element, test_elements, assume_unique=False, invert=False):
         element = np.asarray(element)
         return np.in1d(element, test_elements, assume_unique=assume_unique, invert=invert).reshape(element.shape)
 
+    @staticmethod
+    def collect_frames(image: Union[list, np.ndarray]) -> List[np.ndarray]:
+        """ Collects all single images inside the given image, list of images or nested lists of images.
+
+        :param image: An image with three dimensions, a stack of them or a (nested) list.
+        :return: The list of all images with three dimensions, as views into the given data.
+        """
+        if isinstance(image, list) or hasattr(image, "shape") and len(image.shape) > 3:
+            return [frame for img in image for frame in _PostProcessingUtility.collect_frames(img)]
+        return [image]
+
+    @staticmethod
+    def split_frames_like(image: Union[list, np.ndarray]) -> Union[list, np.ndarray]:
+        """ Returns the given data in the nested list structure, remove_segmap_noise() has always returned.
+
+        :param image: An image with three dimensions, a stack of them or a (nested) list.
+        :return: The image itself or a (nested) list of images.
+        """
+        if isinstance(image, list) or hasattr(image, "shape") and len(image.shape) > 3:
+            return [_PostProcessingUtility.split_frames_like(img) for img in image]
+        return image
+
+    @staticmethod
+    def remove_noise_from_frames(frames: np.ndarray):
+        """ Replaces the noisy pixels of a stack of segmaps in place, see remove_segmap_noise().
+
+        Every noisy pixel gets the numerically smallest (with the wrap around of unsigned types) distance to its
+        first channel, among all channel values of its 3x3 neighbors. As in the sequential version, a pixel sees the
+        already replaced values of the noisy pixels before it in row-major order. Pixels without such a neighbor
+        are replaced all at once, the remaining ones in waves of pixels with the same 2 * row + col, which only
+        depend on previous waves.
+
+        :param frames: The segmaps in the shape [frames, height, width, channels].
+        """
+        height, width = frames.shape[1:3]
+        noisy_channels = _PostProcessingUtility.determine_noisy_channels(frames)
+        # Only work on the frames which contain noise
+        noisy_frames = np.flatnonzero(noisy_channels.any(axis=(1, 2, 3)))
+        if len(noisy_frames) == 0:
+            return
+        # A pixel is replaced once per noisy channel
+        noise_counts = noisy_channels[noisy_frames].sum(axis=-1)
+        noisy_pixels = noise_counts > 0
+
+        padded = np.pad(frames[noisy_frames], ((0, 0), (1, 1), (1, 1), (0, 0)), mode="edge")
+        padded_noisy = np.pad(noisy_pixels, ((0, 0), (1, 1), (1, 1)))
+        inside_image = np.pad(np.ones((height, width), dtype=bool), 1)
+        # Views of the 3x3 neighborhood of every pixel: [frames, height, width, channels, 3, 3], [height, width, 3, 3]
+        windows = np.lib.stride_tricks.sliding_window_view(padded, (3, 3), axis=(1, 2))
+        valid_neighbors = np.lib.stride_tricks.sliding_window_view(inside_image, (3, 3)).copy()
+        valid_neighbors[:, :, 1, 1] = False
+
+        frame_ids, rows, cols = np.nonzero(noisy_pixels)
+        # The neighbors before a pixel in row-major order: the three above and the one to the left
+        has_noisy_predecessor = padded_noisy[frame_ids, rows, cols] | padded_noisy[frame_ids, rows, cols + 1] | \
+            padded_noisy[frame_ids, rows, cols + 2] | padded_noisy[frame_ids, rows + 1, cols]
+        waves = np.where(has_noisy_predecessor, 2 * rows + cols + 1, 0)
+        order = np.argsort(waves, kind="stable")
+        frame_ids, rows, cols, waves = frame_ids[order], rows[order], cols[order], waves[order]
+        wave_starts = np.concatenate([[0], np.flatnonzero(np.diff(waves)) + 1, [len(waves)]])
+
+        is_float = np.issubdtype(frames.dtype, np.floating)
+        largest = np.inf if is_float else np.iinfo(frames.dtype).max
+        smallest = -np.inf if is_float else np.iinfo(frames.dtype).min
+        for start, end in zip(wave_starts[:-1], wave_starts[1:]):
+            f, r, c = frame_ids[start:end], rows[start:end], cols[start:end]
+            candidates = windows[f, r, c].reshape(end - start, -1)
+            valid = np.repeat(valid_neighbors[r, c][:, np.newaxis], frames.shape[3], axis=1).reshape(end - start, -1)
+            for repetition in range(int(noise_counts[f, r, c].max())):
+                repeated = noise_counts[f, r, c] > repetition
+                current_value = padded[f, r + 1, c + 1, 0][repeated]
+                distances = candidates[repeated] - current_value[:, np.newaxis]
+                min_distances = np.where(valid[repeated], distances, largest).min(axis=1, keepdims=True)
+                # Out of the values with the smallest distance, the sequential version kept the largest one
+                closest = valid[repeated] & (distances == min_distances)
+                new_values = np.where(closest, candidates[repeated], smallest).max(axis=1).astype(frames.dtype)
+                padded[f[repeated], r[repeated] + 1, c[repeated] + 1] = new_values[:, np.newaxis]
+
+        frames[noisy_frames] = padded[:, 1:-1, 1:-1]
+
+    @staticmethod
+    def determine_noisy_channels(frames: np.ndarray) -> np.ndarray:
+        """ Determines the noisy values of a stack of segmaps, separately per frame, see determine_noisy_pixels().
+
+        :param frames: The segmaps in the shape [frames, height, width, channels].
+        :return: A boolean mask of the shape of frames, which is True for every noisy value.
+        """
+        scaled_frames = ((frames * 37) / (65536)).astype(np.int32)  # assuming 16 bit color depth
+        # Combine frame and value into one key, so the histogram of all frames is computed at once
+        min_value = int(scaled_frames.min())
+        value_range = int(scaled_frames.max()) - min_value + 1
+        key_type = np.int32 if len(frames) * value_range < 1 << 31 else np.int64
+        keys = scaled_frames.astype(key_type, copy=False) - key_type(min_value)
+        keys += np.arange(len(frames), dtype=key_type).reshape(-1, 1, 1, 1) * key_type(value_range)
+        # Assuming the stray pixels wouldn't have a count of more than 100
+        if len(frames) * value_range <= 1 << 24:
+            # Counting is much faster than sorting for the usual small range of values
+            return np.take(np.bincount(keys.ravel(), minlength=len(frames) * value_range) <= 100, keys)
+        unique_keys, counts = np.unique(keys, return_counts=True)
+        return _PostProcessingUtility.is_in(keys, unique_keys[counts <= 100])
+
     @staticmethod
     def determine_noisy_pixels(image: np.ndarray) -> np.ndarray:
         """
@@ -0,0 +1,215 @@
+"""Indexed reading of large coco annotation files, without parsing the whole file for every image."""
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def rle_to_binary_mask(rle: Dict[str, List[int]]) -> np.ndarray:
+    """Converts a COCOs run-length encoding (RLE) to binary mask.
+    :param rle: Mask in RLE format
+    :return: a 2D binary numpy array where '1's represent the object
+    """
+    binary_array = np.zeros(np.prod(rle.get('size')), dtype=bool)
+    counts = np.asarray(rle.get('counts'), dtype=np.int64)
+
+    # The runs alternate between zeros and ones, starting with zeros, trailing zeros may be omitted
+    runs = np.repeat(np.arange(len(counts)) % 2 == 1, counts)[:len(binary_array)]
+    binary_array[:len(runs)] = runs
+
+    binary_mask = binary_array.reshape(*rle.get('size'), order='F')
+
+    return binary_mask
+
+
+class CocoAnnotationIndex:
+    """ Gives access to the images, categories and the annotations of single images of a coco annotation file.
+
+    The file is parsed once to build an index, which contains the images, the categories and for every image the
+    byte ranges of its annotations inside the file. The index is stored in a sidecar file next to the annotation
+    file, so later uses only read the annotations of the requested images from the annotation file.
+
+    Usage:
+
+    .. code-block:: python
+
+        index = CocoAnnotationIndex("output/coco_data/coco_annotations.json")
+        for annotation in index.annotations_of_image(index.images[5]["id"]):
+            print(index.category_name(annotation["category_id"]), annotation["bbox"])
+    """
+
+    index_file_suffix = ".index.json"
+    index_version = 1
+
+    def __init__(self, annotation_file_path: str, cache_index: bool = True):
+        """
+        :param annotation_file_path: The path of the coco annotation json file.
+        :param cache_index: If this is True, the index is stored in and loaded from a sidecar file.
+        """
+        self.annotation_file_path = annotation_file_path
+        index = None
+        if cache_index:
+            index = _CocoAnnotationReaderUtility.load_index(annotation_file_path)
+        if index is None:
+            index = _CocoAnnotationReaderUtility.build_index(annotation_file_path)
+            if cache_index:
+                _CocoAnnotationReaderUtility.save_index(annotation_file_path, index)
+
+        self.images: List[Dict[str, Any]] = index["images"]
+        self.categories: Dict[int, str] = {int(category_id): name for category_id, name in index["categories"]}
+        # Maps each image id to the byte ranges of its annotations
+        self._annotation_ranges: Dict[int, List[Tuple[int, int]]] = {
+            int(image_id): [tuple(byte_range) for byte_range in byte_ranges]
+            for image_id, byte_ranges in index["annotation_ranges"]
+        }
+
+    @property
+    def image_ids(self) -> List[int]:
+        """ Returns the ids of all images in the order of the annotation file.
+
+        :return: The list of image ids.
+        """
+        return [image["id"] for image in self.images]
+
+    def category_name(self, category_id: int) -> str:
+        """ Returns the name of the given category.
+
+        :param category_id: The id of the category.
+        :return: The name of the category.
+        """
+        if category_id not in self.categories:
+            raise RuntimeError(f"Category {category_id} is not defined in {self.annotation_file_path}")
+        return self.categories[category_id]
+
+    def annotations_of_image(self, image_id: int) -> List[Dict[str, Any]]:
+        """ Reads all annotations of the given image, only their part of the annotation file is read and parsed.
+
+        :param image_id: The id of the image.
+        :return: The list of annotations.
+        """
+        annotations = []
+        with open(self.annotation_file_path, "rb") as file:
+            for start, end in self._annotation_ranges.get(image_id, []):
+                file.seek(start)
+                # A range spans one or multiple consecutive annotations including the commas between them
+                annotations.extend(json.loads(b"[" + file.read(end - start) + b"]"))
+        return annotations
+
+
+class _CocoAnnotationReaderUtility:
+
+    # Matches the whitespace and separators json allows between two tokens
+    _skip_pattern = re.compile(r"[\s,:]*")
+
+    @staticmethod
+    def index_path(annotation_file_path: str) -> str:
+        """ Returns the path of the sidecar file of the index.
+
+        :param annotation_file_path: The path of the annotation file.
+        :return: The path of the index file.
+        """
+        return annotation_file_path + CocoAnnotationIndex.index_file_suffix
+
+    @staticmethod
+    def build_index(annotation_file_path: str) -> Dict[str, Any]:
+        """ Parses the annotation file once and collects the images, categories and the annotation byte ranges.
+
+        :param annotation_file_path: The path of the annotation file.
+        :return: The index.
+        """
+        with open(annotation_file_path, "rb") as file:
+            raw = file.read()
+        text = raw.decode("utf-8")
+        # Offsets into the text are character offsets, which only match the byte offsets for ascii files
+        is_ascii = len(text) == len(raw)
+        decoder = json.JSONDecoder()
+        skip = _CocoAnnotationReaderUtility._skip_pattern
+
+        images, categories = [], []
+        annotation_ranges: Dict[int, List[List[int]]] = {}
+        position = skip.match(text, 0).end()
+        if text[position] != "{":
+            raise RuntimeError(f"The coco annotation file {annotation_file_path} does not contain a json object")
+        position = skip.match(text, position + 1).end()
+        byte_position, char_position = 0, 0
+        while text[position] != "}":
+            key, position = decoder.raw_decode(text, position)
+            position = skip.match(text, position).end()
+            if key == "annotations":
+                # Record where each annotation starts and ends instead of keeping the parsed annotations
+                position = skip.match(text, position + 1).end()
+                last_image_id = None
+                while text[position] != "]":
+                    annotation, end = decoder.raw_decode(text, position)
+                    if is_ascii:
+                        start_byte, end_byte = position, end
+                    else:
+                        # Count the bytes since the last known position
+                        byte_position += len(text[char_position:position].encode("utf-8"))
+                        start_byte = byte_position
+                        byte_position += len(text[position:end].encode("utf-8"))
+                        end_byte, char_position = byte_position, end
+                    image_id = annotation["image_id"]
+                    byte_ranges = annotation_ranges.setdefault(image_id, [])
+                    if image_id == last_image_id:
+                        # Consecutive annotations of the same image are read together
+                        byte_ranges[-1][1] = end_byte
+                    else:
+                        byte_ranges.append([start_byte, end_byte])
+                    last_image_id = image_id
+                    position = skip.match(text, end).end()
+                position += 1
+            else:
+                value, position = decoder.raw_decode(text, position)
+                if key == "images":
+                    images = value
+                elif key == "categories":
+                    categories = [[category["id"], str(category["name"])] for category in value]
+            position = skip.match(text, position).end()
+
+        return {
+            "images": images,
+            "categories": categories,
+            "annotation_ranges": [[image_id, byte_ranges] for image_id, byte_ranges in annotation_ranges.items()]
+        }
+
+    @staticmethod
+    def load_index(annotation_file_path: str) -> Optional[Dict[str, Any]]:
+        """ Loads the index from the sidecar file, if it exists and the annotation file was not changed since.
+
+        :param annotation_file_path: The path of the annotation file.
+        :return: The index or None, if it has to be built again.
+        """
+        index_path = _CocoAnnotationReaderUtility.index_path(annotation_file_path)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, "r", encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(annotation_file_path)
+        if index.get("version") != CocoAnnotationIndex.index_version or index.get("size") != stat.st_size \
+                or index.get("mtime_ns") != stat.st_mtime_ns:
+            return None
+        return index
+
+    @staticmethod
+    def save_index(annotation_file_path: str, index: Dict[str, Any]):
+        """ Stores the index in the sidecar file next to the annotation file.
+
+        :param annotation_file_path: The path of the annotation file.
+        :param index: The index to store.
+        """
+        stat = os.stat(annotation_file_path)
+        index = dict(index, version=CocoAnnotationIndex.index_version, size=stat.st_size,
+                     mtime_ns=stat.st_mtime_ns)
+        try:
+            with open(_CocoAnnotationReaderUtility.index_path(annotation_file_path), "w", encoding="utf-8") as file:
+                json.dump(index, file)
+        except OSError:
+            # The folder might be read only, then the index is just not cached
+            pass
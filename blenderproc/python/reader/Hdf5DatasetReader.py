@@ -0,0 +1,375 @@
+"""Lazy, random access reading of the .hdf5 containers written by the hdf5 writers."""
+
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+
+
+class Hdf5Frame(Mapping):
+    """ A lazy view on the data of one frame, every key is only read from disk when it is accessed. """
+
+    def __init__(self, dataset: "Hdf5Dataset", frame_index: int):
+        """
+        :param dataset: The dataset the frame belongs to.
+        :param frame_index: The index of the frame inside the dataset.
+        """
+        self._dataset = dataset
+        self._frame_index = frame_index
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if key not in self.keys():
+            raise KeyError(key)
+        return self._dataset.read(self._frame_index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._dataset.frame_keys(self._frame_index))
+
+    def __contains__(self, key: object) -> bool:
+        # Checking for a key must not read its data
+        return key in self._dataset.frame_keys(self._frame_index)
+
+    def __len__(self) -> int:
+        return len(self._dataset.frame_keys(self._frame_index))
+
+    def keys(self):
+        return self._dataset.frame_keys(self._frame_index)
+
+    @property
+    def name(self) -> str:
+        """ Returns the name of the frame, which is used to name files created from this frame.
+
+        :return: The name of the frame.
+        """
+        return self._dataset.frame_name(self._frame_index)
+
+    @property
+    def file_label(self) -> str:
+        """ Returns the name of the file of the frame, followed by the row for consolidated containers.
+
+        :return: The label of the frame, e.g. "5.hdf5" or "container_0000.hdf5 [5]".
+        """
+        file_path, row = self._dataset.frame_source(self._frame_index)
+        return os.path.basename(file_path) + ("" if row is None else f" [{row}]")
+
+    def key_info(self, key: str) -> Tuple[Tuple[int, ...], np.dtype]:
+        """ Returns the shape and dtype of the data stored at the given key, without reading the data.
+
+        :param key: The key.
+        :return: The shape and dtype of the data.
+        """
+        return self._dataset.key_info(key, self._frame_index)
+
+
+class Hdf5Dataset:
+    """ A lazy, random access view over the frames stored in one or multiple folders or files of .hdf5 containers.
+
+    Both layouts written by the hdf5 writers are supported: one <index>.hdf5 file per frame and consolidated
+    container_<index>.hdf5 files, which store every key as one dataset with the frame as first dimension.
+
+    The keys, shapes and dtypes of all files are collected once into an index. For every folder this index is
+    also cached in a sidecar file, so opening the dataset again only has to look at new or changed files.
+    The data itself is only read when it is accessed, only the requested keys and slices are loaded.
+
+    Usage:
+
+    .. code-block:: python
+
+        dataset = Hdf5Dataset("output/hdf5")
+        print(len(dataset), dataset.key_info("colors"))
+        colors = dataset[5]["colors"]
+        crop = dataset.read(5, "colors", np.s_[100:200, 100:200])
+
+    As the file handles are reopened after a fork, a Hdf5Dataset can directly be wrapped by a PyTorch Dataset,
+    which is used with multiple DataLoader workers.
+    """
+
+    index_file_name = ".hdf5_index.json"
+    index_version = 1
+
+    def __init__(self, paths: Union[str, List[str]], keys: Optional[List[str]] = None, cache_index: bool = True,
+                 max_open_files: int = 16):
+        """
+        :param paths: A folder containing .hdf5 files, a single .hdf5 file or a list of both.
+        :param keys: If given, only these keys are returned by __getitem__ and when iterating over the frames.
+        :param cache_index: If this is True, the index of every folder is stored in and loaded from a sidecar file.
+        :param max_open_files: The maximum number of files, which are kept open between reads.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        self._selected_keys = keys
+        self._max_open_files = max_open_files
+        self._open_files: "OrderedDict[str, h5py.File]" = OrderedDict()
+        self._pid = os.getpid()
+
+        # Maps each file path to its index entry: num_frames, consolidated and the shape and dtype of each key
+        self._file_infos: Dict[str, Dict[str, Any]] = {}
+        for path in paths:
+            if os.path.isdir(path):
+                self._file_infos.update(_Hdf5DatasetReaderUtility.index_folder(path, cache_index))
+            elif os.path.isfile(path):
+                self._file_infos[path] = _Hdf5DatasetReaderUtility.index_file(path)
+            else:
+                raise FileNotFoundError(f"The hdf5 path does not exist: {path}")
+
+        # The file and the row inside of the file of every frame
+        self._frames: List[Tuple[str, int]] = [(file_path, row) for file_path, file_info in self._file_infos.items()
+                                               for row in range(file_info["num_frames"])]
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __getitem__(self, frame_index: int) -> Dict[str, np.ndarray]:
+        """ Reads all selected keys of the given frame.
+
+        :param frame_index: The index of the frame, negative indices count from the end.
+        :return: Maps each key to its data.
+        """
+        return {key: self.read(frame_index, key) for key in self.frame_keys(frame_index)}
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        for frame_index in range(len(self)):
+            yield self[frame_index]
+
+    def __enter__(self) -> "Hdf5Dataset":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Open file handles cannot be pickled, e.g. when the dataset is sent to spawned DataLoader workers
+        state = self.__dict__.copy()
+        state["_open_files"] = OrderedDict()
+        return state
+
+    @property
+    def file_paths(self) -> List[str]:
+        """ Returns the paths of all files in the order of their frames.
+
+        :return: The list of file paths.
+        """
+        return list(self._file_infos.keys())
+
+    @property
+    def keys(self) -> List[str]:
+        """ Returns all keys which are contained in at least one frame, restricted to the selected keys.
+
+        :return: The list of keys.
+        """
+        keys: Dict[str, None] = {}
+        for file_info in self._file_infos.values():
+            keys.update(dict.fromkeys(self._filter_keys(file_info["keys"])))
+        return list(keys)
+
+    def key_info(self, key: str, frame_index: Optional[int] = None) -> Tuple[Tuple[int, ...], np.dtype]:
+        """ Returns the shape and dtype of the data stored at the given key, without reading the data.
+
+        :param key: The key.
+        :param frame_index: The frame to look at. If None, the first file containing the key is used.
+        :return: The shape of the data of one frame and its dtype.
+        """
+        if frame_index is not None:
+            file_infos = [self._file_infos[self._frames[frame_index][0]]]
+        else:
+            file_infos = self._file_infos.values()
+        for file_info in file_infos:
+            if key in file_info["keys"]:
+                key_info = file_info["keys"][key]
+                return tuple(key_info["shape"]), np.dtype(key_info["dtype"])
+        raise KeyError(f"The key {key} is not contained in the dataset.")
+
+    def frame_keys(self, frame_index: int) -> List[str]:
+        """ Returns the selected keys, which are stored for the given frame.
+
+        :param frame_index: The index of the frame.
+        :return: The list of keys.
+        """
+        return self._filter_keys(self._file_infos[self._frames[frame_index][0]]["keys"])
+
+    def frame_source(self, frame_index: int) -> Tuple[str, Optional[int]]:
+        """ Returns where the given frame is stored.
+
+        :param frame_index: The index of the frame.
+        :return: The path of the file and the row inside of the file, the row is None for one file per frame.
+        """
+        file_path, row = self._frames[frame_index]
+        return file_path, row if self._file_infos[file_path]["consolidated"] else None
+
+    def frame_name(self, frame_index: int) -> str:
+        """ Returns a name of the frame, which is unique inside of its folder, e.g. "5" or "container_0000_5".
+
+        :param frame_index: The index of the frame.
+        :return: The name of the frame.
+        """
+        file_path, row = self.frame_source(frame_index)
+        name = str(os.path.basename(file_path)).split('.', maxsplit=1)[0]
+        return name if row is None else f"{name}_{row}"
+
+    def frame(self, frame_index: int) -> Hdf5Frame:
+        """ Returns a lazy view on the given frame, which only reads the keys that are accessed.
+
+        :param frame_index: The index of the frame.
+        :return: The lazy frame.
+        """
+        # Resolve negative indices and check the range right away
+        frame_index = range(len(self))[frame_index]
+        return Hdf5Frame(self, frame_index)
+
+    def read(self, frame_index: int, key: str, index: Optional[Union[int, slice, tuple]] = None) -> np.ndarray:
+        """ Reads the data of one key of one frame, optionally only a slice of it.
+
+        Only the requested slice is read from the file, e.g. index=np.s_[:, :, 0] only loads the first channel.
+        Strings, e.g. json serialized object states, are returned as bytes arrays in both container layouts.
+
+        :param frame_index: The index of the frame.
+        :param key: The key to read.
+        :param index: A numpy style index into the data of the frame.
+        :return: The data.
+        """
+        file_path, row = self._frames[frame_index]
+        dataset = self._get_file(file_path)[key]
+        if self._file_infos[file_path]["consolidated"]:
+            if index is None:
+                data = dataset[row]
+            else:
+                data = dataset[(row,) + (index if isinstance(index, tuple) else (index,))]
+            if isinstance(data, bytes):
+                data = np.array(data)
+        else:
+            data = dataset[()] if index is None else dataset[index]
+        return np.asarray(data)
+
+    def close(self):
+        """ Closes all open file handles. """
+        for file in self._open_files.values():
+            file.close()
+        self._open_files.clear()
+
+    def _filter_keys(self, keys: Dict[str, Any]) -> List[str]:
+        """ Restricts the given keys to the selected ones.
+
+        :param keys: The keys to filter.
+        :return: The selected keys in their original order.
+        """
+        if self._selected_keys is None:
+            return list(keys)
+        return [key for key in keys if key in self._selected_keys]
+
+    def _get_file(self, file_path: str) -> h5py.File:
+        """ Returns an open handle of the given file, at most max_open_files are kept open.
+
+        :param file_path: The path of the file.
+        :return: The open file.
+        """
+        if self._pid != os.getpid():
+            # hdf5 handles must not be shared with a forked process, so this process opens its own handles
+            self._open_files = OrderedDict()
+            self._pid = os.getpid()
+        file = self._open_files.get(file_path)
+        if file is None:
+            if len(self._open_files) >= self._max_open_files:
+                self._open_files.popitem(last=False)[1].close()
+            file = h5py.File(file_path, "r")
+            self._open_files[file_path] = file
+        else:
+            self._open_files.move_to_end(file_path)
+        return file
+
+
+class _Hdf5DatasetReaderUtility:
+
+    @staticmethod
+    def index_file(file_path: str) -> Dict[str, Any]:
+        """ Collects the number of frames and the shape and dtype of every key of the given file.
+
+        :param file_path: The path of the .hdf5 file.
+        :return: The index entry of the file.
+        """
+        with h5py.File(file_path, "r") as file:
+            # Only the consolidated containers of the Hdf5StreamWriter count their frames
+            consolidated = "num_frames" in file.attrs
+            keys = {}
+            for key, dataset in file.items():
+                if not isinstance(dataset, h5py.Dataset):
+                    continue
+                shape = dataset.shape[1:] if consolidated else dataset.shape
+                if h5py.check_string_dtype(dataset.dtype) is not None and dataset.dtype.char != 'S':
+                    # Variable length strings are returned as bytes arrays
+                    dtype = np.dtype("S").str
+                else:
+                    dtype = dataset.dtype.str
+                keys[key] = {"shape": list(shape), "dtype": dtype}
+            return {
+                "num_frames": int(file.attrs["num_frames"]) if consolidated else 1,
+                "consolidated": consolidated,
+                "keys": keys
+            }
+
+    @staticmethod
+    def sort_key(file_name: str) -> Tuple[int, int, str]:
+        """ Sorts one file per frame containers by their frame index, followed by the consolidated containers.
+
+        :param file_name: The name of the .hdf5 file.
+        :return: The key to sort by.
+        """
+        name = file_name[:-len(".hdf5")]
+        if name.isdigit():
+            return 0, int(name), ""
+        index = name.rsplit("_", maxsplit=1)[-1]
+        if index.isdigit():
+            return 1, int(index), name
+        return 2, 0, name
+
+    @staticmethod
+    def index_folder(folder_path: str, cache_index: bool) -> Dict[str, Dict[str, Any]]:
+        """ Returns the index entries of all .hdf5 files in the given folder in the order of their frames.
+
+        :param folder_path: The folder to index.
+        :param cache_index: Whether to reuse and update the index stored in the sidecar file of the folder.
+        :return: Maps each file path to its index entry.
+        """
+        index_path = os.path.join(folder_path, Hdf5Dataset.index_file_name)
+        cached_infos = {}
+        if cache_index and os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as file:
+                    cached_index = json.load(file)
+                if cached_index.get("version") == Hdf5Dataset.index_version:
+                    cached_infos = cached_index["files"]
+            except (OSError, ValueError, KeyError):
+                cached_infos = {}
+
+        file_infos = {}
+        changed = False
+        file_names = sorted((name for name in os.listdir(folder_path) if name.endswith(".hdf5")),
+                            key=_Hdf5DatasetReaderUtility.sort_key)
+        for file_name in file_names:
+            file_path = os.path.join(folder_path, file_name)
+            stat = os.stat(file_path)
+            file_info = cached_infos.get(file_name)
+            # Files, which are still appended to, change their size and modification time
+            if file_info is None or file_info["size"] != stat.st_size or file_info["mtime_ns"] != stat.st_mtime_ns:
+                try:
+                    file_info = _Hdf5DatasetReaderUtility.index_file(file_path)
+                except OSError as e:
+                    # E.g. a file, which is currently written by an async writer
+                    print(f"Warning: Skipping {file_path}, as it can not be read: {e}")
+                    continue
+                file_info.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+                changed = True
+            file_infos[file_name] = file_info
+        changed = changed or len(file_infos) != len(cached_infos)
+
+        if cache_index and changed:
+            try:
+                with open(index_path, "w", encoding="utf-8") as file:
+                    json.dump({"version": Hdf5Dataset.index_version, "files": file_infos}, file)
+            except OSError:
+                # The folder might be read only, then the index is just not cached
+                pass
+        return {os.path.join(folder_path, file_name): file_info for file_name, file_info in file_infos.items()}
@@ -0,0 +1,196 @@
+"""Provides functionality to take a render output directly from blender's compositor."""
+
+import os
+from types import TracebackType
+from typing import Optional, Set, Type
+
+import bpy
+import numpy as np
+
+from blenderproc.python.utility.Utility import Utility
+
+
+class _InMemoryOutput:
+    """ Copies one output of the next render directly from the compositor into a numpy array.
+
+    A viewer node is connected to the socket, which would otherwise be written to a file, and after rendering its
+    image is copied via foreach_get. If the output is the main render output, the frame is rendered as still image
+    without writing it, if it is written by a file output node, that node is muted while rendering.
+    """
+
+    def __init__(self, key: str, socket: bpy.types.NodeSocket, output_node: Optional[bpy.types.Node] = None,
+                 file_format: str = "OPEN_EXR", color_depth: str = "16"):
+        """
+        :param key: The output key.
+        :param socket: The socket of the compositor, whose image is the output.
+        :param output_node: The file output node writing the output, None for the main output.
+        :param file_format: The file format the output would have been written with.
+        :param color_depth: The color depth the output would have been written with.
+        """
+        self.key = key
+        self.pixels: Optional[np.ndarray] = None
+        self._socket = socket
+        self._output_node = output_node
+        # Only png files have to be converted, EXR files store the values of the compositor
+        self._png_color_depth = color_depth if file_format == "PNG" else None
+        self._viewer_node: Optional[bpy.types.Node] = None
+        self._previous_active_node: Optional[bpy.types.Node] = None
+
+    @staticmethod
+    def find(keys: Set[str], main_output_key: Optional[str]) -> Optional["_InMemoryOutput"]:
+        """ Determines the output, which can be captured in memory during the next render.
+
+        :param keys: The keys of the outputs, which should be captured in memory.
+        :param main_output_key: The key of the main render output.
+        :return: The output to capture or None, if all outputs have to be read from files.
+        """
+        if not keys:
+            return None
+        if bpy.context.scene.frame_end != bpy.context.scene.frame_start or bpy.context.scene.render.use_multiview:
+            # Only the last frame and the active view would be left in the viewer node
+            return None
+        scene = bpy.context.scene
+        in_memory_output = None
+        # Prefer the main output, as it does not have to be written at all
+        for key in sorted(keys, key=lambda output_key: (output_key != main_output_key, output_key)):
+            if key == main_output_key:
+                in_memory_output = _InMemoryOutput._find_main_output(key)
+            elif scene.use_nodes and Utility.find_registered_output_by_key(key) is not None:
+                in_memory_output = _InMemoryOutput._find_file_output(key)
+            if in_memory_output is not None:
+                break
+
+        if in_memory_output is not None and len(keys) > 1:
+            print(f"Warning: Only one output can be taken from the compositor per render call, the outputs "
+                  f"{', '.join(sorted(keys - {in_memory_output.key}))} are read from files.")
+        return in_memory_output
+
+    @staticmethod
+    def _find_main_output(key: str) -> Optional["_InMemoryOutput"]:
+        """ Connects to the socket of the compositor, which is used as main render output.
+
+        :param key: The key of the main render output.
+        :return: The output to capture or None, if it cannot be captured.
+        """
+        scene = bpy.context.scene
+        file_format = scene.render.image_settings.file_format
+        if not _InMemoryOutput._can_convert(key, file_format, scene.render.image_settings.color_depth):
+            return None
+        scene.render.use_compositing = True
+        scene.use_nodes = True
+        nodes = scene.node_tree.nodes
+        composite_nodes = Utility.get_nodes_with_type(nodes, 'CompositorNodeComposite')
+        if composite_nodes and composite_nodes[0].inputs['Image'].is_linked:
+            socket = composite_nodes[0].inputs['Image'].links[0].from_socket
+        else:
+            socket = Utility.get_the_one_node_with_type(nodes, 'CompositorNodeRLayers').outputs['Image']
+        return _InMemoryOutput(key, socket, file_format=file_format,
+                               color_depth=scene.render.image_settings.color_depth)
+
+    @staticmethod
+    def _find_file_output(key: str) -> Optional["_InMemoryOutput"]:
+        """ Searches the file output node, which writes the registered output with the given key.
+
+        :param key: The output key.
+        :return: The output to capture or None, if it cannot be captured.
+        """
+        # The registered path ends with the file ending of the node's file format
+        output_path = os.path.splitext(Utility.find_registered_output_by_key(key)["path"])[0]
+        for output_node in Utility.get_nodes_with_type(bpy.context.scene.node_tree.nodes, 'CompositorNodeOutputFile'):
+            file_format = output_node.format.file_format
+            node_path = os.path.join(output_node.base_path, output_node.file_slots[0].path) + "%04d"
+            if node_path == output_path and not output_node.mute and len(output_node.inputs) == 1 \
+                    and output_node.inputs[0].is_linked:
+                if not _InMemoryOutput._can_convert(key, file_format, output_node.format.color_depth):
+                    return None
+                return _InMemoryOutput(key, output_node.inputs[0].links[0].from_socket, output_node,
+                                       file_format, output_node.format.color_depth)
+        return None
+
+    @staticmethod
+    def _can_convert(key: str, file_format: str, color_depth: str) -> bool:
+        """ Checks if the image in the viewer node can be converted into what would have been written to the file.
+
+        :param key: The output key, only used for the warning.
+        :param file_format: The file format of the output.
+        :param color_depth: The color depth of the output.
+        :return: True, if the conversion is possible.
+        """
+        if file_format == "OPEN_EXR":
+            # EXR files store the linear values of the compositor
+            return True
+        scene = bpy.context.scene
+        view_settings = scene.view_settings
+        # Only the standard sRGB transform can be reproduced here
+        is_standard_transform = view_settings.view_transform == "Standard" and view_settings.look == "None" \
+            and scene.display_settings.display_device == "sRGB"
+        is_unscaled = view_settings.exposure == 0 and view_settings.gamma == 1
+        # Blender adds random noise to 8 bit images, which cannot be reproduced
+        is_dithered = color_depth == "8" and scene.render.dither_intensity > 0
+        if file_format == "PNG" and is_standard_transform and is_unscaled and not is_dithered:
+            return True
+        print(f"Warning: The output {key} can not be taken from the compositor with the file format {file_format}, "
+              f"the view transform {view_settings.view_transform} and the dither intensity "
+              f"{scene.render.dither_intensity}, it is read from a file.")
+        return False
+
+    def __enter__(self) -> "_InMemoryOutput":
+        tree = bpy.context.scene.node_tree
+        self._viewer_node = tree.nodes.new("CompositorNodeViewer")
+        self._viewer_node.use_alpha = True
+        tree.links.new(self._socket, self._viewer_node.inputs['Image'])
+        # Only the active viewer node is evaluated
+        self._previous_active_node = tree.nodes.active
+        tree.nodes.active = self._viewer_node
+        if self._output_node is not None:
+            self._output_node.mute = True
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        tree = bpy.context.scene.node_tree
+        if self._output_node is not None:
+            self._output_node.mute = False
+        tree.nodes.remove(self._viewer_node)
+        self._viewer_node = None
+        if self._previous_active_node is not None:
+            tree.nodes.active = self._previous_active_node
+
+    def render(self):
+        """ Renders the single frame and copies the output into pixels. """
+        if self._output_node is None:
+            # Render a still image without writing it, the file output nodes still write their files
+            bpy.context.scene.frame_set(bpy.context.scene.frame_start)
+            bpy.ops.render.render(animation=False, write_still=False)
+        else:
+            bpy.ops.render.render(animation=True, write_still=True)
+
+        image = bpy.data.images["Viewer Node"]
+        width, height = image.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        # Blender stores images bottom up
+        pixels = pixels.reshape((height, width, 4))[::-1]
+
+        if self._png_color_depth is not None:
+            pixels = _InMemoryOutput._to_png_values(pixels, self._png_color_depth)
+        self.pixels = np.ascontiguousarray(pixels)
+
+    @staticmethod
+    def _to_png_values(pixels: np.ndarray, color_depth: str) -> np.ndarray:
+        """ Converts linear, premultiplied pixels into the values blender writes into a png file.
+
+        Blender's dithering is not reproduced, so 8 bit images only match if the dither intensity is zero.
+
+        :param pixels: The linear RGBA pixels of the compositor.
+        :param color_depth: The color depth of the png file, "8" or "16".
+        :return: The sRGB encoded image with straight alpha, as uint8 or uint16.
+        """
+        alpha = pixels[:, :, 3:]
+        color = np.divide(pixels[:, :, :3], alpha, out=np.zeros_like(pixels[:, :, :3]), where=alpha > 0)
+        color = np.clip(color, 0, 1)
+        color = np.where(color <= 0.0031308, color * 12.92, 1.055 * np.power(color, 1 / 2.4) - 0.055)
+        max_value, dtype = (65535, np.uint16) if color_depth == "16" else (255, np.uint8)
+        rgba = np.concatenate([color, np.clip(alpha, 0, 1)], axis=2)
+        return np.round(rgba * max_value).astype(dtype)
@@ -16,9 +16,11 @@
 from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn
 
 from blenderproc.python.camera import CameraUtility
+from blenderproc.python.renderer.InMemoryOutputUtility import _InMemoryOutput
 from blenderproc.python.modules.main.GlobalStorage import GlobalStorage
 from blenderproc.python.utility.BlenderUtility import get_all_blender_mesh_objects
 from blenderproc.python.utility.DefaultConfig import DefaultConfig
+from blenderproc.python.utility.MetricsUtility import measure_stage
 from blenderproc.python.utility.Utility import Utility, stdout_redirected
 from blenderproc.python.writer.WriterUtility import _WriterUtility
 
@@ -620,11 +622,18 @@ def _render_progress_bar(pipe_out: int, pipe_in: int, stdout: IO, total_frames:
 def render(output_dir: Optional[str] = None, file_prefix: str = "rgb_", output_key: Optional[str] = "colors",
            load_keys: Optional[Set[str]] = None, return_data: bool = True,
            keys_with_alpha_channel: Optional[Set[str]] = None,
-           verbose: bool = False) -> Dict[str, Union[np.ndarray, List[np.ndarray]]]:
+           verbose: bool = False,
+           in_memory_keys: Optional[Set[str]] = None,
+           reuse_output_buffers: bool = False) -> Dict[str, Union[np.ndarray, List[np.ndarray]]]:
     """ Render all frames.
 
     This will go through all frames from scene.frame_start to scene.frame_end and render each of them.
 
+    Outputs listed in in_memory_keys are copied directly from blender's compositor into numpy, instead of being
+    written to and decoded from a file in the output_dir. This is only possible for a single, non-stereo frame and
+    for one output per render call, as blender only has one active viewer node. In all other cases the files are
+    used as usual.
+
     :param output_dir: The directory to write files to, if this is None the temporary directory is used. \
                        The temporary directory is usually in the shared memory (only true for linux).
     :param file_prefix: The prefix to use for writing the images.
@@ -633,6 +642,11 @@ def render(output_dir: Optional[str] = None, file_prefix: str = "rgb_", output_k
     :param return_data: Whether to load and return generated data. Backwards compatibility to config-based pipeline.
     :param keys_with_alpha_channel: A set containing all keys whose alpha channels should be loaded.
     :param verbose: If True, more details about the rendering process are printed.
+    :param in_memory_keys: A set of output keys, whose images should be taken directly from the compositor. Only
+                           has an effect, if return_data is True.
+    :param reuse_output_buffers: If True, the arrays holding the loaded frames of the previous render call with this
+                                 option are refilled instead of allocating new ones. Only use this if the data of
+                                 the previous call is not needed anymore, as it gets overwritten.
     :return: dict of lists of raw renderer output. Keys can be 'distance', 'colors', 'normals'
     """
     if output_dir is None:
@@ -650,7 +664,30 @@ def render(output_dir: Optional[str] = None, file_prefix: str = "rgb_", output_k
         })
         load_keys.add(output_key)
 
-    bpy.context.scene.render.filepath = os.path.join(output_dir, file_prefix)
+    in_memory_keys = in_memory_keys & load_keys if return_data and in_memory_keys else set()
+    in_memory_output = _render_frames(os.path.join(output_dir, file_prefix), output_key, load_keys, in_memory_keys,
+                                      verbose)
+
+    if not return_data:
+        return {}
+    in_memory_outputs = {} if in_memory_output is None else {in_memory_output.key: in_memory_output.pixels}
+    with measure_stage("exr_decode"):
+        return _WriterUtility.load_registered_outputs(load_keys, keys_with_alpha_channel, in_memory_outputs,
+                                                      reuse_output_buffers)
+
+
+def _render_frames(output_path: str, main_output_key: Optional[str], load_keys: Set[str], in_memory_keys: Set[str],
+                   verbose: bool) -> Optional[_InMemoryOutput]:
+    """ Renders all frames from scene.frame_start to scene.frame_end.
+
+    :param output_path: The path prefix of the main render output.
+    :param main_output_key: The key of the main render output, it does not have to be registered.
+    :param load_keys: The keys of the outputs, which are loaded afterwards. Only used for printing.
+    :param in_memory_keys: The keys of the outputs, which should be taken directly from the compositor.
+    :param verbose: If True, more details about the rendering process are printed.
+    :return: The output taken from the compositor or None, if all outputs were written to files.
+    """
+    bpy.context.scene.render.filepath = output_path
 
     # Skip if there is nothing to render
     if bpy.context.scene.frame_end != bpy.context.scene.frame_start:
@@ -668,12 +705,18 @@ def render(output_dir: Optional[str] = None, file_prefix: str = "rgb_", output_k
         # blender will render all frames in [frame_start, frame_ned]
         bpy.context.scene.frame_end -= 1
 
+        in_memory_output = _InMemoryOutput.find(in_memory_keys, main_output_key)
+
         # Define pipe to communicate blenders debug messages to progress bar
         pipe_out, pipe_in = os.pipe()
         begin = time.time()
-        with stdout_redirected(pipe_in, enabled=not verbose) as stdout:
+        with stdout_redirected(pipe_in, enabled=not verbose) as stdout, measure_stage("cycles_render"):
             with _render_progress_bar(pipe_out, pipe_in, stdout, total_frames, enabled=not verbose):
-                bpy.ops.render.render(animation=True, write_still=True)
+                if in_memory_output is None:
+                    bpy.ops.render.render(animation=True, write_still=True)
+                else:
+                    with in_memory_output:
+                        in_memory_output.render()
         print(f"Finished rendering after {time.time() - begin:.3f} seconds")
         # Revert changes
         bpy.context.scene.frame_end += 1
@@ -681,7 +724,7 @@ def render(output_dir: Optional[str] = None, file_prefix: str = "rgb_", output_k
         raise RuntimeError("No camera poses have been registered, therefore nothing can be rendered. A camera "
                            "pose can be registered via bproc.camera.add_camera_pose().")
 
-    return _WriterUtility.load_registered_outputs(load_keys, keys_with_alpha_channel) if return_data else {}
+    return in_memory_output
 
 
 def set_output_format(file_format: Optional[str] = None, color_depth: Optional[int] = None,
@@ -2,7 +2,8 @@
 
 import csv
 import os
-from typing import List, Tuple, Union, Dict, Optional, Any
+from types import TracebackType
+from typing import List, Tuple, Union, Dict, Optional, Any, Callable, Type
 
 import bpy
 import mathutils
@@ -10,7 +11,9 @@
 
 from blenderproc.python.utility.BlenderUtility import load_image, get_all_blender_mesh_objects
 from blenderproc.python.material import MaterialLoaderUtility
+from blenderproc.python.postprocessing.PostProcessingUtility import _PostProcessingUtility
 from blenderproc.python.renderer import RendererUtility
+from blenderproc.python.renderer.RendererUtility import _render_frames
 from blenderproc.python.utility.Utility import Utility, UndoAfterExecution
 
 
@@ -19,7 +22,9 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
                   default_values: Optional[Dict[str, int]] = None, file_prefix: str = "segmap_",
                   output_key: str = "segmap", segcolormap_output_file_prefix: str = "instance_attribute_map_",
                   segcolormap_output_key: str = "segcolormap", use_alpha_channel: bool = False,
-                  render_colorspace_size_per_dimension: int = 2048) -> Dict[str, Union[np.ndarray, List[np.ndarray]]]:
+                  render_colorspace_size_per_dimension: int = 2048,
+                  use_material_cache: bool = False,
+                  in_memory: bool = False) -> Dict[str, Union[np.ndarray, List[np.ndarray]]]:
     """ Renders segmentation maps for all frames
 
     :param output_dir: The directory to write images to.
@@ -36,6 +41,12 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
                                                  blender does not allow negative values for colors, we use \
                                                  [0, 2048] ** 3 as our color space which allows ~8 billion \
                                                  different colors/objects. This should be enough.
+    :param use_material_cache: If True, the segmentation materials are kept across calls and the changed render
+                               settings, material slots and world are restored directly afterwards, instead of
+                               reverting all changes via undo. This is much faster for repeated calls on a large
+                               scene. Not available together with use_alpha_channel.
+    :param in_memory: If True and only a single frame is rendered, the segmentation image is taken directly from the
+                      compositor instead of being written to and decoded from an .exr file in the temp_dir.
     :return: dict of lists of segmaps and (for instance segmentation) segcolormaps
     """
 
@@ -46,12 +57,17 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
     if default_values is None:
         default_values = {"class": 0}
 
-    with UndoAfterExecution():
+    if use_material_cache and use_alpha_channel:
+        print("Warning: The material cache cannot be used together with use_alpha_channel, falling back to undo.")
+        use_material_cache = False
+
+    segmentation_state = _SegMapRenderState(use_material_cache)
+    with segmentation_state:
         RendererUtility.render_init()
         # the amount of samples must be one and there can not be any noise threshold
         RendererUtility.set_max_amount_of_samples(1)
         RendererUtility.set_noise_threshold(0)
-        RendererUtility.set_denoiser(None)
+        segmentation_state.disable_denoiser()
         RendererUtility.set_light_bounces(1, 0, 0, 1, 0, 8, 0)
 
         attributes = map_by
@@ -62,7 +78,8 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
         objs_with_mats = get_all_blender_mesh_objects()
 
         result = _colorize_objects_for_instance_segmentation(objs_with_mats, use_alpha_channel,
-                                                             render_colorspace_size_per_dimension)
+                                                             render_colorspace_size_per_dimension,
+                                                             segmentation_state)
         colors, num_splits_per_dimension, objects = result
 
         bpy.context.scene.cycles.filter_width = 0.0
@@ -75,7 +92,15 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
         final_segmentation_file_path = os.path.join(output_dir, file_prefix)
 
         RendererUtility.set_output_format("OPEN_EXR", 16)
-        RendererUtility.render(temp_dir, "seg_", None, return_data=False)
+        if in_memory:
+            # The main output is taken from the compositor without registering it as output. For multiple frames or
+            # stereo, it is written to the temp_dir as usual.
+            in_memory_output = _render_frames(temporary_segmentation_file_path, "segmentation_render", set(),
+                                              {"segmentation_render"}, False)
+        else:
+            RendererUtility.render(temp_dir, "seg_", None, return_data=False)
+            in_memory_output = None
+        rendered_segmentations = None if in_memory_output is None else [in_memory_output.pixels[:, :, :3]]
 
         # Find optimal dtype of output based on max index
         for dtype in [np.uint8, np.uint16, np.uint32]:
@@ -109,26 +134,32 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
             save_in_csv_attributes: Dict[int, Dict[str, Any]] = {}
 
             there_was_an_instance_rendering = False
-            for suffix in suffixes:
-                file_path = temporary_segmentation_file_path + f"{frame:04d}" + suffix + ".exr"
-                segmentation = load_image(file_path)
-                print(file_path, segmentation.shape)
+            for suffix_index, suffix in enumerate(suffixes):
+                if rendered_segmentations is not None:
+                    segmentation = rendered_segmentations[frame - bpy.context.scene.frame_start]
+                    if bpy.context.scene.render.use_multiview:
+                        segmentation = segmentation[suffix_index]
+                else:
+                    file_path = temporary_segmentation_file_path + f"{frame:04d}" + suffix + ".exr"
+                    segmentation = load_image(file_path)
+                    print(file_path, segmentation.shape)
 
                 segmap = Utility.map_back_from_equally_spaced_equidistant_values(segmentation,
                                                                                  num_splits_per_dimension,
                                                                                  render_colorspace_size_per_dimension)
                 segmap = segmap.astype(optimal_dtype)
 
-                object_ids = np.unique(segmap)
-                max_id = np.max(object_ids)
+                max_id = np.max(segmap)
                 if max_id >= len(objects):
                     raise Exception("There are more object colors than there are objects")
+                object_ids = _PostProcessingUtility.unique_ids(segmap)
                 combined_result_map = []
                 list_of_attributes = []
                 channels = []
                 for channel_id in range(result_channels):
                     num_default_values = 0
-                    resulting_map = np.zeros((segmap.shape[0], segmap.shape[1]), dtype=optimal_dtype)
+                    # maps each object id to the value it gets in the resulting map
+                    object_id_values: Dict[int, Any] = {}
                     was_used = False
                     current_attribute = attributes[channel_id]
                     org_attribute = current_attribute
@@ -188,13 +219,17 @@ def render_segmap(output_dir: Optional[str] = None, temp_dir: Optional[str] = No
                             # save everything which is not instance also in the .csv
                             if isinstance(value, (int, float, np.integer, np.floating)):
                                 was_used = True
-                                resulting_map[segmap == object_id] = value
+                                object_id_values[object_id] = value
 
                             if object_id in save_in_csv_attributes:
                                 save_in_csv_attributes[object_id][attribute] = value
                             else:
                                 save_in_csv_attributes[object_id] = {attribute: value}
 
+                        # map all pixels to their values in one lookup
+                        resulting_map = _PostProcessingUtility.map_ids_to_values(segmap, object_id_values,
+                                                                                 len(objects), optimal_dtype)
+
                     if was_used and num_default_values < len(object_ids):
                         channels.append(org_attribute)
                         combined_result_map.append(resulting_map)
@@ -320,13 +355,16 @@ def _set_world_background_color(color: List[float]):
 
 
 def _colorize_objects_for_instance_segmentation(objects: List[bpy.types.Object], use_alpha_channel: bool,
-                                                render_colorspace_size_per_dimension: int) \
+                                                render_colorspace_size_per_dimension: int,
+                                                segmentation_state: Optional["_SegMapRenderState"] = None) \
         -> Tuple[List[List[int]], int, List[bpy.types.Object]]:
     """ Sets a different color to each object.
 
     :param objects: A list of objects.
     :param use_alpha_channel: If true, the alpha channel stored in .png textures is used.
     :param render_colorspace_size_per_dimension: The limit of the colorspace to use per dimension for generating colors.
+    :param segmentation_state: If given and it uses the material cache, the objects are colorized via the cached
+                               segmentation materials instead of creating new ones.
     :return: The num_splits_per_dimension of the spanned color space, the color map
     """
     # + 1 for the background
@@ -336,11 +374,179 @@ def _colorize_objects_for_instance_segmentation(objects: List[bpy.types.Object],
     color_map = []
 
     # Set world background label, which is always label zero
-    _set_world_background_color(colors[0])
     color_map.append(bpy.context.scene.world)  # add the world background as an object to this list
+    if segmentation_state is not None and segmentation_state.use_material_cache:
+        segmentation_state.set_world_background_color(colors[0])
+    else:
+        _set_world_background_color(colors[0])
 
     for idx, obj in enumerate(objects):
-        _colorize_object(obj, colors[idx + 1], use_alpha_channel)
+        if segmentation_state is not None and segmentation_state.use_material_cache:
+            segmentation_state.colorize_object(obj, colors[idx + 1])
+        else:
+            _colorize_object(obj, colors[idx + 1], use_alpha_channel)
         color_map.append(obj)
 
+    if segmentation_state is not None and segmentation_state.use_material_cache:
+        segmentation_state.remove_unused_materials(objects)
+
     return colors, num_splits_per_dimension, color_map
+
+
+class _SegMapMaterialCache:
+    """ Stores the segmentation materials and world, which are reused across render_segmap() calls. """
+
+    # Only names are stored, as the data blocks are reallocated by every undo step. Maps the session_uid of each
+    # object, which stays the same across undo steps, to the name of its segmentation material.
+    material_names: Dict[int, str] = {}
+    world_name: Optional[str] = None
+
+
+class _SegMapRenderState:
+    """ Switches the scene into the segmentation state and back.
+
+    Without the material cache, all changes are reverted via UndoAfterExecution. With the material cache, the
+    changed render settings are stored and restored directly, the world is swapped with a cached segmentation world
+    and the material slots of every object are overridden on the object level with its cached segmentation material,
+    so the original materials are not touched. Only meshes without any material slot temporarily get an empty slot.
+    """
+
+    # The render settings changed by render_segmap(), grouped by the data block they belong to
+    _changed_settings = {
+        "scene.cycles": ["samples", "use_adaptive_sampling", "adaptive_threshold", "use_denoising",
+                         "diffuse_bounces", "glossy_bounces", "ao_bounces_render", "max_bounces",
+                         "transmission_bounces", "transparent_max_bounces", "volume_bounces", "filter_width",
+                         "debug_bvh_type", "debug_use_spatial_splits"],
+        "view_layer.cycles": ["use_denoising"],
+        "scene": ["use_nodes"],
+        "scene.render": ["engine", "resolution_percentage", "use_persistent_data", "film_transparent", "filepath",
+                         "use_compositing"],
+        "scene.render.image_settings": ["file_format", "color_depth", "color_mode"]
+    }
+
+    def __init__(self, use_material_cache: bool):
+        """
+        :param use_material_cache: If True, the cached segmentation materials are used instead of undo.
+        """
+        self.use_material_cache = use_material_cache
+        self._undo = None if use_material_cache else UndoAfterExecution(check_point_name="render_segmap")
+        self._stored_settings: List[Tuple[Any, str, Any]] = []
+        # Functions restoring the original state, called in reverse order
+        self._restore_steps: List[Callable[[], None]] = []
+
+    def __enter__(self) -> "_SegMapRenderState":
+        if self._undo is not None:
+            self._undo.__enter__()
+        else:
+            for data_path, attributes in _SegMapRenderState._changed_settings.items():
+                data_block = bpy.context
+                for name in data_path.split("."):
+                    data_block = getattr(data_block, name)
+                for attribute in attributes:
+                    if hasattr(data_block, attribute):
+                        self._stored_settings.append((data_block, attribute, getattr(data_block, attribute)))
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        if self._undo is not None:
+            self._undo.__exit__(exc_type, exc_value, traceback)
+        else:
+            for restore_step in reversed(self._restore_steps):
+                restore_step()
+            for data_block, attribute, value in self._stored_settings:
+                setattr(data_block, attribute, value)
+
+    def disable_denoiser(self):
+        """ Disables all denoisers for the segmentation render. """
+        if not self.use_material_cache:
+            RendererUtility.set_denoiser(None)
+            return
+        bpy.context.scene.cycles.use_denoising = False
+        bpy.context.view_layer.cycles.use_denoising = False
+        # Mute instead of removing the denoise nodes of the compositor, so they can simply be unmuted afterwards
+        if bpy.context.scene.use_nodes:
+            for denoiser_node in Utility.get_nodes_with_type(bpy.context.scene.node_tree.nodes,
+                                                             'CompositorNodeDenoise'):
+                if not denoiser_node.mute:
+                    denoiser_node.mute = True
+                    self._restore_steps.append(lambda node=denoiser_node: setattr(node, "mute", False))
+
+    def set_world_background_color(self, color: List[float]):
+        """ Swaps the world of the scene with the cached segmentation world, which emits the given color.
+
+        :param color: A 3-dim list containing the background color.
+        """
+        world = bpy.data.worlds.get(_SegMapMaterialCache.world_name or "")
+        if world is None:
+            world = bpy.data.worlds.new("segmentation_world")
+            world.use_nodes = True
+            _SegMapMaterialCache.world_name = world.name
+        original_world = bpy.context.scene.world
+        bpy.context.scene.world = world
+        self._restore_steps.append(lambda: setattr(bpy.context.scene, "world", original_world))
+        _set_world_background_color(color)
+
+    def colorize_object(self, obj: bpy.types.Object, color: List[float]):
+        """ Overrides all material slots of the given object with its cached segmentation material.
+
+        Objects without any material slot get an empty slot on their mesh, which is removed again afterwards.
+
+        :param obj: The object to colorize.
+        :param color: RGB array of a color in the range of [0, render_colorspace_size_per_dimension].
+        """
+        material = bpy.data.materials.get(_SegMapMaterialCache.material_names.get(obj.session_uid, ""))
+        if material is None:
+            material = _SegMapRenderState._create_segmentation_material()
+            _SegMapMaterialCache.material_names[obj.session_uid] = material.name
+        emission_node = Utility.get_the_one_node_with_type(material.node_tree.nodes, "ShaderNodeEmission")
+        # Only update the color, if the ids of the objects have changed since the last call
+        if list(emission_node.inputs['Color'].default_value[:3]) != list(color):
+            emission_node.inputs['Color'].default_value[:3] = color
+
+        if len(obj.material_slots) == 0:
+            # A slot cannot exist without its mesh slot, but the empty mesh slot does not assign any material
+            mesh = obj.data
+            mesh.materials.append(None)
+            self._restore_steps.append(lambda: mesh.materials.pop(index=len(mesh.materials) - 1))
+        for material_slot in obj.material_slots:
+            # Override the material on the object level, so other objects using the same mesh are not affected
+            original_link = material_slot.link
+            material_slot.link = 'OBJECT'
+            original_material = material_slot.material
+            material_slot.material = material
+            self._restore_steps.append(lambda slot=material_slot, link=original_link, mat=original_material:
+                                       (setattr(slot, "material", mat), setattr(slot, "link", link)))
+
+    @staticmethod
+    def remove_unused_materials(objects: List[bpy.types.Object]):
+        """ Removes the cached segmentation materials of objects which do not exist anymore.
+
+        :param objects: All objects, which are currently rendered.
+        """
+        used_keys = {obj.session_uid for obj in objects}
+        for key in list(_SegMapMaterialCache.material_names):
+            if key not in used_keys:
+                material = bpy.data.materials.get(_SegMapMaterialCache.material_names.pop(key))
+                if material is not None:
+                    bpy.data.materials.remove(material)
+
+    @staticmethod
+    def _create_segmentation_material() -> bpy.types.Material:
+        """ Creates a material, which only consists of an emission node.
+
+        :return: The new material.
+        """
+        new_mat = bpy.data.materials.new(name="segmentation")
+        new_mat.use_nodes = True
+        # See _colorize_object() for why the material should not be sampled as light
+        new_mat.cycles.sample_as_light = False
+        nodes = new_mat.node_tree.nodes
+        links = new_mat.node_tree.links
+        emission_node = nodes.new(type='ShaderNodeEmission')
+        output = Utility.get_the_one_node_with_type(nodes, 'OutputMaterial')
+        links.new(emission_node.outputs['Emission'], output.inputs['Surface'])
+        # Keep the material, even if it is not used by any object between two segmentation renders
+        new_mat.use_fake_user = True
+        return new_mat
@@ -0,0 +1,355 @@
+"""Samples valid poses of armature bones in batches, using forward kinematics in numpy."""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+import bpy
+import numpy as np
+
+from blenderproc.python.types.ArmatureUtility import Armature
+from blenderproc.python.utility.MathUtility import _MathUtility
+from blenderproc.python.utility.Utility import Utility
+
+
+class _ArmatureRestPose(NamedTuple):
+    """ The bone hierarchy of an ArmaturePoseSampler, with every parent coming before its children """
+    bone_names: List[str]
+    parent_indices: List[int]
+    # The rest pose of every bone relative to the rest pose of its parent
+    local_rest_mats: np.ndarray
+    bone_lengths: np.ndarray
+    # The current pose of every bone relative to its rest pose, which is kept for the bones that are not randomized
+    basis_mats: np.ndarray
+
+
+class _ArmatureJoints(NamedTuple):
+    """ The randomized bones of an ArmaturePoseSampler """
+    names: List[str]
+    bone_indices: np.ndarray
+    # The limits in the shape (J, 3, 2), unlimited axes stay at zero
+    limits: np.ndarray
+    # Only the rotation is sampled, the location and scale are kept
+    locations: np.ndarray
+    scales: np.ndarray
+
+
+class _ArmatureCapsules(NamedTuple):
+    """ The capsules around the bones of an ArmaturePoseSampler, which are used for the validity checks """
+    bone_indices: np.ndarray
+    radii: np.ndarray
+    # The pairs of capsules, which are checked against each other
+    pairs: np.ndarray
+    min_height: Optional[float]
+    # The capsules, which are checked against the min_height
+    height_checked: np.ndarray
+
+
+class ArmaturePoseSampler:
+    """ Samples the rotations of armature bones within joint limits and rejects invalid configurations.
+
+    The poses of all bones are computed with forward kinematics in numpy from the rest matrices of the bones, so
+    thousands of configurations are checked at once. Every bone with a capsule radius is approximated by a capsule
+    around the line from its head to its tail. A configuration is rejected, if two capsules intersect, which do
+    not already intersect in the rest pose and are not close to each other in the bone hierarchy, or if a capsule,
+    which is above min_height in the rest pose, gets below it. The valid configurations are kept in a bank, from
+    which next_pose() takes them.
+
+    Constraints and drivers of the bones are not evaluated, and the bones are assumed to inherit the rotation and
+    scale of their parents.
+
+    Usage:
+
+    .. code-block:: python
+
+        sampler = ArmaturePoseSampler(armature, {"Axis-1": [-2.9, 2.9], "Axis-2": [-1.76, 1.76]},
+                                      capsule_radii={"Axis-1": 0.06, "Axis-2": 0.06, "Axis-3": 0.05}, min_height=0)
+        for frame in range(10):
+            sampler.apply(sampler.next_pose(), frame=frame)
+    """
+
+    def __init__(self, armature: Union[Armature, bpy.types.Object],
+                 joint_limits: Dict[str, Union[Sequence[float], Dict[str, Sequence[float]]]],
+                 capsule_radii: Optional[Dict[str, float]] = None, min_height: Optional[float] = None,
+                 min_hierarchy_distance: int = 3, default_axis: str = "Z", batch_size: int = 1000,
+                 rng: Optional[np.random.Generator] = None):
+        """
+        :param armature: The armature, whose bones should be posed.
+        :param joint_limits: Maps the names of the bones to randomize to their rotation limits in radians. Either
+                             a [min, max] pair for a rotation around the default_axis or a dict with [min, max]
+                             pairs for some of the axes "X", "Y" and "Z". Rotations around the other axes are zero.
+                             Bones which do not exist in the armature are ignored.
+        :param capsule_radii: Maps the names of the bones used for the collision checks to the radii of their
+                              capsules. Bones which do not exist in the armature are ignored.
+        :param min_height: If given, the capsules have to stay above this height, measured along the z axis of the
+                           armature space. E.g. the height of a table top the armature stands on.
+        :param min_hierarchy_distance: Two capsules are only checked against each other, if their bones are at least
+                                       this many steps apart in the bone hierarchy. With 3, a bone is neither checked
+                                       against its parent, its grandparent nor its siblings.
+        :param default_axis: The rotation axis used by joint limits, which are given as a single pair.
+        :param batch_size: The number of configurations sampled and checked at once, when the bank is empty.
+        :param rng: The random number generator to use. If None is given, a new one is seeded from the global numpy
+                    random state, so the poses are reproducible via BLENDER_PROC_RANDOM_SEED.
+        """
+        if isinstance(armature, Armature):
+            armature = armature.blender_obj
+        if default_axis not in ["X", "Y", "Z"]:
+            raise ValueError(f"The default axis has to be X, Y or Z, but is {default_axis}")
+        self._armature = armature
+        self._batch_size = batch_size
+        self._rng = rng if rng is not None else np.random.default_rng(np.random.randint(2 ** 32, dtype=np.uint32))
+        self._bank = np.empty((0, 0, 3))
+
+        # Order the bones, such that every parent comes before its children
+        bone_names: List[str] = []
+        parent_indices: List[int] = []
+        bones = [bone for bone in armature.data.bones if bone.parent is None]
+        while bones:
+            bone = bones.pop(0)
+            parent_indices.append(bone_names.index(bone.parent.name) if bone.parent is not None else -1)
+            bone_names.append(bone.name)
+            bones.extend(bone.children)
+        data_bones = [armature.data.bones[name] for name in bone_names]
+        pose_bones = [armature.pose.bones[name] for name in bone_names]
+
+        rest_mats = np.array([np.array(bone.matrix_local) for bone in data_bones]).reshape(-1, 4, 4)
+        local_rest_mats = rest_mats.copy()
+        for i, parent_index in enumerate(parent_indices):
+            if parent_index >= 0:
+                local_rest_mats[i] = np.linalg.inv(rest_mats[parent_index]) @ rest_mats[i]
+        self._rest_pose = _ArmatureRestPose(
+            bone_names, parent_indices, local_rest_mats, np.array([bone.length for bone in data_bones]),
+            np.array([np.array(bone.matrix_basis) for bone in pose_bones]).reshape(-1, 4, 4))
+
+        joint_names = [name for name in joint_limits if name in armature.pose.bones]
+        joint_limit_array = np.zeros((len(joint_names), 3, 2))
+        for i, name in enumerate(joint_names):
+            limits = joint_limits[name]
+            if not isinstance(limits, dict):
+                limits = {default_axis: limits}
+            for axis, axis_limits in limits.items():
+                joint_limit_array[i, ["X", "Y", "Z"].index(axis.upper())] = axis_limits
+        self._joints = _ArmatureJoints(
+            joint_names, np.array([bone_names.index(name) for name in joint_names], dtype=int), joint_limit_array,
+            np.array([list(armature.pose.bones[name].location) for name in joint_names]),
+            np.array([list(armature.pose.bones[name].scale) for name in joint_names]))
+        for name in joint_names:
+            armature.pose.bones[name].rotation_mode = 'XYZ'
+
+        capsule_radii = capsule_radii if capsule_radii is not None else {}
+        capsule_names = [name for name in capsule_radii if name in armature.pose.bones]
+        capsule_bone_indices = np.array([bone_names.index(name) for name in capsule_names], dtype=int)
+        pairs = [(i, j) for i in range(len(capsule_names)) for j in range(i + 1, len(capsule_names))
+                 if self._hierarchy_distance(capsule_bone_indices[i],
+                                             capsule_bone_indices[j]) >= min_hierarchy_distance]
+        self._capsules = _ArmatureCapsules(
+            capsule_bone_indices, np.array([capsule_radii[name] for name in capsule_names], dtype=np.float64),
+            np.array(pairs, dtype=int).reshape(-1, 2), min_height, np.ones(len(capsule_names), dtype=bool))
+        # Capsules which already intersect or are below min_height in the rest pose are only a too rough
+        # approximation of the meshes, e.g. the base of a robot standing on a table, so they are not checked
+        rest_pose_mats = self.forward_kinematics(np.zeros((1, len(joint_names), 3)))
+        self._capsules = self._capsules._replace(
+            pairs=self._capsules.pairs[~self._colliding_pairs(rest_pose_mats)[0]])
+        if min_height is not None:
+            self._capsules = self._capsules._replace(
+                height_checked=self._capsule_heights(rest_pose_mats)[0] >= min_height)
+
+    @property
+    def bone_names(self) -> List[str]:
+        """ Returns the names of all bones, with every parent coming before its children.
+
+        :return: The bone names in the order used by forward_kinematics().
+        """
+        return self._rest_pose.bone_names
+
+    @property
+    def joint_names(self) -> List[str]:
+        """ Returns the names of the randomized bones.
+
+        :return: The bone names in the order used by the joint rotations.
+        """
+        return self._joints.names
+
+    def _hierarchy_distance(self, bone_index: int, other_bone_index: int) -> int:
+        """ Returns the number of steps between two bones in the bone hierarchy.
+
+        :param bone_index: The index of the first bone.
+        :param other_bone_index: The index of the second bone.
+        :return: The number of steps, or a large number if the bones are not connected.
+        """
+        ancestors = {}
+        index, steps = bone_index, 0
+        while index >= 0:
+            ancestors[index] = steps
+            index, steps = self._rest_pose.parent_indices[index], steps + 1
+        index, steps = other_bone_index, 0
+        while index >= 0:
+            if index in ancestors:
+                return ancestors[index] + steps
+            index, steps = self._rest_pose.parent_indices[index], steps + 1
+        return len(self.bone_names) + 1
+
+    def sample_joint_rotations(self, num_samples: int) -> np.ndarray:
+        """ Samples joint rotations uniformly within the joint limits, without checking them.
+
+        :param num_samples: The number of configurations.
+        :return: The XYZ euler angles of all randomized joints in the shape (N, J, 3).
+        """
+        return self._rng.uniform(self._joints.limits[..., 0], self._joints.limits[..., 1],
+                                 size=(num_samples,) + self._joints.limits.shape[:2])
+
+    def forward_kinematics(self, joint_rotations: np.ndarray) -> np.ndarray:
+        """ Computes the poses of all bones in armature space for the given joint rotations.
+
+        :param joint_rotations: The XYZ euler angles of all randomized joints in the shape (N, J, 3).
+        :return: The pose matrices of all bones in the shape (N, B, 4, 4), the bones are ordered like bone_names.
+        """
+        num_samples = len(joint_rotations)
+        basis_mats = np.repeat(self._rest_pose.basis_mats[np.newaxis], num_samples, axis=0)
+        # basis = translation @ rotation @ scale
+        rotation_mats = _MathUtility.euler_to_matrices(joint_rotations.reshape(-1, 3))
+        rotation_mats = rotation_mats.reshape(num_samples, len(self.joint_names), 3, 3)
+        joint_basis_mats = np.zeros((num_samples, len(self.joint_names), 4, 4))
+        joint_basis_mats[..., :3, :3] = rotation_mats * self._joints.scales[np.newaxis, :, np.newaxis]
+        joint_basis_mats[..., :3, 3] = self._joints.locations
+        joint_basis_mats[..., 3, 3] = 1
+        basis_mats[:, self._joints.bone_indices] = joint_basis_mats
+
+        local_rest_mats = self._rest_pose.local_rest_mats
+        pose_mats = np.empty_like(basis_mats)
+        for i, parent_index in enumerate(self._rest_pose.parent_indices):
+            if parent_index >= 0:
+                pose_mats[:, i] = pose_mats[:, parent_index] @ local_rest_mats[i] @ basis_mats[:, i]
+            else:
+                pose_mats[:, i] = local_rest_mats[i] @ basis_mats[:, i]
+        return pose_mats
+
+    def bone_heads_and_tails(self, pose_mats: np.ndarray) -> np.ndarray:
+        """ Returns the head and tail positions of all bones in armature space.
+
+        :param pose_mats: The pose matrices returned by forward_kinematics() in the shape (N, B, 4, 4).
+        :return: The positions in the shape (N, B, 2, 3).
+        """
+        heads = pose_mats[..., :3, 3]
+        # The tail lies on the y axis of the bone
+        tails = heads + pose_mats[..., :3, 1] * self._rest_pose.bone_lengths[:, np.newaxis]
+        return np.stack([heads, tails], axis=-2)
+
+    def _colliding_pairs(self, pose_mats: np.ndarray) -> np.ndarray:
+        """ Checks which pairs of capsules intersect.
+
+        :param pose_mats: The pose matrices returned by forward_kinematics() in the shape (N, B, 4, 4).
+        :return: A boolean array in the shape (N, P), which is True for the intersecting pairs.
+        """
+        segments = self.bone_heads_and_tails(pose_mats)[:, self._capsules.bone_indices]
+        first, second = segments[:, self._capsules.pairs[:, 0]], segments[:, self._capsules.pairs[:, 1]]
+        distances = _ArmaturePoseSamplerUtility.segment_distances(first[..., 0, :], first[..., 1, :],
+                                                                   second[..., 0, :], second[..., 1, :])
+        return distances < self._capsules.radii[self._capsules.pairs].sum(axis=1)
+
+    def _capsule_heights(self, pose_mats: np.ndarray) -> np.ndarray:
+        """ Returns the height of the lowest point of every capsule.
+
+        :param pose_mats: The pose matrices returned by forward_kinematics() in the shape (N, B, 4, 4).
+        :return: The heights in the shape (N, C).
+        """
+        segments = self.bone_heads_and_tails(pose_mats)[:, self._capsules.bone_indices]
+        return segments[..., 2].min(axis=2) - self._capsules.radii
+
+    def is_valid(self, joint_rotations: np.ndarray) -> np.ndarray:
+        """ Checks the given configurations for self collisions and for capsules below min_height.
+
+        :param joint_rotations: The XYZ euler angles of all randomized joints in the shape (N, J, 3).
+        :return: A boolean array in the shape (N,), which is True for the valid configurations.
+        """
+        pose_mats = self.forward_kinematics(joint_rotations)
+        valid = ~np.any(self._colliding_pairs(pose_mats), axis=1)
+        if self._capsules.min_height is not None:
+            heights = self._capsule_heights(pose_mats)[:, self._capsules.height_checked]
+            valid &= np.all(heights >= self._capsules.min_height, axis=1)
+        return valid
+
+    def next_pose(self, max_batches: int = 10) -> np.ndarray:
+        """ Takes the next valid configuration from the bank, the bank is refilled in batches when it is empty.
+
+        :param max_batches: The maximum number of batches sampled to refill the bank.
+        :return: The XYZ euler angles of all randomized joints in the shape (J, 3).
+        """
+        num_batches = 0
+        while len(self._bank) == 0:
+            if num_batches == max_batches:
+                raise RuntimeError(f"No valid pose of the armature {self._armature.name} was found in "
+                                   f"{max_batches * self._batch_size} samples")
+            candidates = self.sample_joint_rotations(self._batch_size)
+            self._bank = candidates[self.is_valid(candidates)]
+            num_batches += 1
+        joint_rotations, self._bank = self._bank[0], self._bank[1:]
+        return joint_rotations
+
+    def apply(self, joint_rotations: np.ndarray, frame: Optional[int] = None):
+        """ Writes the given rotations into the pose bones, without switching into the pose mode.
+
+        :param joint_rotations: The XYZ euler angles of all randomized joints in the shape (J, 3).
+        :param frame: The frame to insert the keyframes at. If None is given, the current frame of a surrounding
+                      KeyFrame context manager is used.
+        """
+        pose_bones = self._armature.pose.bones
+        rotations = np.empty(len(pose_bones) * 3, dtype=np.float32)
+        pose_bones.foreach_get("rotation_euler", rotations)
+        rotations = rotations.reshape(-1, 3)
+        for name, rotation in zip(self.joint_names, joint_rotations):
+            rotations[pose_bones.find(name)] = rotation
+        pose_bones.foreach_set("rotation_euler", rotations.ravel())
+        self._armature.update_tag()
+        for name in self.joint_names:
+            Utility.insert_keyframe(pose_bones[name], "rotation_euler", frame)
+
+    def bone_head(self, joint_rotations: np.ndarray, bone_name: str) -> np.ndarray:
+        """ Returns the head position of a bone in armature space for the given rotations.
+
+        :param joint_rotations: The XYZ euler angles of all randomized joints in the shape (J, 3).
+        :param bone_name: The name of the bone.
+        :return: The head position.
+        """
+        return self.forward_kinematics(joint_rotations[np.newaxis])[0, self.bone_names.index(bone_name), :3, 3]
+
+
+class _ArmaturePoseSamplerUtility:
+
+    @staticmethod
+    def segment_distances(starts: np.ndarray, ends: np.ndarray, other_starts: np.ndarray,
+                          other_ends: np.ndarray) -> np.ndarray:
+        """ Computes the closest distances between pairs of line segments.
+
+        :param starts: The start points of the first segments in the shape (..., 3).
+        :param ends: The end points of the first segments in the shape (..., 3).
+        :param other_starts: The start points of the second segments in the shape (..., 3).
+        :param other_ends: The end points of the second segments in the shape (..., 3).
+        :return: The distances in the shape (...).
+        """
+        directions, other_directions = ends - starts, other_ends - other_starts
+        offsets = starts - other_starts
+        length_sq = np.einsum("...i,...i", directions, directions)
+        other_length_sq = np.einsum("...i,...i", other_directions, other_directions)
+        dot = np.einsum("...i,...i", directions, other_directions)
+        offset_dot = np.einsum("...i,...i", directions, offsets)
+        other_offset_dot = np.einsum("...i,...i", other_directions, offsets)
+        eps = 1e-12
+        safe_length_sq = np.maximum(length_sq, eps)
+        safe_other_length_sq = np.maximum(other_length_sq, eps)
+
+        # The closest point of the infinite lines, falling back to the start point for parallel segments
+        denom = length_sq * other_length_sq - dot * dot
+        s = np.where(denom > eps, (dot * other_offset_dot - offset_dot * other_length_sq) / np.maximum(denom, eps), 0)
+        s = np.clip(s, 0, 1)
+        # The closest point on the second segment to the point on the first segment, which is clamped afterwards
+        t = (dot * s + other_offset_dot) / safe_other_length_sq
+        s = np.where(t < 0, np.clip(-offset_dot / safe_length_sq, 0, 1),
+                     np.where(t > 1, np.clip((dot - offset_dot) / safe_length_sq, 0, 1), s))
+        t = np.clip(t, 0, 1)
+        # Degenerated segments are points
+        s = np.where(other_length_sq > eps, s, np.clip(-offset_dot / safe_length_sq, 0, 1))
+        s = np.where(length_sq > eps, s, 0)
+        t = np.where(other_length_sq > eps, t, 0)
+
+        closest = starts + s[..., np.newaxis] * directions
+        other_closest = other_starts + t[..., np.newaxis] * other_directions
+        return np.linalg.norm(closest - other_closest, axis=-1)
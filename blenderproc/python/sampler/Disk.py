@@ -9,7 +9,8 @@
 
 def disk(center: Union[Vector, np.ndarray, List[float]], radius: float,
          rotation: Optional[Union[Vector, np.ndarray, List[float]]] = None,
-         sample_from: str = "disk", start_angle: float = 0, end_angle: float = 180) -> np.ndarray:
+         sample_from: str = "disk", start_angle: float = 0, end_angle: float = 180, size: Optional[int] = None,
+         rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """ Samples a point on a 1-sphere (circle), or on a 2-ball (disk, i.e. circle + interior space), or on an arc/sector
         with an inner angle less or equal than 180 degrees. Returns a 3d mathutils.Vector sampled point.
 
@@ -49,7 +50,9 @@ def disk(center: Union[Vector, np.ndarray, List[float]], radius: float,
                       start_angle. Arc's/sector's inner angle (between start and end) must be less or equal
                       than 180 degrees. Angle increases in the counterclockwise direction from the positive
                       direction of X axis.
-    :return: A random point sampled point on a circle/disk/arc/sector.
+    :param size: If given, this many points are sampled at once and returned as an (N,3) array.
+    :param rng: The random generator to use, by default the global numpy random state is used.
+    :return: A random point sampled point on a circle/disk/arc/sector or the (N,3) array of sampled points.
     """
     if rotation is None:
         rotation = [0, 0, 0]
@@ -67,6 +70,13 @@ def disk(center: Union[Vector, np.ndarray, List[float]], radius: float,
         start_vec = [np.cos(np.deg2rad(start_angle)), np.sin(np.deg2rad(start_angle))]
         end_vec = [np.cos(np.deg2rad(end_angle)), np.sin(np.deg2rad(end_angle))]
 
+    if size is not None or rng is not None:
+        sampled_points = _Disk.sample_points(radius, sample_from, start_angle, end_angle,
+                                             1 if size is None else size, rng)
+        rot_mat = np.array(mathutils.Euler(rotation, 'XYZ').to_matrix())
+        locations = sampled_points @ rot_mat.T + np.array(center)
+        return locations if size is not None else locations[0]
+
     # if sampling from the circle or arc set magnitude to radius, if not - to the scaled radius
     if sample_from.lower() in ["circle", "arc"]:
         magnitude = radius
@@ -107,6 +117,33 @@ def sample_point(magnitude: float) -> np.ndarray:
 
         return sampled_point
 
+    @staticmethod
+    def sample_points(radius: float, sample_from: str, start_angle: float, end_angle: float, size: int,
+                      rng: Optional[np.random.Generator]) -> np.ndarray:
+        """ Samples multiple 3d points in the XY plane at once, with the same distribution as disk().
+
+        :param radius: The radius of the disk.
+        :param sample_from: The shape to sample from. Available: disk, circle, sector, arc.
+        :param start_angle: Start angle of the sector/arc in degrees.
+        :param end_angle: End angle of the sector/arc in degrees.
+        :param size: The number of points to sample.
+        :param rng: The random generator to use, if None the global numpy random state is used.
+        :return: The (N,3) array of sampled points.
+        """
+        random_state = rng if rng is not None else np.random
+        if sample_from in ["disk", "sector"]:
+            magnitudes = radius * np.sqrt(random_state.uniform(0, 1, size))
+        else:
+            magnitudes = np.full(size, radius, dtype=np.float64)
+
+        # The angles of the sampled directions are uniform, for sectors/arcs directly inside their angle range
+        if sample_from in ["arc", "sector"]:
+            angles = np.deg2rad(random_state.uniform(start_angle, end_angle, size))
+        else:
+            angles = random_state.uniform(0, 2 * np.pi, size)
+
+        return np.stack([magnitudes * np.cos(angles), magnitudes * np.sin(angles), np.zeros(size)], axis=1)
+
     @staticmethod
     def is_clockwise(rel_point: Union[Vector, np.ndarray, List[float]],
                      sampled_point: Union[Vector, np.ndarray, List[float]]) -> bool:
@@ -10,7 +10,8 @@
 
 def part_sphere(center: Union[Vector, np.ndarray, List[float]], radius: float, mode: str,
                 dist_above_center: float = 0.0,
-                part_sphere_dir_vector: Optional[Union[Vector, np.ndarray, List[float]]] = None) -> np.ndarray:
+                part_sphere_dir_vector: Optional[Union[Vector, np.ndarray, List[float]]] = None,
+                size: Optional[int] = None, rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """ Samples a point from the surface or from the interior of solid sphere which is split in two parts.
 
     https://math.stackexchange.com/a/87238
@@ -36,7 +37,9 @@ def part_sphere(center: Union[Vector, np.ndarray, List[float]], radius: float, m
     :param part_sphere_dir_vector: The direction in which the sphere should be split, the end point of the vector,
                                    will be in the middle of the sphere pointing towards the middle of the
                                    resulting surface. Default: [0, 0, 1].
-    :return: A random point lying inside or on the surface of a solid sphere.
+    :param size: If given, this many points are sampled at once and returned as an (N,3) array.
+    :param rng: The random generator to use, by default the global numpy random state is used.
+    :return: A random point lying inside or on the surface of a solid sphere or the (N,3) array of sampled points.
     """
     if part_sphere_dir_vector is None:
         part_sphere_dir_vector = np.array([0, 0, 1], np.float32)
@@ -47,6 +50,16 @@ def part_sphere(center: Union[Vector, np.ndarray, List[float]], radius: float, m
     if dist_above_center >= radius:
         raise ValueError("The dist_above_center value is bigger or as big as the radius!")
 
+    if size is not None or rng is not None:
+        num_samples = 1 if size is None else size
+        locations = np.empty((0, 3))
+        while len(locations) < num_samples:
+            # Sample a batch at once and only keep the points above the splitting plane
+            candidates = sphere(center, radius, mode, size=max(2 * (num_samples - len(locations)), 16), rng=rng)
+            lengths = (candidates - np.array(center)) @ part_sphere_dir_vector
+            locations = np.concatenate([locations, candidates[lengths > dist_above_center]])
+        return locations[:num_samples] if size is not None else locations[0]
+
     while True:
         location = sphere(center, radius, mode)
         # project the location onto the part_sphere_dir_vector and get the length
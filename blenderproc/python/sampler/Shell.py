@@ -1,6 +1,6 @@
 """ Samples a point from the volume between two spheres """
 
-from typing import Union, List
+from typing import Union, List, Optional
 
 import numpy as np
 from mathutils import Vector
@@ -8,7 +8,8 @@
 
 def shell(center: Union[Vector, np.ndarray, List[float]], radius_min: float, radius_max: float,
           elevation_min: float = -90, elevation_max: float = 90, azimuth_min: float = -180,
-          azimuth_max: float = 180, uniform_volume: bool = False) -> np.ndarray:
+          azimuth_max: float = 180, uniform_volume: bool = False, size: Optional[int] = None,
+          rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """
     Samples a point from the volume between two spheres (radius_min, radius_max). Optionally the spheres can
     be constraint by setting elevation and azimuth angles. E.g. if you only want to sample in the upper
@@ -23,7 +24,9 @@ def shell(center: Union[Vector, np.ndarray, List[float]], radius_min: float, rad
     :param azimuth_max: Maximum angle of azimuth in degrees. Range: [-180, 180].
     :param uniform_volume: Instead of sampling the angles and radius uniformly, sample the shell volume uniformly.
                            As a result, there will be more samples at larger radii.
-    :return: A sampled point.
+    :param size: If given, this many points are sampled at once and returned as an (N,3) array.
+    :param rng: The random generator to use, by default the global numpy random state is used.
+    :return: A sampled point or the (N,3) array of sampled points.
     """
 
     center = np.array(center)
@@ -35,6 +38,11 @@ def shell(center: Union[Vector, np.ndarray, List[float]], radius_min: float, rad
     assert azimuth_min < azimuth_max, "azimuth_min must be smaller than azimuth_max"
     assert elevation_min < elevation_max, "elevation_min must be smaller than elevation_max"
 
+    if size is not None or rng is not None:
+        positions = _Shell.sample_points(center, radius_min, radius_max, elevation_min, elevation_max, azimuth_min,
+                                         azimuth_max, uniform_volume, 1 if size is None else size, rng)
+        return positions if size is not None else positions[0]
+
     if uniform_volume:
 
         radius = radius_min + (radius_max - radius_min) * np.cbrt(np.random.rand())
@@ -68,3 +76,42 @@ def shell(center: Union[Vector, np.ndarray, List[float]], radius_min: float, rad
     position = direction_vector * radius + center
 
     return position
+
+
+class _Shell:
+
+    @staticmethod
+    def sample_points(center: np.ndarray, radius_min: float, radius_max: float, elevation_min: float,
+                      elevation_max: float, azimuth_min: float, azimuth_max: float, uniform_volume: bool, size: int,
+                      rng: Optional[np.random.Generator]) -> np.ndarray:
+        """ Samples multiple points from the shell at once, with the same distribution as shell().
+
+        :param center: Center shared by both spheres.
+        :param radius_min: Radius of the smaller sphere.
+        :param radius_max: Radius of the bigger sphere.
+        :param elevation_min: Minimum angle of elevation in degrees.
+        :param elevation_max: Maximum angle of elevation in degrees.
+        :param azimuth_min: Minimum angle of azimuth in degrees.
+        :param azimuth_max: Maximum angle of azimuth in degrees.
+        :param uniform_volume: Whether to sample the shell volume uniformly.
+        :param size: The number of points to sample.
+        :param rng: The random generator to use, if None the global numpy random state is used.
+        :return: The (N,3) array of sampled points.
+        """
+        random_state = rng if rng is not None else np.random
+        azimuth = np.deg2rad(random_state.uniform(azimuth_min, azimuth_max, size))
+        if uniform_volume:
+            radius = radius_min + (radius_max - radius_min) * np.cbrt(random_state.uniform(0, 1, size))
+            # Directions are uniformly distributed on the sphere, if the sine of their elevation is uniform, so no
+            # rejection sampling is necessary
+            sin_elevation = random_state.uniform(np.sin(np.deg2rad(elevation_min)),
+                                                 np.sin(np.deg2rad(elevation_max)), size)
+            cos_elevation = np.sqrt(1 - sin_elevation * sin_elevation)
+        else:
+            elevation = np.deg2rad(random_state.uniform(elevation_min, elevation_max, size))
+            sin_elevation, cos_elevation = np.sin(elevation), np.cos(elevation)
+            radius = random_state.uniform(radius_min, radius_max, size)
+
+        direction_vectors = np.stack([cos_elevation * np.cos(azimuth), cos_elevation * np.sin(azimuth),
+                                      sin_elevation], axis=1)
+        return direction_vectors * radius[:, None] + center
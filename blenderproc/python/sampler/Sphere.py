@@ -1,12 +1,13 @@
 """ Samples a point from the surface or from the interior of solid sphere. """
 
-from typing import Union
+from typing import Union, Optional
 
 import numpy as np
 from mathutils import Vector
 
 
-def sphere(center: Union[Vector, np.ndarray, list], radius: float, mode: str) -> np.ndarray:
+def sphere(center: Union[Vector, np.ndarray, list], radius: float, mode: str, size: Optional[int] = None,
+           rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """ Samples a point from the surface or from the interior of solid sphere.
 
     https://math.stackexchange.com/a/87238
@@ -26,9 +27,16 @@ def sphere(center: Union[Vector, np.ndarray, list], radius: float, mode: str) ->
     :param radius: The radius of the sphere.
     :param mode: Mode of sampling. Determines the geometrical structure used for sampling. Available: SURFACE (sampling
                  from the 2-sphere), INTERIOR (sampling from the 3-ball).
+    :param size: If given, this many points are sampled at once and returned as an (N,3) array.
+    :param rng: The random generator to use, by default the global numpy random state is used.
+    :return: A sampled point or the (N,3) array of sampled points.
     """
     center = np.array(center)
 
+    if size is not None or rng is not None:
+        locations = _Sphere.sample_points(center, radius, mode, 1 if size is None else size, rng)
+        return locations if size is not None else locations[0]
+
     # Sample
     direction = np.random.normal(loc=0.0, scale=1.0, size=3)
 
@@ -54,3 +62,33 @@ def sphere(center: Union[Vector, np.ndarray, list], radius: float, mode: str) ->
     location = np.array(sampled_point) + center
 
     return location
+
+
+class _Sphere:
+
+    @staticmethod
+    def sample_points(center: np.ndarray, radius: float, mode: str, size: int,
+                      rng: Optional[np.random.Generator]) -> np.ndarray:
+        """ Samples multiple points at once, with the same distribution as sphere().
+
+        :param center: Location of the center of the sphere.
+        :param radius: The radius of the sphere.
+        :param mode: Mode of sampling. Available: SURFACE, INTERIOR.
+        :param size: The number of points to sample.
+        :param rng: The random generator to use, if None the global numpy random state is used.
+        :return: The (N,3) array of sampled points.
+        """
+        random_state = rng if rng is not None else np.random
+        directions = random_state.normal(loc=0.0, scale=1.0, size=(size, 3))
+        # Check no division by zero
+        directions[np.all(directions == 0, axis=1), 0] = 1e-5
+
+        if mode == "SURFACE":
+            magnitudes = np.full(size, radius, dtype=np.float64)
+        elif mode == "INTERIOR":
+            magnitudes = radius * np.cbrt(random_state.uniform(0, 1, size))
+        else:
+            raise Exception("Unknown sampling mode: " + mode)
+
+        directions *= (magnitudes / np.linalg.norm(directions, axis=1))[:, None]
+        return directions + center
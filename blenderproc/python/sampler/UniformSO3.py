@@ -6,15 +6,24 @@
 import mathutils
 import numpy as np
 
+from blenderproc.python.utility.MathUtility import _MathUtility
 
-def uniformSO3(around_x: bool = True, around_y: bool = True, around_z: bool = True) -> np.ndarray:
+
+def uniformSO3(around_x: bool = True, around_y: bool = True, around_z: bool = True, size: Optional[int] = None,
+               rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """ Uniformly samples rotations from SO(3). Allows to limit the rotation around Blender World coordinate axes.
 
     :param around_x: Whether to rotate around X-axis.
     :param around_y: Whether to rotate around Y-axis.
     :param around_z: Whether to rotate around Z-axis.
-    :return: Sampled rotation in euler angles.
+    :param size: If given, this many rotations are sampled at once and returned as an (N,3) array.
+    :param rng: The random generator to use, by default the global numpy random state is used.
+    :return: Sampled rotation in euler angles or the (N,3) array of sampled rotations.
     """
+    if size is not None or rng is not None:
+        eulers = _UniformSO3.sample_eulers(around_x, around_y, around_z, 1 if size is None else size, rng)
+        return eulers if size is not None else eulers[0]
+
     # Uniform sampling in full SO3.
     if around_x and around_y and around_z:
         quat_rand = _UniformSO3.random_quaternion()
@@ -38,13 +47,41 @@ def random_angle():
 
 
 class _UniformSO3:
+
+    @staticmethod
+    def sample_eulers(around_x: bool, around_y: bool, around_z: bool, size: int,
+                      rng: Optional[np.random.Generator]) -> np.ndarray:
+        """ Samples multiple rotations at once, with the same distribution as uniformSO3().
+
+        :param around_x: Whether to rotate around X-axis.
+        :param around_y: Whether to rotate around Y-axis.
+        :param around_z: Whether to rotate around Z-axis.
+        :param size: The number of rotations to sample.
+        :param rng: The random generator to use, if None the global numpy random state is used.
+        :return: The (N,3) array of sampled rotations in euler angles.
+        """
+        random_state = rng if rng is not None else np.random
+        if around_x and around_y and around_z:
+            rand = random_state.uniform(0, 1, (3, size))
+            mats = _MathUtility.quaternions_to_matrices(_UniformSO3.random_quaternion(rand).T)
+        else:
+            # Concatenate the rotations around the selected axes in the order X, Y, Z
+            mats = np.broadcast_to(np.eye(3), (size, 3, 3))
+            for axis, selected in enumerate([around_x, around_y, around_z]):
+                if selected:
+                    axis_angles = np.zeros((size, 3))
+                    axis_angles[:, axis] = random_state.uniform(0, 2 * np.pi, size)
+                    mats = mats @ _MathUtility.euler_to_matrices(axis_angles)
+        return _MathUtility.matrices_to_euler(mats)
+
     @staticmethod
     def random_quaternion(rand: Optional[Union[List[float], np.ndarray]] = None) -> np.ndarray:
         """ Return uniform random unit quaternion.
 
         https://github.com/thodan/bop_toolkit/blob/master/bop_toolkit_lib/transform.py
 
-        :param rand: Three independent random variables that are uniformly distributed between 0 and 1.
+        :param rand: Three independent random variables that are uniformly distributed between 0 and 1. Each of them
+                     can also be an array, then one quaternion is returned per entry.
         :return: Unit quaternion.
         """
         if rand is None:
@@ -1,6 +1,6 @@
 """ This module provides a collection of functions to check if objects collide. """
 
-from typing import Union, Optional, Dict, Tuple, List, Callable
+from typing import Union, Optional, Dict, Tuple, List, Callable, NamedTuple
 
 import mathutils
 import numpy as np
@@ -9,31 +9,333 @@
 from blenderproc.python.types.MeshObjectUtility import MeshObject
 
 
+class CollisionIndex:
+    """ Broad phase of the collision checks, which keeps the world aligned bounding boxes of objects.
+
+    The bounding boxes are stored in one array, so finding the objects whose bounding boxes overlap with the one of
+    a given object is a single vectorized comparison, only these objects are then checked with the BVH trees.
+    The bounding box of an object is only recomputed, when update() is called for it or sync() detects that its pose
+    changed. An index can be shared between multiple calls of the pose samplers, as long as objects which are moved
+    in between are updated.
+
+    Usage:
+
+    .. code-block:: python
+
+        collision_index = CollisionIndex()
+        bproc.object.sample_poses(tools, sample_pose_func, collision_index=collision_index)
+        bproc.object.sample_poses_on_surface(workpieces, table, sample_pose_func, collision_index=collision_index)
+    """
+
+    def __init__(self, objects: Optional[List[MeshObject]] = None):
+        """
+        :param objects: The objects to add to the index right away, all other objects are added on their first use.
+        """
+        self._slots: Dict[MeshObject, int] = {}
+        self._objects: List[MeshObject] = []
+        self._mins = np.empty((0, 3))
+        self._maxs = np.empty((0, 3))
+        self._local2world_mats = np.empty((0, 4, 4))
+        if objects is not None:
+            self.update(objects)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, obj: MeshObject) -> bool:
+        return obj in self._slots
+
+    def update(self, objects: Union[MeshObject, List[MeshObject]]):
+        """ Recomputes the bounding boxes of the given objects, this has to be called after they have been moved.
+
+        Objects which are not part of the index yet are added.
+
+        :param objects: The object or the list of objects to update.
+        """
+        if isinstance(objects, MeshObject):
+            objects = [objects]
+        for obj in objects:
+            self._set_bound_box(obj, obj.get_local2world_mat())
+
+    def sync(self, objects: List[MeshObject]):
+        """ Updates all given objects, whose pose has changed since their bounding box was computed.
+
+        Changes of the mesh itself are not detected, for these objects update() has to be called.
+
+        :param objects: The objects to check.
+        """
+        for obj in objects:
+            local2world = obj.get_local2world_mat()
+            slot = self._slots.get(obj)
+            if slot is None or not np.array_equal(self._local2world_mats[slot], local2world):
+                self._set_bound_box(obj, local2world)
+
+    def remove(self, obj: MeshObject):
+        """ Removes the given object from the index.
+
+        :param obj: The object to remove.
+        """
+        slot = self._slots.pop(obj, None)
+        if slot is not None:
+            # Move the last entry into the free slot
+            last = len(self._objects) - 1
+            if slot != last:
+                self._objects[slot] = self._objects[last]
+                self._slots[self._objects[slot]] = slot
+                self._mins[slot] = self._mins[last]
+                self._maxs[slot] = self._maxs[last]
+                self._local2world_mats[slot] = self._local2world_mats[last]
+            self._objects.pop()
+
+    def bound_box_of(self, obj: MeshObject) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the world aligned bounding box of the given object, it is computed if the object is not indexed.
+
+        :param obj: The object.
+        :return: The minimum and the maximum point of the bounding box.
+        """
+        if obj not in self._slots:
+            self.update(obj)
+        slot = self._slots[obj]
+        return self._mins[slot], self._maxs[slot]
+
+    def overlapping_objects(self, obj: MeshObject, objects_to_check_against: List[MeshObject]) -> List[MeshObject]:
+        """ Returns the objects whose bounding boxes overlap with the bounding box of the given object.
+
+        Objects which are not part of the index yet are added, the object itself is never returned.
+
+        :param obj: The object to check.
+        :param objects_to_check_against: The objects, which should be considered.
+        :return: The objects of objects_to_check_against, whose bounding boxes overlap with the one of obj.
+        """
+        min_obj, max_obj = self.bound_box_of(obj)
+        slots = []
+        for collision_obj in objects_to_check_against:
+            slot = self._slots.get(collision_obj)
+            if slot is None:
+                self.update(collision_obj)
+                slot = self._slots[collision_obj]
+            slots.append(slot)
+        if not slots:
+            return []
+        slots = np.array(slots)
+        # Bounding boxes which only touch each other are also overlapping, as in check_bb_intersection()
+        overlapping = np.all((self._mins[slots] <= max_obj) & (self._maxs[slots] >= min_obj), axis=1)
+        return [self._objects[slot] for slot in slots[overlapping] if self._objects[slot] != obj]
+
+    def _set_bound_box(self, obj: MeshObject, local2world: np.ndarray):
+        """ Computes the world aligned bounding box of the object and stores it.
+
+        :param obj: The object.
+        :param local2world: The current local2world matrix of the object.
+        """
+        slot = self._slots.get(obj)
+        if slot is None:
+            slot = len(self._objects)
+            self._slots[obj] = slot
+            self._objects.append(obj)
+            if slot == len(self._mins):
+                # Grow the arrays by doubling their capacity
+                capacity = max(2 * len(self._mins), 16)
+                self._mins = np.concatenate([self._mins, np.empty((capacity - slot, 3))])
+                self._maxs = np.concatenate([self._maxs, np.empty((capacity - slot, 3))])
+                self._local2world_mats = np.concatenate([self._local2world_mats, np.empty((capacity - slot, 4, 4))])
+
+        corners = np.array(obj.get_bound_box(local_coords=True)) @ local2world[:3, :3].T + local2world[:3, 3]
+        self._mins[slot] = np.min(corners, axis=0)
+        self._maxs[slot] = np.max(corners, axis=0)
+        self._local2world_mats[slot] = local2world
+
+
+class _BvhCacheEntry(NamedTuple):
+    """ The cached data of one mesh """
+    tree: mathutils.bvhtree.BVHTree
+    vertices: np.ndarray
+    triangles: List[List[int]]
+    num_polygons: int
+
+
+class BvhCache:
+    """ Caches the BVH trees of meshes in their local space, so moving rigid objects does not require rebuilding them.
+
+    The trees are keyed by the mesh datablock, so all objects which share a mesh also share its tree.
+    Rays and points are transformed into the local space of the object. To check if two objects overlap, the world
+    space trees of both objects are used, which are kept per object until it is moved, so a moved object is only
+    transformed once per pose and not for every object it is checked against.
+    A tree is rebuilt automatically if the number of vertices or triangles of its mesh changes, after any other
+    change of a mesh, invalidate() has to be called.
+
+    Usage:
+
+    .. code-block:: python
+
+        bvh_cache = BvhCache()
+        for obj in objects_to_sample:
+            obj.set_location(np.random.uniform(-1, 1, 3))
+            # The tree of the table is reused, the moved object is only transformed once per pose
+            collision = bvh_cache.overlap(obj, table)
+    """
+
+    def __init__(self):
+        # Maps the pointers of the mesh datablocks to their cached data
+        self._entries: Dict[int, _BvhCacheEntry] = {}
+        # Maps the pointers of the objects to their world space tree and the local2world matrix and entry it was
+        # built from
+        self._world_trees: Dict[int, Tuple[np.ndarray, _BvhCacheEntry, mathutils.bvhtree.BVHTree]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def local_tree(self, obj: MeshObject) -> mathutils.bvhtree.BVHTree:
+        """ Returns the bvh tree of the mesh of the given object in its local space.
+
+        :param obj: The mesh object.
+        :return: The bvh tree.
+        """
+        return self._entry(obj).tree
+
+    def world_tree(self, obj: MeshObject) -> mathutils.bvhtree.BVHTree:
+        """ Returns the bvh tree of the given object in world space.
+
+        The tree is only rebuilt, if the object has been moved or its local tree has been rebuilt since the last call.
+
+        :param obj: The mesh object.
+        :return: The bvh tree.
+        """
+        entry = self._entry(obj)
+        local2world = obj.get_local2world_mat()
+        key = obj.blender_obj.as_pointer()
+        world_tree = self._world_trees.get(key)
+        if world_tree is None or world_tree[1] is not entry or not np.array_equal(world_tree[0], local2world):
+            vertices = entry.vertices @ local2world[:3, :3].T + local2world[:3, 3]
+            tree = mathutils.bvhtree.BVHTree.FromPolygons(vertices.tolist(), entry.triangles, all_triangles=True)
+            world_tree = (local2world, entry, tree)
+            self._world_trees[key] = world_tree
+        return world_tree[2]
+
+    def invalidate(self, obj: MeshObject):
+        """ Removes the tree of the mesh of the given object, this has to be called after the mesh has been edited.
+
+        :param obj: The mesh object.
+        """
+        self._entries.pop(obj.get_mesh().as_pointer(), None)
+        self._world_trees.pop(obj.blender_obj.as_pointer(), None)
+
+    def overlap(self, obj1: MeshObject, obj2: MeshObject) -> bool:
+        """ Checks whether the surfaces of the two objects intersect.
+
+        :param obj1: The first mesh object.
+        :param obj2: The second mesh object.
+        :return: True, if they are intersecting.
+        """
+        return len(self.world_tree(obj1).overlap(self.world_tree(obj2))) > 0
+
+    def is_point_inside(self, obj: MeshObject, point: Union[Vector, np.ndarray]) -> bool:
+        """ Checks whether the given point is inside the given object.
+
+        This only works if the given object is watertight and has correct normals.
+
+        :param obj: The mesh object.
+        :param point: The point in world coordinates.
+        :return: True, if the point is inside the object.
+        """
+        local2world = obj.get_local2world_mat()
+        local_point = Vector(np.linalg.solve(local2world, np.append(np.array(point), 1))[:3])
+        nearest, normal, _, _ = self.local_tree(obj).find_nearest(local_point)
+        if nearest is None:
+            return False
+        # The sign of the dot product between direction and normal vector does not change by the transformation
+        return (nearest - local_point).dot(normal) >= 0.0
+
+    def ray_cast(self, obj: MeshObject, origin: Union[Vector, np.ndarray], direction: Union[Vector, np.ndarray],
+                 distance: Optional[float] = None) \
+            -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[int], Optional[float]]:
+        """ Casts a ray against the given object.
+
+        :param obj: The mesh object.
+        :param origin: The origin of the ray in world coordinates.
+        :param direction: The direction of the ray in world coordinates.
+        :param distance: The maximum distance to search for hits, if None is given the distance is not limited.
+        :return: The location and normal of the hit in world coordinates, the index of the hit polygon of the local
+                 tree and the distance of the hit in world coordinates. All of them are None, if nothing was hit.
+        """
+        local2world = obj.get_local2world_mat()
+        world2local = np.linalg.inv(local2world)
+        direction = np.array(direction, dtype=np.float64)
+        direction /= np.linalg.norm(direction)
+        local_origin = world2local[:3, :3] @ np.array(origin) + world2local[:3, 3]
+        local_direction = world2local[:3, :3] @ direction
+        # The length of the transformed unit direction converts distances between both spaces
+        scale = np.linalg.norm(local_direction)
+        if distance is None:
+            location, normal, index, local_distance = self.local_tree(obj).ray_cast(Vector(local_origin),
+                                                                                    Vector(local_direction))
+        else:
+            location, normal, index, local_distance = self.local_tree(obj).ray_cast(Vector(local_origin),
+                                                                                    Vector(local_direction),
+                                                                                    distance * scale)
+        if location is None:
+            return None, None, None, None
+        world_normal = world2local[:3, :3].T @ np.array(normal)
+        return (local2world[:3, :3] @ np.array(location) + local2world[:3, 3],
+                world_normal / np.linalg.norm(world_normal), index, local_distance / scale)
+
+    def _entry(self, obj: MeshObject) -> _BvhCacheEntry:
+        """ Returns the cached data of the mesh of the given object and builds it, if necessary.
+
+        :param obj: The mesh object.
+        :return: The cached data.
+        """
+        mesh = obj.get_mesh()
+        entry = self._entries.get(mesh.as_pointer())
+        if entry is None or len(entry.vertices) != len(mesh.vertices) or entry.num_polygons != len(mesh.polygons):
+            vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+            mesh.vertices.foreach_get("co", vertices)
+            vertices = vertices.reshape(-1, 3)
+            mesh.calc_loop_triangles()
+            triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+            mesh.loop_triangles.foreach_get("vertices", triangles)
+            triangles = triangles.reshape(-1, 3).tolist()
+            tree = mathutils.bvhtree.BVHTree.FromPolygons(vertices.tolist(), triangles, all_triangles=True)
+            entry = _BvhCacheEntry(tree, vertices, triangles, len(mesh.polygons))
+            self._entries[mesh.as_pointer()] = entry
+        return entry
+
+
 class CollisionUtility:
     """
     This class provides utility functions to check if two objects intersect with each other.
     """
 
     @staticmethod
-    def check_intersections(obj: MeshObject, bvh_cache: Optional[Dict[str, mathutils.bvhtree.BVHTree]],
+    def check_intersections(obj: MeshObject,
+                            bvh_cache: Optional[Union[Dict[str, mathutils.bvhtree.BVHTree], BvhCache]],
                             objects_to_check_against: List[MeshObject],
-                            list_of_objects_with_no_inside_check: List[MeshObject]):
+                            list_of_objects_with_no_inside_check: List[MeshObject],
+                            collision_index: Optional[CollisionIndex] = None):
         """ Checks if an object intersects with any object given in the list.
 
         The bvh_cache adds all current objects to the bvh tree, which increases the speed.
+        If a collision_index is given, its bounding boxes are used to find the objects which have to be checked.
 
         If an object is already in the cache it is removed, before performing the check.
 
         :param obj: Object which should be checked. Type: :class:`bpy.types.Object`
         :param bvh_cache: Dict of all the bvh trees, removes the `obj` from the cache before adding it again. \
-                          Type: :class:`dict`
+                          Or a BvhCache, whose trees stay valid when objects move. \
+                          Type: :class:`dict` or :class:`BvhCache`
         :param objects_to_check_against: List of objects which the object is checked again \
                                          Type: :class:`list`
         :param list_of_objects_with_no_inside_check: List of objects on which no inside check is performed. \
                                                      This check is only done for the objects in \
                                                      `objects_to_check_against`. Type: :class:`list`
+        :param collision_index: The broad phase index, in which obj has to be up to date. Objects which are not \
+                                indexed yet are added. Type: :class:`CollisionIndex`
         :return: Type: :class:`bool`, True if no collision was found, false if at least one collision was found
         """
+        if collision_index is not None:
+            # Only the objects whose bounding boxes overlap have to be checked
+            objects_to_check_against = collision_index.overlapping_objects(obj, objects_to_check_against)
+
         no_collision = True
         # Now check for collisions
         for collision_obj in objects_to_check_against:
@@ -41,7 +343,7 @@ def check_intersections(obj: MeshObject, bvh_cache: Optional[Dict[str, mathutils
             if collision_obj == obj:
                 continue
             # First check if bounding boxes collides
-            intersection = CollisionUtility.check_bb_intersection(obj, collision_obj)
+            intersection = collision_index is not None or CollisionUtility.check_bb_intersection(obj, collision_obj)
             # if they do
             if intersection:
                 skip_inside_check = collision_obj in list_of_objects_with_no_inside_check
@@ -114,8 +416,8 @@ def is_overlapping_1D(x_min_1, x_max_1, x_min_2, x_max_2):
 
     @staticmethod
     def check_mesh_intersection(obj1: MeshObject, obj2: MeshObject, skip_inside_check: bool = False,
-                                bvh_cache: Optional[Dict[str, mathutils.bvhtree.BVHTree]] = None) \
-            -> Tuple[bool, Dict[str, mathutils.bvhtree.BVHTree]]:
+                                bvh_cache: Optional[Union[Dict[str, mathutils.bvhtree.BVHTree], BvhCache]] = None) \
+            -> Tuple[bool, Union[Dict[str, mathutils.bvhtree.BVHTree], BvhCache]]:
         """
         Checks if the two objects are intersecting.
 
@@ -129,6 +431,7 @@ def check_mesh_intersection(obj1: MeshObject, obj2: MeshObject, skip_inside_chec
         :param obj2: object 2 to check for intersection, must be a mesh
         :param skip_inside_check: Disables checking whether one object is completely inside the other.
         :param bvh_cache: Dict of all the bvh trees, removes the `obj` from the cache before adding it again.
+                          If a BvhCache is given instead, its local trees are used, which stay valid when objects move.
         :return: True, if they are intersecting
         """
 
@@ -139,6 +442,10 @@ def check_mesh_intersection(obj1: MeshObject, obj2: MeshObject, skip_inside_chec
         if len(obj1.get_mesh().vertices) == 0 or len(obj2.get_mesh().vertices) == 0:
             return False, bvh_cache
 
+        if isinstance(bvh_cache, BvhCache):
+            return CollisionUtility._check_mesh_intersection_with_local_trees(obj1, obj2, skip_inside_check,
+                                                                              bvh_cache), bvh_cache
+
         # create bvhtree for obj1
         if obj1.get_name() not in bvh_cache:
             obj1_BVHtree = obj1.create_bvh_tree()
@@ -179,6 +486,32 @@ def check_mesh_intersection(obj1: MeshObject, obj2: MeshObject, skip_inside_chec
 
         return inter, bvh_cache
 
+    @staticmethod
+    def _check_mesh_intersection_with_local_trees(obj1: MeshObject, obj2: MeshObject, skip_inside_check: bool,
+                                                  bvh_cache: BvhCache) -> bool:
+        """ Checks if the two objects are intersecting, using the local trees of the given cache.
+
+        :param obj1: object 1 to check for intersection, must be a mesh
+        :param obj2: object 2 to check for intersection, must be a mesh
+        :param skip_inside_check: Disables checking whether one object is completely inside the other.
+        :param bvh_cache: The cache of the local bvh trees.
+        :return: True, if they are intersecting
+        """
+        if bvh_cache.overlap(obj1, obj2):
+            return True
+        if skip_inside_check:
+            return False
+
+        for outer_obj, inner_obj in [(obj1, obj2), (obj2, obj1)]:
+            if bvh_cache.is_point_inside(outer_obj, Matrix(inner_obj.get_local2world_mat()) @
+                                         inner_obj.get_mesh().vertices[0].co):
+                print("Warning: Detected that " + inner_obj.get_name() + " is completely inside " +
+                      outer_obj.get_name() + ". This might be wrong, if " + outer_obj.get_name() +
+                      " is not water tight or has incorrect normals. If that is the case, consider setting "
+                      "skip_inside_check to True.")
+                return True
+        return False
+
     @staticmethod
     def is_point_inside_object(obj: MeshObject, obj_bvh_tree: mathutils.bvhtree.BVHTree,
                                point: Union[Vector, np.ndarray]) -> bool:
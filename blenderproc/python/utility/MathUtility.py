@@ -105,6 +105,114 @@ def build_transformation_mat(translation: Union[np.ndarray, List[float], Vector]
     return mat
 
 
+def build_transformation_mats(translations: Union[np.ndarray, List[List[float]]],
+                              rotations: Union[np.ndarray, List[List[float]], List[List[List[float]]]]) -> np.ndarray:
+    """ Build multiple transformation matrices from translation and rotation parts at once.
+
+    This is the batch counterpart of build_transformation_mat().
+
+    :param translations: An (N,3) array of translations.
+    :param rotations: An (N,3,3) array of rotation matrices or an (N,3) array of XYZ Euler angles.
+    :return: The (N,4,4) transformation matrices.
+    """
+    translations = np.asarray(translations, dtype=np.float64)
+    rotations = np.asarray(rotations, dtype=np.float64)
+
+    if translations.ndim != 2 or translations.shape[1] != 3:
+        raise RuntimeError(f"Translations have invalid shape: {translations.shape}. Must be (N,3).")
+    if rotations.shape[0] != translations.shape[0]:
+        raise RuntimeError(f"The number of rotations {rotations.shape[0]} does not match the number of "
+                           f"translations {translations.shape[0]}.")
+
+    mats = np.zeros((translations.shape[0], 4, 4))
+    mats[:, 3, 3] = 1
+    mats[:, :3, 3] = translations
+    if rotations.shape[1:] == (3, 3):
+        mats[:, :3, :3] = rotations
+    elif rotations.shape[1:] == (3,):
+        mats[:, :3, :3] = _MathUtility.euler_to_matrices(rotations)
+    else:
+        raise RuntimeError(f"Rotations have invalid shape: {rotations.shape}. Must be rotation matrices of shape "
+                           f"(N,3,3) or Euler angles of shape (N,3).")
+
+    return mats
+
+
+class _MathUtility:
+
+    # The threshold, which blender uses to detect a gimbal lock
+    euler_hypot_epsilon = 0.0000375
+
+    @staticmethod
+    def euler_to_matrices(eulers: np.ndarray) -> np.ndarray:
+        """ Converts XYZ Euler angles into rotation matrices, the same way as mathutils.Euler.to_matrix() does.
+
+        :param eulers: An (N,3) array of XYZ Euler angles.
+        :return: The (N,3,3) rotation matrices.
+        """
+        cos_x, cos_y, cos_z = np.cos(eulers).T
+        sin_x, sin_y, sin_z = np.sin(eulers).T
+
+        # R = R_z @ R_y @ R_x
+        mats = np.empty((len(eulers), 3, 3))
+        mats[:, 0, 0] = cos_y * cos_z
+        mats[:, 0, 1] = sin_x * sin_y * cos_z - cos_x * sin_z
+        mats[:, 0, 2] = cos_x * sin_y * cos_z + sin_x * sin_z
+        mats[:, 1, 0] = cos_y * sin_z
+        mats[:, 1, 1] = sin_x * sin_y * sin_z + cos_x * cos_z
+        mats[:, 1, 2] = cos_x * sin_y * sin_z - sin_x * cos_z
+        mats[:, 2, 0] = -sin_y
+        mats[:, 2, 1] = sin_x * cos_y
+        mats[:, 2, 2] = cos_x * cos_y
+        return mats
+
+    @staticmethod
+    def matrices_to_euler(mats: np.ndarray) -> np.ndarray:
+        """ Converts rotation matrices into XYZ Euler angles, the same way as mathutils.Matrix.to_euler() does.
+
+        Out of the two possible solutions, the one with the smaller sum of absolute angles is chosen.
+
+        :param mats: The (N,3,3) rotation matrices.
+        :return: An (N,3) array of XYZ Euler angles.
+        """
+        cos_y = np.hypot(mats[:, 0, 0], mats[:, 1, 0])
+        eulers = np.stack([np.arctan2(mats[:, 2, 1], mats[:, 2, 2]),
+                           np.arctan2(-mats[:, 2, 0], cos_y),
+                           np.arctan2(mats[:, 1, 0], mats[:, 0, 0])], axis=1)
+        flipped_eulers = np.stack([np.arctan2(-mats[:, 2, 1], -mats[:, 2, 2]),
+                                   np.arctan2(-mats[:, 2, 0], -cos_y),
+                                   np.arctan2(-mats[:, 1, 0], -mats[:, 0, 0])], axis=1)
+        use_flipped = np.abs(flipped_eulers).sum(axis=1) < np.abs(eulers).sum(axis=1)
+        eulers[use_flipped] = flipped_eulers[use_flipped]
+
+        # In a gimbal lock the rotation around x and z can not be separated, so it is put completely into x
+        gimbal_lock = cos_y <= _MathUtility.euler_hypot_epsilon
+        eulers[gimbal_lock, 0] = np.arctan2(-mats[gimbal_lock, 1, 2], mats[gimbal_lock, 1, 1])
+        eulers[gimbal_lock, 1] = np.arctan2(-mats[gimbal_lock, 2, 0], cos_y[gimbal_lock])
+        eulers[gimbal_lock, 2] = 0
+        return eulers
+
+    @staticmethod
+    def quaternions_to_matrices(quaternions: np.ndarray) -> np.ndarray:
+        """ Converts unit quaternions into rotation matrices.
+
+        :param quaternions: An (N,4) array of unit quaternions in wxyz order.
+        :return: The (N,3,3) rotation matrices.
+        """
+        w, x, y, z = quaternions.T
+        mats = np.empty((len(quaternions), 3, 3))
+        mats[:, 0, 0] = 1 - 2 * (y * y + z * z)
+        mats[:, 0, 1] = 2 * (x * y - w * z)
+        mats[:, 0, 2] = 2 * (x * z + w * y)
+        mats[:, 1, 0] = 2 * (x * y + w * z)
+        mats[:, 1, 1] = 1 - 2 * (x * x + z * z)
+        mats[:, 1, 2] = 2 * (y * z - w * x)
+        mats[:, 2, 0] = 2 * (x * z - w * y)
+        mats[:, 2, 1] = 2 * (y * z + w * x)
+        mats[:, 2, 2] = 1 - 2 * (x * x + y * y)
+        return mats
+
+
 class MathUtility:
     """
     Math utility class
@@ -0,0 +1,229 @@
+"""Measures where the time of a generation run goes, stage by stage and frame by frame."""
+
+import atexit
+from collections import defaultdict, deque
+from contextlib import ContextDecorator
+import json
+import os
+import threading
+import time
+from types import TracebackType
+from typing import Deque, Dict, List, Optional, Sequence, Type
+
+import numpy as np
+
+
+class MetricsRegistry:
+    """ Records the wall and cpu time of named stages, e.g. randomization, rendering or writing.
+
+    The stages are measured via stage() or measure_stage(), which can be used as context manager or as decorator.
+    When end_frame() is called, the times of all stages measured since the last call are written as one line into
+    a JSON-lines metrics file. Running percentiles of every stage and the images per second are kept in memory and
+    summarized in close().
+
+    Stages can be nested, e.g. the "exr_decode" stage inside render() also counts towards an outer "render" stage.
+    The cpu time is the cpu time of the whole process, so it includes all render threads. Stages measured inside
+    forked worker processes, e.g. of an AsyncWriterPool, are recorded into the copy of the registry in the worker
+    and are therefore not part of the metrics.
+
+    Usage:
+
+    .. code-block:: python
+
+        metrics = MetricsRegistry(os.path.join(output_dir, "metrics.jsonl")).activate()
+        for ...:
+            with metrics.stage("randomization"):
+                ...
+            data = bproc.renderer.render()
+            metrics.end_frame(num_images=len(data["colors"]))
+        metrics.close()
+    """
+
+    def __init__(self, metrics_file_path: Optional[str] = None, window_size: int = 1000,
+                 summary_at_exit: bool = True):
+        """
+        :param metrics_file_path: The JSON-lines file, the metrics of every frame are appended to. If None, the
+                                  metrics are only kept in memory.
+        :param window_size: The number of recent frames used for the running percentiles.
+        :param summary_at_exit: If True, close() is called automatically when the python process exits.
+        """
+        self._metrics_file_path = metrics_file_path
+        self._wall_times: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window_size))
+        self._cpu_times: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window_size))
+        self._total_wall_times: Dict[str, float] = defaultdict(float)
+        # The stage times measured since the last end_frame() call
+        self._current_frame: Dict[str, Dict[str, float]] = {}
+        self._num_frames = 0
+        self._num_images = 0
+        self._start_time = time.perf_counter()
+        self._closed = False
+        # Stages may also be recorded from writer threads
+        self._lock = threading.Lock()
+
+        if metrics_file_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(metrics_file_path)), exist_ok=True)
+        if summary_at_exit:
+            atexit.register(self.close)
+
+    def activate(self) -> "MetricsRegistry":
+        """ Makes this the registry, which measure_stage() records to. Also used by BlenderProc internally.
+
+        :return: This registry.
+        """
+        _MetricsUtility.active_registry = self
+        return self
+
+    def stage(self, stage_name: str) -> "StageTimer":
+        """ Returns a timer, which records the time of the given stage into this registry.
+
+        :param stage_name: The name of the stage.
+        :return: A timer, which can be used as context manager or as decorator.
+        """
+        return StageTimer(stage_name, self)
+
+    def record(self, stage_name: str, wall_time: float, cpu_time: float):
+        """ Adds a measured time to the given stage of the current frame.
+
+        :param stage_name: The name of the stage.
+        :param wall_time: The measured wall time in seconds.
+        :param cpu_time: The measured cpu time in seconds.
+        """
+        with self._lock:
+            times = self._current_frame.setdefault(stage_name, {"wall": 0.0, "cpu": 0.0})
+            times["wall"] += wall_time
+            times["cpu"] += cpu_time
+
+    def end_frame(self, num_images: int = 1, **extra_values):
+        """ Finishes the current frame and writes its stage times into the metrics file.
+
+        :param num_images: The number of images produced in this frame, e.g. the batch size.
+        :param extra_values: Additional values to store in the metrics record of this frame.
+        """
+        with self._lock:
+            for stage_name, times in self._current_frame.items():
+                self._wall_times[stage_name].append(times["wall"])
+                self._cpu_times[stage_name].append(times["cpu"])
+                self._total_wall_times[stage_name] += times["wall"]
+            self._num_images += num_images
+
+            if self._metrics_file_path is not None:
+                record = {"frame": self._num_frames, "images": num_images, "time": time.time(),
+                          "stages": self._current_frame, **extra_values}
+                with open(self._metrics_file_path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(record) + "\n")
+            self._num_frames += 1
+            self._current_frame = {}
+
+    def images_per_second(self) -> float:
+        """ Returns the number of images produced per second since the registry was created.
+
+        :return: The images per second.
+        """
+        elapsed_time = time.perf_counter() - self._start_time
+        return self._num_images / elapsed_time if elapsed_time > 0 else 0.0
+
+    def percentiles(self, stage_name: str, percentiles: Sequence[float] = (50, 90, 99),
+                    cpu_time: bool = False) -> Dict[float, float]:
+        """ Returns the running percentiles of the time per frame of the given stage.
+
+        :param stage_name: The name of the stage.
+        :param percentiles: The percentiles to compute, in the range [0, 100].
+        :param cpu_time: If True, the cpu time instead of the wall time is used.
+        :return: A dict mapping every percentile to its time in seconds.
+        """
+        times = (self._cpu_times if cpu_time else self._wall_times).get(stage_name)
+        if not times:
+            return {percentile: 0.0 for percentile in percentiles}
+        return dict(zip(percentiles, np.percentile(np.array(times), percentiles).tolist()))
+
+    def summary(self) -> str:
+        """ Returns a table with the percentiles and the share of the total time of every stage.
+
+        :return: The summary as text.
+        """
+        lines = [f"Produced {self._num_images} images in {self._num_frames} frames "
+                 f"({self.images_per_second():.3f} images/sec)",
+                 f"{'stage':<24}{'p50 [s]':>10}{'p90 [s]':>10}{'p99 [s]':>10}{'cpu p50':>10}{'total [s]':>12}"]
+        for stage_name in sorted(self._total_wall_times, key=self._total_wall_times.get, reverse=True):
+            wall = self.percentiles(stage_name)
+            cpu = self.percentiles(stage_name, (50,), cpu_time=True)
+            lines.append(f"{stage_name:<24}{wall[50]:>10.3f}{wall[90]:>10.3f}{wall[99]:>10.3f}{cpu[50]:>10.3f}"
+                         f"{self._total_wall_times[stage_name]:>12.3f}")
+        return "\n".join(lines)
+
+    def close(self):
+        """ Finishes a not yet ended frame, prints the summary and appends it to the metrics file. """
+        if self._closed:
+            return
+        self._closed = True
+        if self._current_frame:
+            self.end_frame(num_images=0)
+        if _MetricsUtility.active_registry is self:
+            _MetricsUtility.active_registry = None
+        if self._num_frames == 0:
+            return
+
+        print(self.summary())
+        if self._metrics_file_path is not None:
+            record = {"summary": True, "frames": self._num_frames, "images": self._num_images,
+                      "images_per_second": self.images_per_second(),
+                      "stages": {stage_name: {"total_wall": self._total_wall_times[stage_name],
+                                              "wall_percentiles": self.percentiles(stage_name),
+                                              "cpu_percentiles": self.percentiles(stage_name, cpu_time=True)}
+                                 for stage_name in self._total_wall_times}}
+            with open(self._metrics_file_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+
+
+class StageTimer(ContextDecorator):
+    """ Measures the wall and cpu time of a block or function and records it as the given stage.
+
+    Usage: with StageTimer('render'): or @StageTimer('render')
+
+    When used as decorator, every call of the function is measured by its own copy of the timer, so decorated
+    functions can also be called from multiple threads.
+    """
+
+    def __init__(self, stage_name: str, registry: Optional[MetricsRegistry] = None):
+        """
+        :param stage_name: The name of the stage.
+        :param registry: The registry to record to. If None, the active registry at the time of entering the block
+                         is used. If there is none, nothing is measured.
+        """
+        self.stage_name = stage_name
+        self._registry = registry
+        # A stack, so the same timer can also be used for recursive or nested calls
+        self._starts: List[tuple] = []
+
+    def __enter__(self) -> "StageTimer":
+        registry = self._registry if self._registry is not None else _MetricsUtility.active_registry
+        if registry is not None:
+            self._starts.append((registry, time.perf_counter(), time.process_time()))
+        else:
+            self._starts.append((None, 0.0, 0.0))
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        registry, wall_start, cpu_start = self._starts.pop()
+        if registry is not None:
+            registry.record(self.stage_name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    def _recreate_cm(self) -> "StageTimer":
+        # Called by ContextDecorator for every call of a decorated function
+        return StageTimer(self.stage_name, self._registry)
+
+
+def measure_stage(stage_name: str) -> StageTimer:
+    """ Measures the given stage in the active MetricsRegistry. Does nothing, if no registry has been activated.
+
+    :param stage_name: The name of the stage.
+    :return: A timer, which can be used as context manager or as decorator.
+    """
+    return StageTimer(stage_name)
+
+
+class _MetricsUtility:
+    # The registry measure_stage() records to
+    active_registry: Optional[MetricsRegistry] = None
@@ -0,0 +1,209 @@
+"""Allows to run the writers in background worker processes, while blender continues rendering."""
+
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from types import TracebackType
+from typing import Any, Callable, Deque, List, Optional, Tuple, Type
+
+import numpy as np
+
+
+class AsyncWriterPool:
+    """ A bounded pool of worker processes, which runs writer functions like the encoding of color images or
+    annotations, while the next frames are already rendered.
+
+    Large numpy arrays given to submit() are handed over to the workers via shared memory. If more than
+    max_pending jobs are queued, submit() blocks until the oldest job has finished, which keeps the memory bounded
+    when the writers are slower than the renderer.
+
+    The workers are forked from the blender process, so the submitted functions must not use the blender API. On
+    platforms without fork, threads are used instead.
+
+    Usage:
+
+    .. code-block:: python
+
+        with AsyncWriterPool(num_workers=4) as writer_pool:
+            for ...:
+                writer_pool.submit(write_function, data)
+    """
+
+    def __init__(self, num_workers: int = 2, max_pending: Optional[int] = None,
+                 shared_memory_min_bytes: int = 65536):
+        """
+        :param num_workers: The number of worker processes.
+        :param max_pending: The maximum number of submitted jobs which have not finished yet. If None,
+                            2 * num_workers is used.
+        :param shared_memory_min_bytes: Numpy arrays of at least this size are passed via shared memory instead of
+                                        being pickled.
+        """
+        if num_workers < 1:
+            raise ValueError(f"The number of workers has to be at least one, not {num_workers}")
+        self._max_pending = 2 * num_workers if max_pending is None else max(1, max_pending)
+        self._shared_memory_min_bytes = shared_memory_min_bytes
+        self._use_processes = "fork" in multiprocessing.get_all_start_methods()
+        if self._use_processes:
+            # Start the resource tracker before forking, so the workers share it with this process and attaching to
+            # a shared memory block inside a worker does not register it at a second tracker
+            resource_tracker.ensure_running()
+            self._executor: Executor = ProcessPoolExecutor(max_workers=num_workers,
+                                                           mp_context=multiprocessing.get_context("fork"))
+            # The executor only forks on the first submit, at which point blender might already run its render
+            # threads, so fork all workers right away by waiting for one empty job per worker
+            wait([self._executor.submit(_start_worker) for _ in range(num_workers)])
+        else:
+            print("Warning: fork is not available on this platform, the AsyncWriterPool uses threads instead.")
+            self._executor = ThreadPoolExecutor(max_workers=num_workers)
+        self._pending: Deque[Future] = deque()
+
+    def __enter__(self) -> "AsyncWriterPool":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        self.close()
+
+    @property
+    def copies_arguments(self) -> bool:
+        """ Returns whether the arguments are copied on submit(), so the caller may overwrite them right afterwards.
+
+        :return: True if the workers are processes, False if they are threads sharing the arguments.
+        """
+        return self._use_processes
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """ Runs the given function in one of the workers.
+
+        Blocks if there are already max_pending unfinished jobs.
+
+        :param fn: The function to run. It has to be defined on module level and must not use the blender API.
+        :param args: The positional arguments of the function.
+        :param kwargs: The keyword arguments of the function.
+        :return: The future of the job.
+        """
+        # Apply backpressure: wait until there is space for one more job
+        self._remove_finished_jobs()
+        while len(self._pending) >= self._max_pending:
+            wait(self._pending, return_when=FIRST_COMPLETED)
+            self._remove_finished_jobs()
+
+        if self._use_processes:
+            shared_blocks: List[shared_memory.SharedMemory] = []
+            args = _SharedArrayUtility.share(args, shared_blocks, self._shared_memory_min_bytes)
+            kwargs = _SharedArrayUtility.share(kwargs, shared_blocks, self._shared_memory_min_bytes)
+            future = self._executor.submit(_SharedArrayUtility.run_with_shared_arrays, fn, args, kwargs)
+            # Release the shared memory as soon as the job is done
+            future.add_done_callback(lambda _: _SharedArrayUtility.release(shared_blocks))
+        else:
+            future = self._executor.submit(fn, *args, **kwargs)
+        self._pending.append(future)
+        return future
+
+    def flush(self):
+        """ Waits until all submitted jobs have finished.
+
+        Raises the exception of the first failed job, if there was one.
+        """
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        """ Waits until all submitted jobs have finished and stops the workers. """
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _remove_finished_jobs(self):
+        """ Removes the finished jobs from the front of the queue and raises their exceptions, if there are any. """
+        while self._pending and self._pending[0].done():
+            self._pending.popleft().result()
+
+
+def _start_worker():
+    """ An empty job, which makes sure the worker process has been started. """
+
+
+class _SharedArrayUtility:
+
+    @staticmethod
+    def share(data: Any, shared_blocks: List[shared_memory.SharedMemory], min_bytes: int) -> Any:
+        """ Replaces all large numpy arrays inside the given data by copies in shared memory.
+
+        Lists, tuples and dicts are searched recursively.
+
+        :param data: The data to share.
+        :param shared_blocks: All newly created shared memory blocks are appended to this list.
+        :param min_bytes: Only arrays of at least this size are put into shared memory.
+        :return: The data, where the arrays have been replaced by handles to their shared memory.
+        """
+        if isinstance(data, np.ndarray) and data.nbytes >= min_bytes and not data.dtype.hasobject:
+            block = shared_memory.SharedMemory(create=True, size=data.nbytes)
+            shared_blocks.append(block)
+            np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf)[...] = data
+            return _SharedArrayHandle(block.name, data.shape, data.dtype.str)
+        if isinstance(data, (list, tuple)):
+            return type(data)(_SharedArrayUtility.share(element, shared_blocks, min_bytes) for element in data)
+        if isinstance(data, dict):
+            return {key: _SharedArrayUtility.share(value, shared_blocks, min_bytes) for key, value in data.items()}
+        return data
+
+    @staticmethod
+    def resolve(data: Any, attached_blocks: List[shared_memory.SharedMemory]) -> Any:
+        """ Replaces all shared array handles inside the given data by arrays using the shared memory.
+
+        :param data: The data containing the handles.
+        :param attached_blocks: All attached shared memory blocks are appended to this list.
+        :return: The data with numpy arrays instead of the handles.
+        """
+        if isinstance(data, _SharedArrayHandle):
+            block = shared_memory.SharedMemory(name=data.name)
+            attached_blocks.append(block)
+            return np.ndarray(data.shape, dtype=np.dtype(data.dtype), buffer=block.buf)
+        if isinstance(data, (list, tuple)):
+            return type(data)(_SharedArrayUtility.resolve(element, attached_blocks) for element in data)
+        if isinstance(data, dict):
+            return {key: _SharedArrayUtility.resolve(value, attached_blocks) for key, value in data.items()}
+        return data
+
+    @staticmethod
+    def run_with_shared_arrays(fn: Callable, args: tuple, kwargs: dict) -> Any:
+        """ Runs the given function inside a worker, after resolving the shared arrays in its arguments.
+
+        :param fn: The function to run.
+        :param args: The positional arguments, possibly containing shared array handles.
+        :param kwargs: The keyword arguments, possibly containing shared array handles.
+        :return: The result of the function, which must not reference the shared arrays.
+        """
+        attached_blocks: List[shared_memory.SharedMemory] = []
+        try:
+            args = _SharedArrayUtility.resolve(args, attached_blocks)
+            kwargs = _SharedArrayUtility.resolve(kwargs, attached_blocks)
+            return fn(*args, **kwargs)
+        finally:
+            # Drop the views into the shared memory before closing it
+            del args, kwargs
+            for block in attached_blocks:
+                block.close()
+
+    @staticmethod
+    def release(shared_blocks: List[shared_memory.SharedMemory]):
+        """ Frees the given shared memory blocks.
+
+        :param shared_blocks: The blocks to free.
+        """
+        for block in shared_blocks:
+            block.close()
+            block.unlink()
+
+
+class _SharedArrayHandle:
+    """ Describes a numpy array stored in shared memory. """
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
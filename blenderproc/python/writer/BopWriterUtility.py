@@ -373,9 +373,7 @@ def write_frames(chunks_dir: str, dataset_objects: list, depths: Optional[List[n
             chunk_camera[curr_frame_id] = _BopWriterUtility.get_frame_camera(save_world2cam, depth_scale, unit_scaling)
 
             if colors:
-                color_rgb = colors[frame_id]
-                color_bgr = color_rgb.copy()
-                color_bgr[..., :3] = color_bgr[..., :3][..., ::-1]
+                color_bgr = _WriterUtility.to_bgr(colors[frame_id])
                 if color_file_format == 'PNG':
                     rgb_fpath = rgb_tpath.format(chunk_id=curr_chunk_id, im_id=curr_frame_id, im_type='.png')
                     cv2.imwrite(rgb_fpath, color_bgr)
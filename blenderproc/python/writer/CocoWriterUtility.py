@@ -1,20 +1,26 @@
 """Allows rendering the content of the scene in the coco file format."""
 
 import datetime
-from itertools import groupby
 import json
 import os
 import shutil
-from typing import Optional, Dict, Union, Tuple, List
+from types import TracebackType
+from typing import Optional, Dict, Union, Tuple, List, Any, Iterator, Type, Deque, NamedTuple
 import csv
+from collections import deque
+from concurrent.futures import Future
 
 import numpy as np
 from skimage import measure
 import cv2
 import bpy
 
+from blenderproc.python.reader.CocoAnnotationReader import rle_to_binary_mask  # pylint: disable=unused-import
 from blenderproc.python.utility.Utility import Utility
 from blenderproc.python.utility.LabelIdMapping import LabelIdMapping
+from blenderproc.python.utility.MetricsUtility import measure_stage
+from blenderproc.python.writer.AsyncWriterUtility import AsyncWriterPool
+from blenderproc.python.writer.WriterUtility import _WriterUtility
 
 
 def write_coco_annotations(output_dir: str, instance_segmaps: Optional[List[np.ndarray]] = None,
@@ -33,8 +39,10 @@ def write_coco_annotations(output_dir: str, instance_segmaps: Optional[List[np.n
     5. For each frame write the coco annotation
 
     :param output_dir: Output directory to write the coco annotations
-    :param instance_segmaps: List of instance segmentation maps
-    :param instance_attribute_maps: per-frame mappings with idx, class and optionally supercategory/bop_dataset_name
+    :param instance_segmaps: List of instance segmentation maps, either from render_segmap() or from render() after
+                             enable_segmentation_output() has been called with "instance" and "class" in its map_by.
+    :param instance_attribute_maps: per-frame mappings with idx, class and optionally supercategory/bop_dataset_name,
+                                    from the same source as the instance_segmaps.
     :param colors: List of color images. Does not support stereo images, enter left and right inputs subsequently.
     :param color_file_format: Format to save color images in
     :param mask_encoding_format: Encoding format of the binary masks. Default: 'rle'. Available: 'rle', 'polygon'.
@@ -131,21 +139,9 @@ def write_coco_annotations(output_dir: str, instance_segmaps: Optional[List[np.n
 
         if colors:
             color_rgb = colors[frame - bpy.context.scene.frame_start]
-
-            # Reverse channel order for opencv
-            color_bgr = color_rgb.copy()
-            color_bgr[..., :3] = color_bgr[..., :3][..., ::-1]
-
-            if color_file_format == 'PNG':
-                target_base_path = f'images/{file_prefix}{frame + image_offset:06d}.png'
-                target_path = os.path.join(output_dir, target_base_path)
-                cv2.imwrite(target_path, color_bgr)
-            elif color_file_format == 'JPEG':
-                target_base_path = f'images/{file_prefix}{frame + image_offset:06d}.jpg'
-                target_path = os.path.join(output_dir, target_base_path)
-                cv2.imwrite(target_path, color_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), jpg_quality])
-            else:
-                raise RuntimeError(f'Unknown color_file_format={color_file_format}. Try "PNG" or "JPEG"')
+            target_base_path = _CocoWriterUtility.write_color_image(output_dir,
+                                                                    f'{file_prefix}{frame + image_offset:06d}',
+                                                                    color_rgb, color_file_format, jpg_quality)
 
         else:
             source_path = rgb_output["path"] % frame
@@ -172,6 +168,240 @@ def write_coco_annotations(output_dir: str, instance_segmaps: Optional[List[np.n
         json.dump(coco_output, fp, indent=indent)
 
 
+class _CocoWriteOptions(NamedTuple):
+    """ The options of a CocoStreamWriter, which stay the same for all written frames """
+    color_file_format: str
+    mask_encoding_format: str
+    supercategory: str
+    append_to_existing_output: bool
+    jpg_quality: int
+    label_mapping: Optional[LabelIdMapping]
+    file_prefix: str
+    indent: Optional[Union[int, str]]
+
+
+class CocoStreamWriter:
+    """ Writes coco annotations frame by frame, without reloading the annotation file for every new frame.
+
+    The image and annotation ids are tracked in memory and the records of every written frame are appended to a
+    journal file next to the annotations. The final coco_annotations.json is only written once in close(). If a
+    previous run was interrupted before close() was called, its journal is picked up again and the run continues
+    where it left off.
+
+    Usage:
+
+    .. code-block:: python
+
+        with CocoStreamWriter(output_dir) as writer:
+            for ...:
+                writer.write(instance_segmaps, instance_attribute_maps, colors)
+    """
+
+    journal_file_name = "coco_annotations.journal.jsonl"
+
+    def __init__(self, output_dir: str, color_file_format: str = "PNG", mask_encoding_format: str = "rle",
+                 supercategory: str = "coco_annotations", append_to_existing_output: bool = True,
+                 jpg_quality: int = 95, label_mapping: Optional[LabelIdMapping] = None, file_prefix: str = "",
+                 indent: Optional[Union[int, str]] = None, writer_pool: Optional[AsyncWriterPool] = None):
+        """
+        :param output_dir: Output directory to write the coco annotations
+        :param color_file_format: Format to save color images in
+        :param mask_encoding_format: Encoding format of the binary masks. Default: 'rle'. Available: 'rle', 'polygon'.
+        :param supercategory: name of the dataset/supercategory to filter for, e.g. a specific BOP dataset set
+                              by 'bop_dataset_name' or any loaded object with specified 'cp_supercategory'
+        :param append_to_existing_output: If true and if there is already a coco_annotations.json file in the output
+                                          directory, the new coco annotations will be appended to the existing file.
+                                          Also, the rgb images will be named such that there are no collisions.
+        :param jpg_quality: The desired quality level of the jpg encoding
+        :param label_mapping: The label mapping which should be used to label the categories based on their ids.
+                              If None, is given then the `name` field is used or - if not existing - the category id
+                              itself is used.
+        :param file_prefix: Optional prefix for image file names
+        :param indent: The indent used when writing the final annotation file, see write_coco_annotations().
+        :param writer_pool: If given, the color images are written and the annotations are encoded inside the
+                            workers of this pool, while write() returns immediately.
+        """
+        self._output_dir = output_dir
+        self._options = _CocoWriteOptions(color_file_format, mask_encoding_format, supercategory,
+                                          append_to_existing_output, jpg_quality, label_mapping, file_prefix, indent)
+        self._writer_pool = writer_pool
+
+        self._next_image_id = 0
+        self._next_annotation_id = 1
+        self._closed = False
+        # The first image id and the pending job of every frame batch, whose records are not in the journal yet
+        self._pending_records: Deque[Tuple[int, Future]] = deque()
+
+        os.makedirs(os.path.join(output_dir, 'images'), exist_ok=True)
+
+        if append_to_existing_output:
+            # Determine the id offsets once, instead of for every written frame
+            if os.path.exists(self._coco_annotations_path):
+                existing_coco_annotations = self._load_existing_coco_annotations()
+                if existing_coco_annotations["images"]:
+                    self._next_image_id = max(image["id"] for image in existing_coco_annotations["images"]) + 1
+                if existing_coco_annotations["annotations"]:
+                    self._next_annotation_id = max(annotation["id"] for annotation in
+                                                   existing_coco_annotations["annotations"]) + 1
+            # Recover from a previous run which did not finish
+            self._truncate_incomplete_journal_record()
+            for record in self._read_journal():
+                for image in record["images"]:
+                    self._next_image_id = max(self._next_image_id, image["id"] + 1)
+                for annotation in record["annotations"]:
+                    self._next_annotation_id = max(self._next_annotation_id, annotation["id"] + 1)
+        elif os.path.exists(self._journal_path):
+            os.remove(self._journal_path)
+
+    def __enter__(self) -> "CocoStreamWriter":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        self.close()
+
+    @property
+    def _coco_annotations_path(self) -> str:
+        """ Returns the path of the final annotation file.
+
+        :return: The path of coco_annotations.json inside the output directory.
+        """
+        return os.path.join(self._output_dir, "coco_annotations.json")
+
+    @property
+    def _journal_path(self) -> str:
+        """ Returns the path of the journal, which the records of the written frames are appended to.
+
+        :return: The path of the journal inside the output directory.
+        """
+        return os.path.join(self._output_dir, CocoStreamWriter.journal_file_name)
+
+    def write(self, instance_segmaps: List[np.ndarray], instance_attribute_maps: List[List[Dict[str, Any]]],
+              colors: List[np.ndarray]):
+        """ Writes the color images of the given frames and appends their coco annotations to the journal.
+
+        :param instance_segmaps: List of instance segmentation maps, either from render_segmap() or from render()
+                                 after enable_segmentation_output() has been called with "instance" and "class" in
+                                 its map_by.
+        :param instance_attribute_maps: per-frame mappings with idx, class and optionally
+                                        supercategory/bop_dataset_name, from the same source as the instance_segmaps.
+        :param colors: List of color images. Does not support stereo images, enter left and right inputs
+                       subsequently.
+        """
+        if self._closed:
+            raise RuntimeError("The CocoStreamWriter has already been closed.")
+        instance_segmaps = list(instance_segmaps)
+        instance_attribute_maps = list(instance_attribute_maps)
+        colors = list(colors)
+        if not len(instance_segmaps) == len(instance_attribute_maps) == len(colors):
+            raise ValueError(f"The amount of instance segmaps ({len(instance_segmaps)}), instance attribute maps "
+                             f"({len(instance_attribute_maps)}) and colors ({len(colors)}) has to be the same.")
+        if len(colors) > 0 and len(colors[0].shape) == 4:
+            raise ValueError("BlenderProc currently does not support writing coco annotations for stereo images. "
+                             "However, you can enter left and right images / segmaps separately.")
+
+        # Reserve the image ids right away, the annotation ids are assigned once the records are journaled
+        first_image_id = self._next_image_id
+        self._next_image_id += len(colors)
+        encode_args = (self._output_dir, first_image_id, self._options.file_prefix, colors, instance_segmaps,
+                       instance_attribute_maps, self._options.color_file_format, self._options.jpg_quality,
+                       self._options.supercategory, self._options.mask_encoding_format, self._options.label_mapping)
+        if self._writer_pool is None:
+            self._append_to_journal(first_image_id, _CocoWriterUtility.encode_frames(*encode_args))
+        else:
+            self._pending_records.append((first_image_id,
+                                          self._writer_pool.submit(_CocoWriterUtility.encode_frames, *encode_args)))
+            self._journal_finished_records(wait=False)
+
+    def flush(self):
+        """ Waits until all frames given to write() have been encoded and their records have been journaled. """
+        self._journal_finished_records(wait=True)
+
+    def close(self):
+        """ Writes the final coco_annotations.json based on the existing annotations and the journal. """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+
+        coco_output = None
+        if self._options.append_to_existing_output and os.path.exists(self._coco_annotations_path):
+            coco_output = self._load_existing_coco_annotations()
+        if coco_output is None:
+            coco_output = _CocoWriterUtility.generate_coco_annotations([], [], [], self._options.supercategory,
+                                                                       self._options.mask_encoding_format,
+                                                                       label_mapping=self._options.label_mapping)
+
+        for record in self._read_journal():
+            for cat_dict in record["categories"]:
+                if cat_dict not in coco_output["categories"]:
+                    coco_output["categories"].append(cat_dict)
+            coco_output["images"].extend(record["images"])
+            coco_output["annotations"].extend(record["annotations"])
+
+        print("Writing coco annotations to " + self._coco_annotations_path)
+        with open(self._coco_annotations_path, 'w', encoding="utf-8") as fp:
+            json.dump(coco_output, fp, indent=self._options.indent)
+
+        if os.path.exists(self._journal_path):
+            os.remove(self._journal_path)
+
+    def _journal_finished_records(self, wait: bool):
+        """ Appends the records of the finished encoding jobs to the journal, keeping the order of the frames.
+
+        :param wait: If True, waits for all pending jobs. Otherwise, stops at the first job which is still running.
+        """
+        while self._pending_records and (wait or self._pending_records[0][1].done()):
+            first_image_id, future = self._pending_records.popleft()
+            self._append_to_journal(first_image_id, future.result())
+
+    def _append_to_journal(self, first_image_id: int, record: Dict[str, Any]):
+        """ Makes the frame local ids of the given record unique over the whole run and appends it to the journal.
+
+        :param first_image_id: The image id reserved for the first image of the record.
+        :param record: The categories, images and annotations of the written frames, as returned by encode_frames().
+        """
+        for image in record["images"]:
+            image["id"] += first_image_id
+        for annotation in record["annotations"]:
+            annotation["id"] += self._next_annotation_id - 1
+            annotation["image_id"] += first_image_id
+        self._next_annotation_id += len(record["annotations"])
+
+        with open(self._journal_path, 'a', encoding="utf-8") as fp:
+            fp.write(json.dumps(record) + "\n")
+
+    def _load_existing_coco_annotations(self) -> Dict[str, Any]:
+        """ Loads the coco_annotations.json file inside the output directory.
+
+        :return: The loaded coco annotations.
+        """
+        with open(self._coco_annotations_path, 'r', encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _truncate_incomplete_journal_record(self):
+        """ Removes a last journal record which was only partially written, e.g. because the process was killed. """
+        if not os.path.exists(self._journal_path):
+            return
+        with open(self._journal_path, 'rb+') as fp:
+            content = fp.read()
+            if content and not content.endswith(b"\n"):
+                print(f"Warning: Removing incomplete record at the end of {self._journal_path}")
+                fp.truncate(content.rfind(b"\n") + 1)
+
+    def _read_journal(self) -> Iterator[Dict[str, Any]]:
+        """ Iterates over all records stored in the journal.
+
+        :return: An iterator over the journal records.
+        """
+        if not os.path.exists(self._journal_path):
+            return
+        with open(self._journal_path, 'r', encoding="utf-8") as fp:
+            for line in fp:
+                yield json.loads(line)
+
+
 def binary_mask_to_rle(binary_mask: np.ndarray) -> Dict[str, List[int]]:
     """Converts a binary mask to COCOs run-length encoding (RLE) format. Instead of outputting
     a mask image, you give a list of start pixels and how many pixels after each of those
@@ -180,35 +410,59 @@ def binary_mask_to_rle(binary_mask: np.ndarray) -> Dict[str, List[int]]:
     :return: Mask in RLE format
     """
     rle: Dict[str, List[int]] = {'counts': [], 'size': list(binary_mask.shape)}
-    counts = rle.get('counts')
-    for i, (value, elements) in enumerate(groupby(binary_mask.ravel(order='F'))):
-        if i == 0 and value == 1:
-            counts.append(0)
-        counts.append(len(list(elements)))
+    flat_mask = binary_mask.ravel(order='F')
+    if flat_mask.size == 0:
+        return rle
+    # Find the start of every run of equal values
+    run_starts = np.concatenate(([0], np.flatnonzero(flat_mask[1:] != flat_mask[:-1]) + 1, [flat_mask.size]))
+    counts = np.diff(run_starts).tolist()
+    # The counts always start with a run of zeros
+    if flat_mask[0] == 1:
+        counts.insert(0, 0)
+    rle['counts'] = counts
     return rle
 
 
-def rle_to_binary_mask(rle: Dict[str, List[int]]) -> np.ndarray:
-    """Converts a COCOs run-length encoding (RLE) to binary mask.
-    :param rle: Mask in RLE format
-    :return: a 2D binary numpy array where '1's represent the object
-    """
-    binary_array = np.zeros(np.prod(rle.get('size')), dtype=bool)
-    counts: List[int] = rle.get('counts')
-
-    start = 0
-    for i in range(len(counts) - 1):
-        start += counts[i]
-        end = start + counts[i + 1]
-        binary_array[start:end] = (i + 1) % 2
-
-    binary_mask = binary_array.reshape(*rle.get('size'), order='F')
-
-    return binary_mask
-
-
 class _CocoWriterUtility:
 
+    @staticmethod
+    def encode_frames(output_dir: str, first_image_id: int, file_prefix: str, colors: List[np.ndarray],
+                      inst_segmaps: List[np.ndarray], inst_attribute_maps: List[List[Dict[str, Any]]],
+                      color_file_format: str, jpg_quality: int, supercategory: str, mask_encoding_format: str,
+                      label_mapping: Optional[LabelIdMapping] = None) -> Dict[str, Any]:
+        """ Writes the given color images and generates the coco records of their frames.
+
+        Does not use the blender API, so it can also be run inside an AsyncWriterPool. Its stages are then measured
+        inside the worker process and are not recorded in the metrics of the main process.
+
+        :param output_dir: The output directory of the coco annotations.
+        :param first_image_id: The id used in the file name of the first image.
+        :param file_prefix: Optional prefix for image file names
+        :param colors: List of color images.
+        :param inst_segmaps: List of instance segmentation maps
+        :param inst_attribute_maps: per-frame mappings with idx, class and optionally supercategory/bop_dataset_name
+        :param color_file_format: Format to save color images in
+        :param jpg_quality: The desired quality level of the jpg encoding
+        :param supercategory: name of the dataset/supercategory to filter for, e.g. a specific BOP dataset
+        :param mask_encoding_format: Encoding format of the binary mask. Type: string.
+        :param label_mapping: The label mapping which should be used to label the categories based on their ids.
+        :return: The categories, images and annotations of the frames, with image ids starting at 0 and annotation
+                 ids starting at 1.
+        """
+        image_paths = []
+        with measure_stage("jpeg_write" if color_file_format == "JPEG" else "png_write"):
+            for i, color_rgb in enumerate(colors):
+                image_paths.append(_CocoWriterUtility.write_color_image(output_dir,
+                                                                        f'{file_prefix}{first_image_id + i:06d}',
+                                                                        color_rgb, color_file_format, jpg_quality))
+
+        with measure_stage("coco_encode"):
+            coco_output = _CocoWriterUtility.generate_coco_annotations(inst_segmaps, inst_attribute_maps,
+                                                                       image_paths, supercategory,
+                                                                       mask_encoding_format,
+                                                                       label_mapping=label_mapping)
+        return {key: coco_output[key] for key in ["categories", "images", "annotations"]}
+
     @staticmethod
     def generate_coco_annotations(inst_segmaps, inst_attribute_maps, image_paths, supercategory,
                                   mask_encoding_format, existing_coco_annotations=None,
@@ -285,22 +539,35 @@ def generate_coco_annotations(inst_segmaps, inst_attribute_maps, image_paths, su
             image_id = len(images)
             images.append(_CocoWriterUtility.create_image_info(image_id, image_path, inst_segmap.shape))
 
-            # Go through all objects visible in this image
-            instances = np.unique(inst_segmap)
-            # Remove background
-            instances = np.delete(instances, np.where(instances == 0))
-            for inst in instances:
-                if inst in instance_2_category_map:
-                    # Calc object mask
-                    binary_inst_mask = np.where(inst_segmap == inst, 1, 0)
-                    # Add coco info for object in this image
-                    annotation = _CocoWriterUtility.create_annotation_info(len(annotations) + 1,
-                                                                           image_id,
-                                                                           instance_2_category_map[inst],
-                                                                           binary_inst_mask,
-                                                                           mask_encoding_format)
-                    if annotation is not None:
-                        annotations.append(annotation)
+            if mask_encoding_format == 'rle':
+                # Encode all objects visible in this image at once
+                instance_rles = _CocoWriterUtility.instance_segmap_to_rles(inst_segmap)
+                for inst, (segmentation, bounding_box, area) in instance_rles.items():
+                    # Skip background
+                    if inst != 0 and inst in instance_2_category_map:
+                        # Add coco info for object in this image
+                        annotations.append(_CocoWriterUtility.build_annotation_info(len(annotations) + 1,
+                                                                                    image_id,
+                                                                                    instance_2_category_map[inst],
+                                                                                    area, bounding_box, segmentation,
+                                                                                    inst_segmap.shape))
+            else:
+                # Go through all objects visible in this image
+                instances = np.unique(inst_segmap)
+                # Remove background
+                instances = np.delete(instances, np.where(instances == 0))
+                for inst in instances:
+                    if inst in instance_2_category_map:
+                        # Calc object mask
+                        binary_inst_mask = np.where(inst_segmap == inst, 1, 0)
+                        # Add coco info for object in this image
+                        annotation = _CocoWriterUtility.create_annotation_info(len(annotations) + 1,
+                                                                               image_id,
+                                                                               instance_2_category_map[inst],
+                                                                               binary_inst_mask,
+                                                                               mask_encoding_format)
+                        if annotation is not None:
+                            annotations.append(annotation)
 
         new_coco_annotations = {
             "info": info,
@@ -351,6 +618,33 @@ def merge_coco_annotations(existing_coco_annotations, new_coco_annotations):
 
         return existing_coco_annotations
 
+    @staticmethod
+    def write_color_image(output_dir: str, file_name: str, color_rgb: np.ndarray, color_file_format: str,
+                          jpg_quality: int) -> str:
+        """ Writes the given color image into the images folder of the given output directory.
+
+        :param output_dir: The output directory of the coco annotations.
+        :param file_name: The file name of the image without file ending.
+        :param color_rgb: The color image in RGB(A) channel order.
+        :param color_file_format: Format to save the color image in, either "PNG" or "JPEG".
+        :param jpg_quality: The desired quality level of the jpg encoding
+        :return: The path of the written image relative to the output directory.
+        """
+        # Reverse channel order for opencv
+        color_bgr = _WriterUtility.to_bgr(color_rgb)
+
+        if color_file_format == 'PNG':
+            target_base_path = f'images/{file_name}.png'
+            target_path = os.path.join(output_dir, target_base_path)
+            cv2.imwrite(target_path, color_bgr)
+        elif color_file_format == 'JPEG':
+            target_base_path = f'images/{file_name}.jpg'
+            target_path = os.path.join(output_dir, target_base_path)
+            cv2.imwrite(target_path, color_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), jpg_quality])
+        else:
+            raise RuntimeError(f'Unknown color_file_format={color_file_format}. Try "PNG" or "JPEG"')
+        return target_base_path
+
     @staticmethod
     def create_image_info(image_id: int, file_name: str, image_size: Tuple[int, int]) -> Dict[str, Union[str, int]]:
         """Creates image info section of coco annotation
@@ -400,6 +694,23 @@ def create_annotation_info(annotation_id: int, image_id: int, category_id: int,
         else:
             raise RuntimeError(f"Unknown encoding format: {mask_encoding_format}")
 
+        return _CocoWriterUtility.build_annotation_info(annotation_id, image_id, category_id, area, bounding_box,
+                                                        segmentation, binary_mask.shape)
+
+    @staticmethod
+    def build_annotation_info(annotation_id: int, image_id: int, category_id: int, area: int,
+                              bounding_box: List[int], segmentation: Union[Dict[str, List[int]], List[List[float]]],
+                              image_size: Tuple[int, int]) -> Dict[str, Union[str, int]]:
+        """Builds the info section of a coco annotation from already computed mask properties
+
+        :param annotation_id: integer to uniquly identify the annotation
+        :param image_id: integer to uniquly identify image
+        :param category_id: Id of the category
+        :param area: The area of the object mask.
+        :param bounding_box: The bounding box of the object mask represented as [x, y, width, height].
+        :param segmentation: The encoded object mask.
+        :param image_size: The size of the image, given as [H, W]
+        """
         annotation_info: Dict[str, Union[str, int]] = {
             "id": annotation_id,
             "image_id": image_id,
@@ -408,11 +719,66 @@ def create_annotation_info(annotation_id: int, image_id: int, category_id: int,
             "area": area,
             "bbox": bounding_box,
             "segmentation": segmentation,
-            "width": binary_mask.shape[1],
-            "height": binary_mask.shape[0],
+            "width": image_size[1],
+            "height": image_size[0],
         }
         return annotation_info
 
+    @staticmethod
+    def instance_segmap_to_rles(inst_segmap: np.ndarray) -> Dict[int, Tuple[Dict[str, List[int]], List[int], int]]:
+        """ Computes the RLE, bounding box and area of every instance in the given instance segmentation map.
+
+        Gives the same results as calling binary_mask_to_rle(), bbox_from_binary_mask() and calc_binary_mask_area()
+        on the mask of every instance, but only goes a few times over the whole image: All runs of equal ids are
+        determined once on the column-major flattened map and then grouped per instance.
+
+        :param inst_segmap: The instance segmentation map with the shape [H, W].
+        :return: A dict mapping every instance id to its RLE, bounding box [x, y, width, height] and area.
+        """
+        height = inst_segmap.shape[0]
+        flat_segmap = inst_segmap.ravel(order='F')
+        if flat_segmap.size == 0:
+            return {}
+
+        # Find all runs of equal instance ids in column-major order
+        run_starts = np.concatenate(([0], np.flatnonzero(flat_segmap[1:] != flat_segmap[:-1]) + 1))
+        run_ends = np.append(run_starts[1:], flat_segmap.size)
+        run_values = flat_segmap[run_starts]
+
+        # Group the runs per instance, while keeping their order inside each instance
+        order = np.argsort(run_values, kind="stable")
+        run_starts, run_ends, run_values = run_starts[order], run_ends[order], run_values[order]
+        instances, group_starts = np.unique(run_values, return_index=True)
+        group_ends = np.append(group_starts[1:], len(run_values))
+
+        # The zeros before each run of an instance start at the end of its previous run
+        previous_run_ends = np.roll(run_ends, 1)
+        previous_run_ends[group_starts] = 0
+        run_lengths = run_ends - run_starts
+        counts = np.stack((run_starts - previous_run_ends, run_lengths), axis=1).ravel()
+
+        # A run covering more than one column contains the first and last row
+        first_cols = run_starts // height
+        last_cols = (run_ends - 1) // height
+        spans_columns = first_cols != last_cols
+        min_rows = np.minimum.reduceat(np.where(spans_columns, 0, run_starts % height), group_starts)
+        max_rows = np.maximum.reduceat(np.where(spans_columns, height - 1, (run_ends - 1) % height), group_starts)
+        min_cols = first_cols[group_starts]
+        max_cols = last_cols[group_ends - 1]
+        areas = np.add.reduceat(run_lengths, group_starts)
+        trailing_zeros = flat_segmap.size - run_ends[group_ends - 1]
+
+        results = {}
+        for i, inst in enumerate(instances.tolist()):
+            rle_counts = counts[2 * group_starts[i]:2 * group_ends[i]].tolist()
+            if trailing_zeros[i] > 0:
+                rle_counts.append(int(trailing_zeros[i]))
+            rle = {'counts': rle_counts, 'size': list(inst_segmap.shape)}
+            bounding_box = [int(min_cols[i]), int(min_rows[i]), int(max_cols[i] - min_cols[i] + 1),
+                            int(max_rows[i] - min_rows[i] + 1)]
+            results[inst] = (rle, bounding_box, int(areas[i]))
+        return results
+
     @staticmethod
     def bbox_from_binary_mask(binary_mask: np.ndarray) -> List[int]:
         """ Returns the smallest bounding box containing all pixels marked "1" in the given image mask.
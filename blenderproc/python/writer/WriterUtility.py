@@ -2,7 +2,8 @@
 
 
 import os
-from typing import List, Dict, Union, Any, Set, Tuple
+from types import TracebackType
+from typing import List, Dict, Union, Any, Set, Tuple, Optional, Type, NamedTuple
 import json
 
 import csv
@@ -17,16 +18,22 @@
 from blenderproc.python.types.EntityUtility import Entity
 from blenderproc.python.utility.BlenderUtility import load_image
 from blenderproc.python.utility.Utility import resolve_path, Utility, NumpyEncoder
+from blenderproc.python.utility.MetricsUtility import measure_stage
 from blenderproc.python.utility.MathUtility import change_coordinate_frame_of_point, \
     change_source_coordinate_frame_of_transformation_matrix, change_target_coordinate_frame_of_transformation_matrix
 from blenderproc.python.camera import CameraUtility
+from blenderproc.python.writer.AsyncWriterUtility import AsyncWriterPool
 
 
 def write_hdf5(output_dir_path: str, output_data_dict: Dict[str, List[Union[np.ndarray, list, dict]]],
-               append_to_existing_output: bool = False, stereo_separate_keys: bool = False):
+               append_to_existing_output: bool = False, stereo_separate_keys: bool = False,
+               writer_pool: Optional[AsyncWriterPool] = None):
     """
     Saves the information provided inside of the output_data_dict into a .hdf5 container
 
+    When writing many frames into the same folder, use the Hdf5StreamWriter instead, which does not scan the folder
+    on every call.
+
     :param output_dir_path: The folder path in which the .hdf5 containers will be generated
     :param output_data_dict: The container, which keeps the different images, which should be saved to disc.
                              Each key will be saved as its own key in the .hdf5 container.
@@ -37,73 +44,304 @@ def write_hdf5(output_dir_path: str, output_data_dict: Dict[str, List[Union[np.n
                                  won't be saved in one tensor [2, img_x, img_y, channels], where the img[0] is the
                                  left image and img[1] the right. They will be saved in separate keys: for example
                                  for colors in colors_0 and colors_1.
+    :param writer_pool: If given, the .hdf5 containers are compressed and written inside the workers of this pool,
+                        while this function returns immediately. Call flush() on the pool to wait for them.
     """
+    with Hdf5StreamWriter(output_dir_path, append_to_existing_output, stereo_separate_keys,
+                          writer_pool=writer_pool) as writer:
+        writer.write(output_data_dict)
 
-    if not os.path.exists(output_dir_path):
-        os.makedirs(output_dir_path)
 
-    amount_of_frames = 0
-    for data_block in output_data_dict.values():
-        if isinstance(data_block, list):
-            amount_of_frames = max([amount_of_frames, len(data_block)])
+class _Hdf5WriteOptions(NamedTuple):
+    """ The options of a Hdf5StreamWriter, which stay the same for all written frames """
+    stereo_separate_keys: bool
+    consolidated: bool
+    frames_per_container: Optional[int]
+    compression: Optional[str]
+    compression_opts: Optional[int]
+    blender_proc_version: Optional[str]
 
-    # if append to existing output is turned on the existing folder is searched for the highest occurring
-    # index, which is then used as starting point for this run
-    if append_to_existing_output:
-        frame_offset = 0
-        # Look for hdf5 file with highest index
-        for path in os.listdir(output_dir_path):
-            if path.endswith(".hdf5"):
-                index = path[:-len(".hdf5")]
-                if index.isdigit():
-                    frame_offset = max(frame_offset, int(index) + 1)
-    else:
-        frame_offset = 0
-
-    if amount_of_frames != bpy.context.scene.frame_end - bpy.context.scene.frame_start:
-        raise Exception("The amount of images stored in the output_data_dict does not correspond with the amount"
-                        "of images specified by frame_start to frame_end.")
-
-    for frame in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end):
-        # for each frame a new .hdf5 file is generated
-        hdf5_path = os.path.join(output_dir_path, str(frame + frame_offset) + ".hdf5")
-        with h5py.File(hdf5_path, "w") as file:
-            # Go through all the output types
+
+class Hdf5StreamWriter:
+    """ Writes the rendered frames into .hdf5 containers, while keeping track of the next free frame index in memory.
+
+    By default, every frame is written into its own <index>.hdf5 container, like write_hdf5() does: the frame
+    frame_start + i of a write() call gets the index frame_start + i + next_index, where next_index is 0 or the
+    highest existing index + 1. In consolidated mode, the frames are instead appended to a few
+    container_<index>.hdf5 files, where every key is stored as one chunked dataset with the frame as first
+    dimension. Per-frame lists and dicts are stored as json strings.
+
+    Usage:
+
+    .. code-block:: python
+
+        with Hdf5StreamWriter(output_dir, consolidated=True) as writer:
+            for ...:
+                writer.write(bproc.renderer.render())
+    """
+
+    container_file_prefix = "container_"
+
+    def __init__(self, output_dir_path: str, append_to_existing_output: bool = True,
+                 stereo_separate_keys: bool = False, consolidated: bool = False,
+                 frames_per_container: Optional[int] = None, compression: Optional[str] = "gzip",
+                 compression_opts: Optional[int] = None, writer_pool: Optional[AsyncWriterPool] = None):
+        """
+        :param output_dir_path: The folder path in which the .hdf5 containers will be generated
+        :param append_to_existing_output: If this is True, the numbering of the new frames starts right where the
+                                          frames already existing in the output_dir_path left off.
+        :param stereo_separate_keys: If this is True and the rendering was done in stereo mode, the left and right
+                                     images are saved in separate keys, see write_hdf5().
+        :param consolidated: If this is True, all frames are appended to a few container_<index>.hdf5 files
+                             instead of writing one file per frame.
+        :param frames_per_container: In consolidated mode, a new container is started after this many frames.
+                                     If None, all frames are written into one container.
+        :param compression: The compression filter of the datasets, e.g. "gzip" or "lzf". None disables the
+                            compression.
+        :param compression_opts: The compression level, e.g. 0-9 for "gzip". If None, the default level is used.
+                                 Ignored for "lzf", which has no levels.
+        :param writer_pool: If given, the per-frame containers are written inside the workers of this pool. Cannot be
+                            used in consolidated mode.
+        """
+        if consolidated and writer_pool is not None:
+            raise ValueError("The Hdf5StreamWriter cannot use a writer pool in consolidated mode, as all frames are "
+                             "written into the same open file.")
+        if frames_per_container is not None and frames_per_container < 1:
+            raise ValueError(f"frames_per_container has to be at least one, not {frames_per_container}")
+        self._output_dir_path = output_dir_path
+        self._options = _Hdf5WriteOptions(stereo_separate_keys, consolidated, frames_per_container, compression,
+                                          None if compression == "lzf" else compression_opts,
+                                          Utility.get_current_version())
+        self._writer_pool = writer_pool
+
+        # The open container and its index in consolidated mode
+        self._container: Optional[h5py.File] = None
+        self._container_index = 0
+        self._next_index = 0
+
+        os.makedirs(output_dir_path, exist_ok=True)
+        if consolidated:
+            container_indices = _WriterUtility.find_hdf5_indices(output_dir_path,
+                                                                 Hdf5StreamWriter.container_file_prefix)
+            if append_to_existing_output and container_indices:
+                # Count the frames once, afterwards the index is tracked in memory
+                for container_index in container_indices:
+                    with h5py.File(self._container_path(container_index), "r") as container:
+                        self._next_index += int(container.attrs.get("num_frames", 0))
+                self._container_index = container_indices[-1]
+                self._container = h5py.File(self._container_path(self._container_index), "a")
+        elif append_to_existing_output:
+            # Look for the hdf5 file with the highest index once, afterwards the index is tracked in memory
+            self._next_index = max(_WriterUtility.find_hdf5_indices(output_dir_path), default=-1) + 1
+
+    def __enter__(self) -> "Hdf5StreamWriter":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]):
+        self.close()
+
+    @property
+    def next_index(self) -> int:
+        """ Returns the index offset of the next written frames. In consolidated mode this is the index of the next
+        frame, otherwise the frame numbers starting at frame_start are added to it.
+
+        :return: The index offset of the next frames.
+        """
+        return self._next_index
+
+    def write(self, output_data_dict: Dict[str, List[Union[np.ndarray, list, dict]]]):
+        """ Writes all frames of the given output data.
+
+        :param output_data_dict: The container, which keeps the different images, which should be saved to disc.
+                                 Each key will be saved as its own key in the .hdf5 containers.
+        """
+        use_multiview = bpy.context.scene.render.use_multiview
+        frame_start = bpy.context.scene.frame_start
+        # Raises, if not every output has one entry per frame
+        frames_data = _WriterUtility.split_output_data_into_frames(output_data_dict)
+        if self._options.consolidated:
+            for frame_data in frames_data:
+                with measure_stage("hdf5_encode"):
+                    self._append_to_container(_WriterUtility.separate_stereo_keys(frame_data,
+                                                                                  self._options.stereo_separate_keys,
+                                                                                  use_multiview))
+                self._next_index += 1
+            return
+
+        for adjusted_frame, frame_data in enumerate(frames_data):
+            frame = frame_start + adjusted_frame
+            # for each frame a new .hdf5 file is generated
+            hdf5_path = os.path.join(self._output_dir_path, str(frame + self._next_index) + ".hdf5")
             print(f"Merging data for frame {frame} into {hdf5_path}")
+            write_args = (hdf5_path, frame_data, self._options.stereo_separate_keys, use_multiview,
+                          self._options.blender_proc_version, self._options.compression,
+                          self._options.compression_opts)
+            if self._writer_pool is None:
+                _WriterUtility.write_hdf5_frame(*write_args)
+            else:
+                # Reserve the file name right away, so other writers appending to this folder already see it
+                with open(hdf5_path, "wb"):
+                    pass
+                self._writer_pool.submit(_WriterUtility.write_hdf5_frame, *write_args)
+        if frames_data:
+            # The next frames continue after the highest written index
+            self._next_index += frame_start + len(frames_data)
+
+    def close(self):
+        """ Closes the open container in consolidated mode. """
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+    def _container_path(self, container_index: int) -> str:
+        """ Returns the path of the container with the given index.
+
+        :param container_index: The index of the container.
+        :return: The path of the container.
+        """
+        return os.path.join(self._output_dir_path,
+                            f"{Hdf5StreamWriter.container_file_prefix}{container_index:04d}.hdf5")
 
-            adjusted_frame = frame - bpy.context.scene.frame_start
-            for key, data_block in output_data_dict.items():
-                if adjusted_frame < len(data_block):
-                    # get the current data block for the current frame
-                    used_data_block = data_block[adjusted_frame]
-                    if stereo_separate_keys and (bpy.context.scene.render.use_multiview or
-                                                 used_data_block.shape[0] == 2):
-                        # stereo mode was activated
-                        _WriterUtility.write_to_hdf_file(file, key + "_0", data_block[adjusted_frame][0])
-                        _WriterUtility.write_to_hdf_file(file, key + "_1", data_block[adjusted_frame][1])
-                    else:
-                        _WriterUtility.write_to_hdf_file(file, key, data_block[adjusted_frame])
+    def _append_to_container(self, frame_data: Dict[str, Union[np.ndarray, list, dict]]):
+        """ Appends the given frame as a new row to every dataset of the current container.
+
+        :param frame_data: Maps each key to the data of the frame.
+        """
+        if self._container is not None and self._options.frames_per_container is not None and \
+                self._container.attrs["num_frames"] >= self._options.frames_per_container:
+            self.close()
+            self._container_index += 1
+        if self._container is None:
+            self._container = h5py.File(self._container_path(self._container_index), "w")
+            self._container.attrs["num_frames"] = 0
+            if self._options.blender_proc_version is not None:
+                self._container.attrs["blender_proc_version"] = self._options.blender_proc_version
+            print(f"Writing frames into {self._container.filename}")
+
+        row = int(self._container.attrs["num_frames"])
+        for key, data in frame_data.items():
+            data = _WriterUtility.to_hdf5_array(key, data)
+            if data.dtype.char == 'S':
+                # Strings like serialized object states have a different length in every frame
+                data = data.tobytes()
+            if key not in self._container:
+                if isinstance(data, bytes):
+                    self._container.create_dataset(key, shape=(row,), maxshape=(None,), dtype=h5py.string_dtype())
                 else:
-                    raise Exception(f"There are more frames {adjusted_frame} then there are blocks of information "
-                                    f" {len(data_block)} in the given list for key {key}.")
-            blender_proc_version = Utility.get_current_version()
-            if blender_proc_version is not None:
-                _WriterUtility.write_to_hdf_file(file, "blender_proc_version", np.string_(blender_proc_version))
+                    self._container.create_dataset(key, shape=(row,) + data.shape, maxshape=(None,) + data.shape,
+                                                   chunks=(1,) + data.shape, dtype=data.dtype,
+                                                   compression=self._options.compression,
+                                                   compression_opts=self._options.compression_opts)
+            dataset = self._container[key]
+            if dataset.shape[0] != row or (not isinstance(data, bytes) and dataset.shape[1:] != data.shape):
+                raise ValueError(f"The data of key {key} with shape {np.shape(data)} does not fit into the dataset "
+                                 f"with shape {dataset.shape} at frame {row} of {self._container.filename}. All frames "
+                                 f"in a container need the same keys and shapes.")
+            dataset.resize(row + 1, axis=0)
+            dataset[row] = data
+        self._container.attrs["num_frames"] = row + 1
+
+
+class _FrameBuffers:
+    """ Collects the per frame outputs of each key in one preallocated (N, ...) array.
+
+    The loaded frames are copied into their row of the array, so the outputs of all frames share a single
+    allocation and stereo pairs do not need to be stacked. If reuse is enabled, the arrays are kept and refilled by
+    the next call with the same shape and dtype, which avoids allocating them for every batch of frames.
+    """
+
+    # The arrays of the previous calls, which can be refilled if reuse is enabled
+    reusable_buffers: Dict[str, np.ndarray] = {}
+
+    def __init__(self, num_frames: int, reuse: bool = False):
+        """
+        :param num_frames: The number of frames, which will be stored.
+        :param reuse: If True, the arrays are taken from and stored in reusable_buffers. The data returned by the
+                      previous call with reuse is then overwritten.
+        """
+        self._num_frames = num_frames
+        self._reuse = reuse
+        self._buffers: Dict[str, np.ndarray] = {}
+        # Keys whose frames do not share shape and dtype, they are collected as lists
+        self._lists: Dict[str, list] = {}
+
+    def frame_view(self, key: str, frame_index: int, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """ Returns the row of the given frame, so the loader can fill it in place.
+
+        :param key: The key of the output.
+        :param frame_index: The index of the frame, starting at 0.
+        :param shape: The shape of the data of one frame.
+        :param dtype: The dtype of the data.
+        :return: The writable row of the array of the key.
+        """
+        shape = tuple(shape)
+        buffer = self._buffers.get(key)
+        if buffer is None and key not in self._lists:
+            buffer = _FrameBuffers.reusable_buffers.get(key) if self._reuse else None
+            if buffer is None or buffer.shape[1:] != shape or buffer.dtype != dtype or \
+                    buffer.shape[0] < self._num_frames:
+                buffer = np.empty((self._num_frames,) + shape, dtype=dtype)
+                if self._reuse:
+                    _FrameBuffers.reusable_buffers[key] = buffer
+            buffer = buffer[:self._num_frames]
+            self._buffers[key] = buffer
+        if buffer is not None and buffer.shape[1:] == shape and buffer.dtype == dtype:
+            return buffer[frame_index]
+        # The frames differ, so fall back to a list of separate arrays
+        if key not in self._lists:
+            self._lists[key] = list(self._buffers.pop(key)[:frame_index])
+        row = np.empty(shape, dtype=dtype)
+        self._lists[key].append(row)
+        return row
+
+    def store(self, key: str, frame_index: int, data: Any):
+        """ Stores the data of one frame, numpy arrays are copied into the array of the key.
+
+        :param key: The key of the output.
+        :param frame_index: The index of the frame, starting at 0.
+        :param data: The data of the frame.
+        """
+        if isinstance(data, np.ndarray) and not data.dtype.hasobject and key not in self._lists:
+            self.frame_view(key, frame_index, data.shape, data.dtype)[...] = data
+        else:
+            if key in self._buffers:
+                self._lists[key] = list(self._buffers.pop(key)[:frame_index])
+            self._lists.setdefault(key, []).append(data)
+
+    def result(self) -> Dict[str, list]:
+        """ Returns the stored frames of every key.
+
+        :return: Maps each key to a list with the data of every frame, arrays are views into the shared array.
+        """
+        output = {key: list(buffer) for key, buffer in self._buffers.items()}
+        output.update(self._lists)
+        return output
 
 
 class _WriterUtility:
 
     @staticmethod
-    def load_registered_outputs(keys: Set[str], keys_with_alpha_channel: Set[str] = None) -> \
-            Dict[str, Union[np.ndarray, List[np.ndarray]]]:
+    def load_registered_outputs(keys: Set[str], keys_with_alpha_channel: Set[str] = None,
+                                in_memory_outputs: Optional[Dict[str, np.ndarray]] = None,
+                                reuse_buffers: bool = False) -> Dict[str, Union[np.ndarray, List[np.ndarray]]]:
         """
         Loads registered outputs with specified keys
 
+        The frames of each key are stored in one preallocated array, the returned lists contain views into it.
+
         :param keys: set of output_key types to load
         :param keys_with_alpha_channel: A set containing all keys whose alpha channels should be loaded.
+        :param in_memory_outputs: The images of outputs, which were already taken from blender's compositor during
+                                  the rendering of a single frame, mapped by their key. They are used instead of
+                                  the files.
+        :param reuse_buffers: If True, the arrays of the previous call with reuse_buffers are refilled instead of
+                              allocating new ones. The data returned by that call is overwritten then.
         :return: dict of lists of raw loaded outputs. Keys are e.g. 'distance', 'colors', 'normals', 'segmap'
         """
         output_data_dict: Dict[str, Union[np.ndarray, List[np.ndarray]]] = {}
+        frame_buffers = _FrameBuffers(bpy.context.scene.frame_end - bpy.context.scene.frame_start, reuse_buffers)
         reg_outputs = Utility.get_registered_outputs()
         for reg_out in reg_outputs:
             if reg_out['key'] in keys:
@@ -111,18 +349,30 @@ def load_registered_outputs(keys: Set[str], keys_with_alpha_channel: Set[str] =
                     'key'] in keys_with_alpha_channel
                 if '%' in reg_out['path']:
                     # per frame outputs
-                    for frame_id in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end):
+                    for frame_index, frame_id in enumerate(range(bpy.context.scene.frame_start,
+                                                                 bpy.context.scene.frame_end)):
                         output_path = resolve_path(reg_out['path'] % frame_id)
-                        if os.path.exists(output_path):
+                        is_in_frame_buffer = False
+                        if in_memory_outputs is not None and reg_out['key'] in in_memory_outputs:
+                            output_file = in_memory_outputs[reg_out['key']][:, :, :3 + (
+                                1 if key_has_alpha_channel else 0)]
+                        elif os.path.exists(output_path):
                             output_file = _WriterUtility.load_output_file(output_path, key_has_alpha_channel)
                         else:
                             # check for stereo files
                             output_paths = _WriterUtility.get_stereo_path_pair(output_path)
-                            # convert to a tensor of shape [2, img_x, img_y, channels]
+                            # load into a tensor of shape [2, img_x, img_y, channels]
                             # output_file[0] is the left image and output_file[1] the right image
-                            output_file = np.array(
-                                [_WriterUtility.load_output_file(path, key_has_alpha_channel) for path in
-                                 output_paths])
+                            left_image = _WriterUtility.load_output_file(output_paths[0], key_has_alpha_channel)
+                            if _WriterUtility.is_stored_unchanged(reg_out):
+                                # Both eyes are loaded straight into the row of the frame buffer
+                                output_file = frame_buffers.frame_view(reg_out['key'], frame_index,
+                                                                       (2,) + left_image.shape, left_image.dtype)
+                                is_in_frame_buffer = True
+                            else:
+                                output_file = np.empty((2,) + left_image.shape, dtype=left_image.dtype)
+                            output_file[0] = left_image
+                            output_file[1] = _WriterUtility.load_output_file(output_paths[1], key_has_alpha_channel)
                         # For outputs like distance or depth, we automatically trim the last channel here
                         if "trim_redundant_channels" in reg_out and reg_out["trim_redundant_channels"]:
                             output_file = trim_redundant_channels(output_file)
@@ -139,17 +389,41 @@ def load_registered_outputs(keys: Set[str], keys_with_alpha_channel: Set[str] =
                                                                reg_out["semantic_segmentation_mapping"],
                                                                reg_out["semantic_segmentation_default_values"])
                             for key, output_info in output_file.items():
-                                output_data_dict.setdefault(key, []).append(output_info)
-                        else:
-                            output_data_dict.setdefault(reg_out['key'], []).append(output_file)
+                                frame_buffers.store(key, frame_index, output_info)
+                        elif not is_in_frame_buffer:
+                            frame_buffers.store(reg_out['key'], frame_index, output_file)
                 else:
                     # per run outputs
                     output_path = resolve_path(reg_out['path'])
                     output_file = _WriterUtility.load_output_file(output_path, key_has_alpha_channel)
                     output_data_dict[reg_out['key']] = output_file
 
+        output_data_dict.update(frame_buffers.result())
         return output_data_dict
 
+    @staticmethod
+    def to_bgr(color_rgb: np.ndarray) -> np.ndarray:
+        """ Returns the given RGB(A) image in the BGR(A) channel order of opencv.
+
+        Three channel images are returned as a view with reversed channels, which opencv accepts as well.
+
+        :param color_rgb: The color image in RGB(A) channel order.
+        :return: The color image in BGR(A) channel order.
+        """
+        if color_rgb.shape[-1] == 4:
+            return color_rgb[..., [2, 1, 0, 3]]
+        return color_rgb[..., ::-1]
+
+    @staticmethod
+    def is_stored_unchanged(reg_out: Dict[str, Any]) -> bool:
+        """ Checks if the loaded files of the given output are returned without any postprocessing.
+
+        :param reg_out: The registered output.
+        :return: True, if no channels are trimmed and no conversion or mapping is applied.
+        """
+        return not any(reg_out.get(option) for option in ["trim_redundant_channels", "convert_to_depth",
+                                                          "convert_to_distance", "is_semantic_segmentation"])
+
     @staticmethod
     def get_stereo_path_pair(file_path: str) -> Tuple[str, str]:
         """
@@ -341,12 +615,105 @@ def _get_shapenet_attribute(shapenet_obj: bpy.types.Object, attribute_name: str,
                                                    world_frame_change)
 
     @staticmethod
-    def write_to_hdf_file(file, key: str, data: Union[np.ndarray, list, dict], compression: str = "gzip"):
-        """ Adds the given data as a new entry to the given hdf5 file.
+    def split_output_data_into_frames(output_data_dict: Dict[str, List[Union[np.ndarray, list, dict]]]) \
+            -> List[Dict[str, Union[np.ndarray, list, dict]]]:
+        """ Splits the given output data, which contains a list for every key, into the data of the single frames.
 
-        :param file: The hdf5 file handle. Type: hdf5.File
-        :param key: The key at which the data should be stored in the hdf5 file.
-        :param data: The data to store.
+        :param output_data_dict: The container, which keeps the different images of all frames.
+        :return: For every frame a dict, which maps each key to the data of this frame.
+        """
+        amount_of_frames = 0
+        for data_block in output_data_dict.values():
+            if isinstance(data_block, list):
+                amount_of_frames = max([amount_of_frames, len(data_block)])
+
+        if amount_of_frames != bpy.context.scene.frame_end - bpy.context.scene.frame_start:
+            raise Exception("The amount of images stored in the output_data_dict does not correspond with the amount"
+                            "of images specified by frame_start to frame_end.")
+
+        frames = []
+        for adjusted_frame in range(amount_of_frames):
+            frame_data = {}
+            for key, data_block in output_data_dict.items():
+                if adjusted_frame < len(data_block):
+                    # get the current data block for the current frame
+                    frame_data[key] = data_block[adjusted_frame]
+                else:
+                    raise Exception(f"There are more frames {adjusted_frame} then there are blocks of information "
+                                    f" {len(data_block)} in the given list for key {key}.")
+            frames.append(frame_data)
+        return frames
+
+    @staticmethod
+    def separate_stereo_keys(frame_data: Dict[str, Union[np.ndarray, list, dict]], stereo_separate_keys: bool,
+                             use_multiview: bool) -> Dict[str, Union[np.ndarray, list, dict]]:
+        """ Splits stereo data into separate keys for the left and right image, e.g. colors_0 and colors_1.
+
+        :param frame_data: Maps each key to the data of one frame.
+        :param stereo_separate_keys: If this is False, the frame data is returned unchanged.
+        :param use_multiview: Whether the rendering was done in stereo mode.
+        :return: The frame data with separated stereo keys.
+        """
+        if not stereo_separate_keys:
+            return frame_data
+        separated_frame_data = {}
+        for key, data in frame_data.items():
+            if use_multiview or (isinstance(data, np.ndarray) and data.shape[0] == 2):
+                # stereo mode was activated
+                separated_frame_data[key + "_0"] = data[0]
+                separated_frame_data[key + "_1"] = data[1]
+            else:
+                separated_frame_data[key] = data
+        return separated_frame_data
+
+    @staticmethod
+    def find_hdf5_indices(output_dir_path: str, prefix: str = "") -> List[int]:
+        """ Returns the sorted indices of all <prefix><index>.hdf5 files in the given folder.
+
+        :param output_dir_path: The folder to search.
+        :param prefix: The prefix of the file names in front of the index.
+        :return: The sorted indices.
+        """
+        indices = []
+        for path in os.listdir(output_dir_path):
+            if path.startswith(prefix) and path.endswith(".hdf5"):
+                index = path[len(prefix):-len(".hdf5")]
+                if index.isdigit():
+                    indices.append(int(index))
+        return sorted(indices)
+
+    @staticmethod
+    def write_hdf5_frame(hdf5_path: str, frame_data: Dict[str, Union[np.ndarray, list, dict]],
+                         stereo_separate_keys: bool, use_multiview: bool, blender_proc_version: Optional[str],
+                         compression: Optional[str] = "gzip", compression_opts: Optional[int] = None):
+        """ Writes the data of one frame into a new .hdf5 container.
+
+        Does not use the blender API, so it can also be run inside an AsyncWriterPool. The "hdf5_encode" stage is
+        then measured inside the worker process and is not recorded in the metrics of the main process.
+
+        :param hdf5_path: The path of the .hdf5 container to write.
+        :param frame_data: Maps each key to the data of this frame, which should be stored under this key.
+        :param stereo_separate_keys: If this is True, stereo data is saved in separate keys, see write_hdf5().
+        :param use_multiview: Whether the rendering was done in stereo mode.
+        :param blender_proc_version: The BlenderProc version to store in the container, if not None.
+        :param compression: The compression filter of the datasets. None disables the compression.
+        :param compression_opts: The compression level. If None, the default level is used.
+        """
+        with measure_stage("hdf5_encode"), h5py.File(hdf5_path, "w") as file:
+            # Go through all the output types
+            for key, data in _WriterUtility.separate_stereo_keys(frame_data, stereo_separate_keys,
+                                                                 use_multiview).items():
+                _WriterUtility.write_to_hdf_file(file, key, data, compression, compression_opts)
+            if blender_proc_version is not None:
+                _WriterUtility.write_to_hdf_file(file, "blender_proc_version", np.string_(blender_proc_version))
+
+    @staticmethod
+    def to_hdf5_array(key: str, data: Union[np.ndarray, list, dict]) -> np.ndarray:
+        """ Converts the given data into a numpy array, which can be stored in a hdf5 file.
+
+        :param key: The key at which the data should be stored, used for error messages.
+        :param data: The data to convert. Dicts or lists of dicts are serialized into json strings.
+        :return: The converted data.
         """
         if not isinstance(data, np.ndarray) and not isinstance(data, np.bytes_):
             if isinstance(data, (list, dict)):
@@ -358,8 +725,22 @@ def write_to_hdf_file(file, key: str, data: Union[np.ndarray, list, dict], compr
             else:
                 raise Exception(
                     f"This fct. expects the data for key {key} to be a np.ndarray, list or dict not a {type(data)}!")
+        return np.asarray(data)
+
+    @staticmethod
+    def write_to_hdf_file(file, key: str, data: Union[np.ndarray, list, dict], compression: Optional[str] = "gzip",
+                          compression_opts: Optional[int] = None):
+        """ Adds the given data as a new entry to the given hdf5 file.
+
+        :param file: The hdf5 file handle. Type: hdf5.File
+        :param key: The key at which the data should be stored in the hdf5 file.
+        :param data: The data to store.
+        :param compression: The compression filter of the dataset. None disables the compression.
+        :param compression_opts: The compression level. If None, the default level is used.
+        """
+        data = _WriterUtility.to_hdf5_array(key, data)
 
         if data.dtype.char == 'S':
             file.create_dataset(key, data=data, dtype=data.dtype)
         else:
-            file.create_dataset(key, data=data, compression=compression)
+            file.create_dataset(key, data=data, compression=compression, compression_opts=compression_opts)
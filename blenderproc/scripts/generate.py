@@ -0,0 +1,280 @@
+""" Generates a dataset with multiple BlenderProc processes running in parallel and merges their outputs. """
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+repo_root_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The default file names of the merged outputs, as written by the CocoStreamWriter and the Hdf5StreamWriter
+COCO_ANNOTATIONS_FILE_NAME = "coco_annotations.json"
+HDF5_FOLDER_NAME = "hdf5"
+CONSOLIDATED_HDF5_PREFIX = "container_"
+METRICS_FILE_NAME = "metrics.jsonl"
+
+
+def split_into_shards(num_images: int, num_shards: int) -> List[int]:
+    """ Splits the given number of images as evenly as possible into the given number of shards.
+
+    :param num_images: The total number of images to generate.
+    :param num_shards: The number of shards.
+    :return: The number of images of every shard, shards without images are left out.
+    """
+    shard_sizes = [num_images // num_shards + (1 if shard < num_images % num_shards else 0)
+                   for shard in range(num_shards)]
+    return [shard_size for shard_size in shard_sizes if shard_size > 0]
+
+
+def run_shards(script: str, script_args: List[str], output_dir: str, shard_sizes: List[int], seed: int,
+               cpu_threads: int, temp_dir: Optional[str], blender_args: List[str]) -> List[Tuple[str, int]]:
+    """ Runs one BlenderProc process per shard and waits until all of them have finished.
+
+    Every shard gets its own output dir, random seed (via BLENDER_PROC_RANDOM_SEED), temp dir and share of the cpu
+    threads. The script has to accept the arguments --num-images, --output-dir and --cpu-threads.
+
+    :param script: The path to the python script to run.
+    :param script_args: Additional arguments which are given to every run of the script.
+    :param output_dir: The output dir, the outputs of every shard are placed in its subfolder shards/<shard id>.
+    :param shard_sizes: The number of images of every shard.
+    :param seed: The random seed of the first shard, the following shards use the subsequent seeds.
+    :param cpu_threads: The number of cpu threads every process may use for rendering.
+    :param temp_dir: A directory inside which the temp dirs of the shards are created. If None, the default of
+                     blenderproc run is used.
+    :param blender_args: Arguments which are given to blenderproc run itself, e.g. the blender install path.
+    :return: The output dir and return code of every shard.
+    """
+    processes = []
+    for shard_id, shard_size in enumerate(shard_sizes):
+        shard_output_dir = os.path.join(output_dir, "shards", str(shard_id))
+        os.makedirs(shard_output_dir, exist_ok=True)
+
+        cmd = [sys.executable, "-m", "blenderproc", "run", script] + blender_args
+        if temp_dir is not None:
+            shard_temp_dir = os.path.join(temp_dir, f"shard_{shard_id}")
+            os.makedirs(shard_temp_dir, exist_ok=True)
+            cmd += ["--temp-dir", shard_temp_dir]
+        cmd += script_args
+        cmd += ["--num-images", str(shard_size), "--output-dir", shard_output_dir, "--cpu-threads", str(cpu_threads)]
+
+        used_environment = dict(os.environ, BLENDER_PROC_RANDOM_SEED=str(seed + shard_id))
+        # Make sure the child process imports the same blenderproc package as this one
+        used_environment["PYTHONPATH"] = os.pathsep.join([repo_root_directory] + ([os.environ["PYTHONPATH"]]
+                                                                                   if "PYTHONPATH" in os.environ
+                                                                                   else []))
+        log_path = os.path.join(shard_output_dir, "log.txt")
+        print(f"Starting shard {shard_id} with {shard_size} images, log: {log_path}")
+        # pylint: disable=consider-using-with
+        log_file = open(log_path, "w", encoding="utf-8")
+        processes.append((shard_output_dir, subprocess.Popen(cmd, env=used_environment, stdout=log_file,
+                                                             stderr=subprocess.STDOUT), log_file))
+        # pylint: enable=consider-using-with
+
+    results = []
+    try:
+        for shard_id, (shard_output_dir, process, log_file) in enumerate(processes):
+            return_code = process.wait()
+            log_file.close()
+            print(f"Shard {shard_id} finished with return code {return_code}")
+            results.append((shard_output_dir, return_code))
+    except KeyboardInterrupt:
+        for _, process, _ in processes:
+            process.terminate()
+        raise
+    return results
+
+
+def merge_coco_annotations(shard_dirs: List[str], output_dir: str) -> int:
+    """ Merges the coco annotations of the given shards into the coco annotations of the output dir.
+
+    The images are moved into the images folder of the output dir and renamed, such that the image and annotation
+    ids are unique over all shards and over a previously existing coco_annotations.json.
+
+    :param shard_dirs: The output dirs of the shards.
+    :param output_dir: The output dir, into which the coco annotations should be merged.
+    :return: The number of merged images.
+    """
+    coco_annotations_path = os.path.join(output_dir, COCO_ANNOTATIONS_FILE_NAME)
+    merged_coco_annotations: Optional[Dict[str, Any]] = None
+    if os.path.exists(coco_annotations_path):
+        with open(coco_annotations_path, "r", encoding="utf-8") as fp:
+            merged_coco_annotations = json.load(fp)
+    os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
+
+    next_image_id, next_annotation_id = 0, 1
+    if merged_coco_annotations is not None:
+        next_image_id = max((image["id"] for image in merged_coco_annotations["images"]), default=-1) + 1
+        next_annotation_id = max((annotation["id"] for annotation in merged_coco_annotations["annotations"]),
+                                 default=0) + 1
+
+    num_merged_images = 0
+    for shard_dir in shard_dirs:
+        shard_coco_annotations_path = os.path.join(shard_dir, COCO_ANNOTATIONS_FILE_NAME)
+        if not os.path.exists(shard_coco_annotations_path):
+            continue
+        with open(shard_coco_annotations_path, "r", encoding="utf-8") as fp:
+            shard_coco_annotations = json.load(fp)
+        if merged_coco_annotations is None:
+            merged_coco_annotations = {key: value for key, value in shard_coco_annotations.items()
+                                       if key not in ["images", "annotations"]}
+            merged_coco_annotations["images"] = []
+            merged_coco_annotations["annotations"] = []
+
+        for cat_dict in shard_coco_annotations["categories"]:
+            if cat_dict not in merged_coco_annotations["categories"]:
+                merged_coco_annotations["categories"].append(cat_dict)
+
+        new_image_ids = {}
+        for image in shard_coco_annotations["images"]:
+            new_image_ids[image["id"]] = next_image_id
+            # Rename the image after its new id, e.g. images/image_000003.jpg -> images/image_000042.jpg
+            stem, extension = os.path.splitext(os.path.basename(image["file_name"]))
+            file_name = f"images/{re.sub(r'[0-9]+$', '', stem)}{next_image_id:06d}{extension}"
+            shutil.move(os.path.join(shard_dir, image["file_name"]), os.path.join(output_dir, file_name))
+            image["file_name"] = file_name
+            image["id"] = next_image_id
+            next_image_id += 1
+        merged_coco_annotations["images"].extend(shard_coco_annotations["images"])
+
+        for annotation in shard_coco_annotations["annotations"]:
+            annotation["id"] = next_annotation_id
+            annotation["image_id"] = new_image_ids[annotation["image_id"]]
+            next_annotation_id += 1
+        merged_coco_annotations["annotations"].extend(shard_coco_annotations["annotations"])
+        num_merged_images += len(shard_coco_annotations["images"])
+
+    if merged_coco_annotations is not None:
+        print("Writing coco annotations to " + coco_annotations_path)
+        with open(coco_annotations_path, "w", encoding="utf-8") as fp:
+            json.dump(merged_coco_annotations, fp, indent=2)
+    return num_merged_images
+
+
+def merge_hdf5_containers(shard_dirs: List[str], output_dir: str) -> int:
+    """ Moves the .hdf5 containers of the given shards into the hdf5 folder of the output dir.
+
+    The containers are renumbered, such that they continue after the highest index already existing in the output dir.
+    This is done separately for per-frame containers (<index>.hdf5) and consolidated containers
+    (container_<index>.hdf5).
+
+    :param shard_dirs: The output dirs of the shards.
+    :param output_dir: The output dir, into which the hdf5 containers should be merged.
+    :return: The number of merged containers.
+    """
+    hdf5_dir = os.path.join(output_dir, HDF5_FOLDER_NAME)
+    num_merged_containers = 0
+    for prefix, index_format in [("", "{}"), (CONSOLIDATED_HDF5_PREFIX, "{:04d}")]:
+        next_index = max(_find_hdf5_indices(hdf5_dir, prefix), default=-1) + 1
+        for shard_dir in shard_dirs:
+            shard_hdf5_dir = os.path.join(shard_dir, HDF5_FOLDER_NAME)
+            if not os.path.exists(shard_hdf5_dir):
+                continue
+            os.makedirs(hdf5_dir, exist_ok=True)
+            for index in _find_hdf5_indices(shard_hdf5_dir, prefix):
+                shutil.move(os.path.join(shard_hdf5_dir, f"{prefix}{index_format.format(index)}.hdf5"),
+                            os.path.join(hdf5_dir, f"{prefix}{index_format.format(next_index)}.hdf5"))
+                next_index += 1
+                num_merged_containers += 1
+    return num_merged_containers
+
+
+def _find_hdf5_indices(hdf5_dir: str, prefix: str) -> List[int]:
+    """ Returns the sorted indices of all <prefix><index>.hdf5 files in the given dir.
+
+    :param hdf5_dir: The dir containing the numbered .hdf5 containers.
+    :param prefix: The prefix of the file names in front of the index.
+    :return: The sorted indices.
+    """
+    indices = []
+    if os.path.exists(hdf5_dir):
+        for path in os.listdir(hdf5_dir):
+            if path.startswith(prefix) and path.endswith(".hdf5") and path[len(prefix):-len(".hdf5")].isdigit():
+                indices.append(int(path[len(prefix):-len(".hdf5")]))
+    return sorted(indices)
+
+
+def cli():
+    """
+    Command line function
+    """
+    parser = argparse.ArgumentParser("Generates a dataset with multiple BlenderProc processes running in parallel. "
+                                     "All arguments which are not listed here are given to the script.")
+    parser.add_argument('script', help="The python script to run, e.g. code/image_gen.py. It has to accept the "
+                                       "arguments --num-images, --output-dir and --cpu-threads.")
+    parser.add_argument('--num-images', dest='num_images', type=int, required=True,
+                        help="The total number of images to generate.")
+    parser.add_argument('--output-dir', dest='output_dir', required=True,
+                        help="The output dir, into which the outputs of all processes are merged.")
+    parser.add_argument('--processes', type=int, default=2, help="The number of BlenderProc processes to run.")
+    parser.add_argument('--cpu-threads', dest='cpu_threads', type=int, default=None,
+                        help="The number of cpu threads per process. Default: The cpu cores divided by the number "
+                             "of processes.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="The random seed of the first process, the other processes use the subsequent seeds. "
+                             "Default: A random seed.")
+    parser.add_argument('--temp-dir', dest='temp_dir', default=None,
+                        help="A directory inside which the temp dirs of the processes are created.")
+    parser.add_argument('--keep-shards', dest='keep_shards', action='store_true',
+                        help="If set, the output dirs of the single processes are not removed after merging.")
+    parser.add_argument('--blender-install-path', dest='blender_install_path', default=None,
+                        help="Set path where blender should be installed, see blenderproc run.")
+    parser.add_argument('--custom-blender-path', dest='custom_blender_path', default=None,
+                        help="Set, if you want to use a custom blender installation, see blenderproc run.")
+    args, script_args = parser.parse_known_args()
+
+    if args.processes < 1:
+        raise ValueError(f"The number of processes has to be at least one, not {args.processes}")
+    output_dir = os.path.abspath(args.output_dir)
+    cpu_threads = args.cpu_threads if args.cpu_threads is not None else max(1, (os.cpu_count() or 1) //
+                                                                            args.processes)
+    seed = args.seed if args.seed is not None else random.randint(0, 2 ** 31 - 1 - args.processes)
+    shard_sizes = split_into_shards(args.num_images, args.processes)
+
+    blender_args = []
+    if args.blender_install_path is not None:
+        blender_args += ["--blender-install-path", args.blender_install_path]
+    if args.custom_blender_path is not None:
+        blender_args += ["--custom-blender-path", args.custom_blender_path]
+
+    # Install blender once, so the processes do not try to install it at the same time
+    # pylint: disable=import-outside-toplevel
+    from blenderproc.python.utility.InstallUtility import InstallUtility
+    # pylint: enable=import-outside-toplevel
+    custom_blender_path, blender_install_path = InstallUtility.determine_blender_install_path(False, args, [])
+    InstallUtility.make_sure_blender_is_installed(custom_blender_path, blender_install_path)
+
+    print(f"Generating {args.num_images} images in {len(shard_sizes)} processes with {cpu_threads} cpu threads "
+          f"each, starting at seed {seed}")
+    results = run_shards(os.path.abspath(args.script), script_args, output_dir, shard_sizes, seed, cpu_threads,
+                         args.temp_dir, blender_args)
+
+    successful_shard_dirs = [shard_dir for shard_dir, return_code in results if return_code == 0]
+    failed_shard_dirs = [shard_dir for shard_dir, return_code in results if return_code != 0]
+    num_merged_images = merge_coco_annotations(successful_shard_dirs, output_dir)
+    num_merged_containers = merge_hdf5_containers(successful_shard_dirs, output_dir)
+    print(f"Merged {num_merged_images} images and {num_merged_containers} hdf5 containers into {output_dir}")
+
+    # Keep the per-stage timings of every shard
+    for shard_dir in successful_shard_dirs:
+        if os.path.exists(os.path.join(shard_dir, METRICS_FILE_NAME)):
+            os.makedirs(os.path.join(output_dir, "metrics"), exist_ok=True)
+            shutil.move(os.path.join(shard_dir, METRICS_FILE_NAME),
+                        os.path.join(output_dir, "metrics", f"shard_{os.path.basename(shard_dir)}.jsonl"))
+
+    if not args.keep_shards:
+        for shard_dir in successful_shard_dirs:
+            shutil.rmtree(shard_dir)
+        if not failed_shard_dirs and os.path.exists(os.path.join(output_dir, "shards")):
+            shutil.rmtree(os.path.join(output_dir, "shards"))
+    if failed_shard_dirs:
+        print(f"The following shards failed and have not been merged: {', '.join(failed_shard_dirs)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
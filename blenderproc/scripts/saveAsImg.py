@@ -2,15 +2,16 @@
 
 import argparse
 import os
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Union
 
-import h5py
-import numpy as np
+from matplotlib import pyplot as plt
 
 try:
     from visHdf5Files import vis_data
 except ModuleNotFoundError:
     from blenderproc.scripts.visHdf5Files import vis_data
+from blenderproc.python.reader.Hdf5DatasetReader import Hdf5Dataset
 
 
 def save_array_as_image(array, key, file_path):
@@ -18,35 +19,83 @@ def save_array_as_image(array, key, file_path):
     vis_data(key, array, None, "", save_to_file=file_path)
 
 
-def convert_hdf(base_file_path: str, output_folder: Optional[str] = None):
-    """ Convert a hdf5 file to images """
-    if os.path.exists(base_file_path):
-        if os.path.isfile(base_file_path):
-            base_name = str(os.path.basename(base_file_path)).split('.', maxsplit=1)[0]
-            if output_folder is not None:
-                base_name = os.path.join(output_folder, base_name)
-            with h5py.File(base_file_path, 'r') as data:
-                print(f"{base_file_path}:")
-                for key, val in data.items():
-                    val = np.array(val)
-                    if np.issubdtype(val.dtype, np.string_) or len(val.shape) == 1:
-                        pass  # metadata
-                    else:
-                        print(f"key: {key} {val.shape} {val.dtype.name}")
-
-                        if val.shape[0] != 2:
-                            # mono image
-                            file_path = f'{base_name}_{key}.png'
-                            save_array_as_image(val, key, file_path)
-                        else:
-                            # stereo image
-                            for image_index, image_value in enumerate(val):
-                                file_path = f'{base_name}_{key}_{image_index}.png'
-                                save_array_as_image(image_value, key, file_path)
+def convert_frame(dataset: Hdf5Dataset, frame_index: int, output_folder: Optional[str] = None) -> str:
+    """ Convert one frame of a hdf5 dataset to images, only the image keys are read from disk
+
+    :return: The description of the converted keys, which should be printed.
+    """
+    frame = dataset.frame(frame_index)
+    base_name = frame.name
+    if output_folder is not None:
+        base_name = os.path.join(output_folder, base_name)
+    lines = [f"{frame.file_label}:"]
+    for key in frame.keys():
+        shape, dtype = frame.key_info(key)
+        if dtype.char == 'S' or len(shape) <= 1:
+            pass  # metadata
         else:
-            print("The path is not a file")
-    else:
-        print(f"The file does not exist: {base_file_path}")
+            lines.append(f"key: {key} {shape} {dtype.name}")
+            val = frame[key]
+
+            if val.shape[0] != 2:
+                # mono image
+                file_path = f'{base_name}_{key}.png'
+                save_array_as_image(val, key, file_path)
+            else:
+                # stereo image
+                for image_index, image_value in enumerate(val):
+                    file_path = f'{base_name}_{key}_{image_index}.png'
+                    save_array_as_image(image_value, key, file_path)
+    return "\n".join(lines)
+
+
+# The dataset of a worker process, which is set once by _init_worker()
+_worker_dataset: Optional[Hdf5Dataset] = None
+
+
+def _init_worker(dataset: Hdf5Dataset):
+    """ Stores the dataset in the worker process and switches to a non interactive matplotlib backend """
+    # pylint: disable=global-statement
+    global _worker_dataset
+    # pylint: enable=global-statement
+    _worker_dataset = dataset
+    plt.switch_backend("Agg")
+
+
+def _convert_frame_in_worker(frame_index: int, output_folder: Optional[str]) -> str:
+    """ Converts a frame of the dataset of this worker process """
+    return convert_frame(_worker_dataset, frame_index, output_folder)
+
+
+def convert_hdf(base_file_path: Union[str, List[str]], output_folder: Optional[str] = None, workers: int = 1):
+    """ Convert the frames of hdf5 files or folders of hdf5 files to images
+
+    :param base_file_path: A hdf5 file, a folder of hdf5 files or a list of both.
+    :param output_folder: The folder to save the images to. If None, the current directory is used.
+    :param workers: The number of processes converting frames in parallel.
+    """
+    paths = [base_file_path] if isinstance(base_file_path, str) else base_file_path
+    existing_paths = []
+    for path in paths:
+        if os.path.exists(path):
+            existing_paths.append(path)
+        else:
+            print(f"The file does not exist: {path}")
+    if not existing_paths:
+        return
+
+    with Hdf5Dataset(existing_paths) as dataset:
+        if workers > 1 and len(dataset) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dataset,)) as executor:
+                # Neighboring frames share their file, so hand them to the workers in chunks
+                chunksize = max(1, len(dataset) // (4 * workers))
+                # The descriptions are printed in the order of the frames
+                for description in executor.map(_convert_frame_in_worker, range(len(dataset)),
+                                                [output_folder] * len(dataset), chunksize=chunksize):
+                    print(description)
+        else:
+            for frame_index in range(len(dataset)):
+                print(convert_frame(dataset, frame_index, output_folder))
 
 
 def cli():
@@ -54,17 +103,16 @@ def cli():
     Command line function
     """
     parser = argparse.ArgumentParser("Script to save images out of a hdf5 files.")
-    parser.add_argument('hdf5', nargs='+', help='Path to hdf5 file/s')
+    parser.add_argument('hdf5', nargs='+', help='Path to hdf5 file/s or folder/s of hdf5 files')
     parser.add_argument('--output_dir', default=None,
                         help="Determines where the data is going to be saved. Default: Current directory")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="The number of processes, which extract the frames in parallel. Default: 1")
 
     args = parser.parse_args()
 
-    if isinstance(args.hdf5, str):
-        convert_hdf(args.hdf5, args.output_dir)
-    elif isinstance(args.hdf5, list):
-        for file in args.hdf5:
-            convert_hdf(file, args.output_dir)
+    if isinstance(args.hdf5, (str, list)):
+        convert_hdf(args.hdf5, args.output_dir, args.workers)
     else:
         print("Input must be a path")
 
@@ -6,10 +6,11 @@
 import json
 import re
 
-import h5py
 import numpy as np
 from matplotlib import pyplot as plt
 
+from blenderproc.python.reader.Hdf5DatasetReader import Hdf5Dataset
+
 default_rgb_keys = ["colors", "normals", "diffuse", "nocs"]
 default_flow_keys = ["forward_flow", "backward_flow"]
 default_segmap_keys = ["segmap", ".*_segmaps"]
@@ -98,7 +99,7 @@ def vis_data(key, data, full_hdf5_data=None, file_label="", rgb_keys=None, flow_
             segcolormap_key = segcolormap_keys[key_index]
             if full_hdf5_data is not None and segcolormap_key in full_hdf5_data:
                 # Extract segcolormap data
-                segcolormap = json.loads(np.array(full_hdf5_data[segcolormap_key]).tostring())
+                segcolormap = json.loads(np.array(full_hdf5_data[segcolormap_key]).tobytes())
                 if len(segcolormap) > 0:
                     # Go through all columns, we are looking for channel_* ones
                     for colormap_key, colormap_value in segcolormap[0].items():
@@ -154,66 +155,68 @@ def vis_data(key, data, full_hdf5_data=None, file_label="", rgb_keys=None, flow_
             plt.close()
 
 
+def vis_frame(frame, keys_to_visualize=None, rgb_keys=None, flow_keys=None, segmap_keys=None,
+              segcolormap_keys=None, depth_keys=None, depth_max=default_depth_max, save_to_path=None):
+    """ Visualize one frame of a Hdf5Dataset, only the visualized keys are read from disk """
+    print(frame.name + ": ")
+
+    # Select only a subset of keys if args.keys is given
+    if keys_to_visualize is not None:
+        keys = [key for key in frame.keys() if key_matches(key, keys_to_visualize)]
+    else:
+        keys = list(frame.keys())
+
+    # Print the shapes from the index, only small values like the version are read
+    res = []
+    for key in keys:
+        shape, dtype = frame.key_info(key)
+        if sum(ele for ele in shape) < 5 or "version" in key:
+            value = frame[key]
+            if dtype.char == 'S':
+                res.append((key, str(value).replace("[", "").replace("]", "").replace("b'", "").replace("'", "")))
+            else:
+                res.append((key, value))
+        else:
+            res.append((key, shape))
+
+    if res:
+        res = [f"'{key}': {key_res}" for key, key_res in res]
+        print("Keys: " + ', '.join(res))
+
+    for key in keys:
+        value = frame[key]
+        if save_to_path is not None:
+            save_to_file = os.path.join(save_to_path, f"{frame.name}_{key}.png")
+        else:
+            save_to_file = None
+
+        # Check if it is a stereo image
+        if len(value.shape) >= 3 and value.shape[0] == 2:
+            # Visualize both eyes separately
+            for i, img in enumerate(value):
+                if save_to_file:
+                    save_to_file = str(Path(save_to_file).with_suffix("")) + (
+                        "_left" if i == 0 else "_right") + Path(save_to_file).suffix
+                vis_data(key, img, frame, frame.file_label + (" (left)" if i == 0 else " (right)"),
+                         rgb_keys, flow_keys, segmap_keys, segcolormap_keys, depth_keys, depth_max,
+                         save_to_file)
+        else:
+            vis_data(key, value, frame, frame.file_label, rgb_keys, flow_keys, segmap_keys,
+                     segcolormap_keys, depth_keys, depth_max, save_to_file)
+
+
 def vis_file(path, keys_to_visualize=None, rgb_keys=None, flow_keys=None, segmap_keys=None, segcolormap_keys=None,
              depth_keys=None, depth_max=default_depth_max, save_to_path=None):
-    """ Visualize a file """
+    """ Visualize all frames of a file or of a folder of hdf5 files """
     if save_to_path is not None and not os.path.exists(save_to_path):
         os.makedirs(save_to_path)
 
     # Check if file exists
     if os.path.exists(path):
-        if os.path.isfile(path):
-            with h5py.File(path, 'r') as data:
-                print(path + ": ")
-
-                # Select only a subset of keys if args.keys is given
-                if keys_to_visualize is not None:
-                    keys = [key for key in data.keys() if key_matches(key, keys_to_visualize)]
-                else:
-                    keys = list(data.keys())
-
-                # Visualize every key
-                res = []
-                for key in keys:
-                    value = np.array(data[key])
-
-                    if sum(ele for ele in value.shape) < 5 or "version" in key:
-                        if value.dtype == "|S5":
-                            res.append(
-                                (key, str(value).replace("[", "").replace("]", "").replace("b'", "").replace("'", "")))
-                        else:
-                            res.append((key, value))
-                    else:
-                        res.append((key, value.shape))
-
-                if res:
-                    res = [f"'{key}': {key_res}" for key, key_res in res]
-                    print("Keys: " + ', '.join(res))
-
-                for key in keys:
-                    value = np.array(data[key])
-                    if save_to_path is not None:
-                        save_to_file = os.path.join(save_to_path,
-                                                    str(os.path.basename(path)).split('.', maxsplit=1)[0] +
-                                                    f"_{key}.png")
-                    else:
-                        save_to_file = None
-
-                    # Check if it is a stereo image
-                    if len(value.shape) >= 3 and value.shape[0] == 2:
-                        # Visualize both eyes separately
-                        for i, img in enumerate(value):
-                            if save_to_file:
-                                save_to_file = str(Path(save_to_file).with_suffix("")) + (
-                                    "_left" if i == 0 else "_right") + Path(save_to_file).suffix
-                            vis_data(key, img, data, os.path.basename(path) + (" (left)" if i == 0 else " (right)"),
-                                     rgb_keys, flow_keys, segmap_keys, segcolormap_keys, depth_keys, depth_max,
-                                     save_to_file)
-                    else:
-                        vis_data(key, value, data, os.path.basename(path), rgb_keys, flow_keys, segmap_keys,
-                                 segcolormap_keys, depth_keys, depth_max, save_to_file)
-        else:
-            print("The path is not a file")
+        with Hdf5Dataset(path) as dataset:
+            for frame_index in range(len(dataset)):
+                vis_frame(dataset.frame(frame_index), keys_to_visualize, rgb_keys, flow_keys, segmap_keys,
+                          segcolormap_keys, depth_keys, depth_max, save_to_path)
     else:
         print(f"The file does not exist: {path}")
 
@@ -224,7 +227,7 @@ def cli():
     """
     parser = argparse.ArgumentParser("Script to visualize hdf5 files")
 
-    parser.add_argument('hdf5_paths', nargs='+', help='Path to hdf5 file/s')
+    parser.add_argument('hdf5_paths', nargs='+', help='Path to hdf5 file/s or folder/s of hdf5 files')
     parser.add_argument('--keys', nargs='+', help='Keys that should be visualized. If none is given, '
                                                   'all keys are visualized.', default=all_default_keys)
     parser.add_argument('--rgb_keys', nargs='+', help='Keys that should be interpreted as rgb data.',
@@ -1,12 +1,95 @@
 """ Visualize the coco annotations """
 
 import argparse
-import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 
 import numpy as np
 from PIL import Image, ImageFont, ImageDraw
 
+from blenderproc.python.reader.CocoAnnotationReader import CocoAnnotationIndex, rle_to_binary_mask
+
+
+def draw_annotations(index: CocoAnnotationIndex, image_position: int, base_path: str) -> Image.Image:
+    """ Draws the bounding boxes, category names and masks of all annotations of an image
+
+    :param index: The index of the coco annotation file.
+    :param image_position: The position of the image in the images list of the annotation file.
+    :param base_path: The folder, relative to which the image file names are given.
+    :return: The annotated image.
+    """
+    image = index.images[image_position]
+    im = Image.open(os.path.join(base_path, image['file_name']))
+    # The colors only depend on the image, so repeated visualizations look the same
+    random_state = np.random.default_rng(image['id'])
+
+    font = ImageFont.load_default()
+    # Add bounding boxes and masks
+    for annotation in index.annotations_of_image(image['id']):
+        draw = ImageDraw.Draw(im)
+        bb = annotation['bbox']
+        draw.rectangle(((bb[0], bb[1]), (bb[0] + bb[2], bb[1] + bb[3])), fill=None, outline="red")
+        draw.text((bb[0] + 2, bb[1] + 2), index.category_name(annotation["category_id"]), font=font)
+        if isinstance(annotation["segmentation"], dict):
+            im.putalpha(255)
+            rle_seg = annotation["segmentation"]
+            item = rle_to_binary_mask(rle_seg).astype(np.uint8) * 255
+            item = Image.fromarray(item, mode='L')
+            overlay = Image.new('RGBA', im.size)
+            draw_ov = ImageDraw.Draw(overlay)
+            rand_color = random_state.integers(0, 256, 3)
+            draw_ov.bitmap((0, 0), item, fill=(rand_color[0], rand_color[1], rand_color[2], 128))
+            im = Image.alpha_composite(im, overlay)
+        else:
+            # go through all polygons and plot them
+            for item in annotation['segmentation']:
+                poly = Image.new('RGBA', im.size)
+                pdraw = ImageDraw.Draw(poly)
+                rand_color = random_state.integers(0, 256, 3)
+                pdraw.polygon(item, fill=(rand_color[0], rand_color[1], rand_color[2], 127),
+                              outline=(255, 255, 255, 255))
+                im.paste(poly, mask=poly)
+    return im
+
+
+# The index of a worker process, which is set once by _init_worker()
+_worker_index: Optional[CocoAnnotationIndex] = None
+
+
+def _init_worker(annotation_file_path: str):
+    """ Loads the index from its sidecar file in the worker process """
+    # pylint: disable=global-statement
+    global _worker_index
+    # pylint: enable=global-statement
+    _worker_index = CocoAnnotationIndex(annotation_file_path)
+
+
+def _save_annotated_image(image_position: int, base_path: str, output_dir: str) -> str:
+    """ Draws the annotations of an image in a worker process and saves the result """
+    file_path = os.path.join(output_dir, f'coco_annotated_{image_position}.png')
+    draw_annotations(_worker_index, image_position, base_path).save(file_path, "PNG")
+    return file_path
+
+
+def save_annotated_images(annotation_file_path: str, image_positions: List[int], base_path: str, output_dir: str,
+                          workers: int = 1):
+    """ Draws the annotations of multiple images in parallel and saves them as coco_annotated_<position>.png
+
+    :param annotation_file_path: The path of the coco annotation file, its index has to exist already.
+    :param image_positions: The positions of the images in the images list of the annotation file.
+    :param base_path: The folder, relative to which the image file names are given.
+    :param output_dir: The folder to save the annotated images to.
+    :param workers: The number of processes drawing the images.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(annotation_file_path,)) as executor:
+        chunksize = max(1, len(image_positions) // (4 * workers))
+        for file_path in executor.map(_save_annotated_image, image_positions, [base_path] * len(image_positions),
+                                      [output_dir] * len(image_positions), chunksize=chunksize):
+            print(f"Saved {file_path}")
+
 
 def cli():
     """
@@ -21,6 +104,15 @@ def cli():
                         help='path to folder with coco_annotation.json and images', type=str)
     parser.add_argument('--save', '-s', action='store_true',
                         help='saves visualization of coco annotations under base_path/coco_annotated_x.png ')
+    parser.add_argument('--range', dest='image_range', nargs=2, type=int, metavar=('START', 'END'), default=None,
+                        help='saves the visualizations of the images START to END (exclusive) into --output_dir')
+    parser.add_argument('--sample', type=int, default=None,
+                        help='saves the visualizations of this many randomly chosen images into --output_dir')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random image sample')
+    parser.add_argument('--output_dir', default=None,
+                        help='folder for the visualizations of --range or --sample. Default: base_path/coco_annotated')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='the number of processes, which visualize the images of --range or --sample')
 
     args = parser.parse_args()
 
@@ -29,66 +121,25 @@ def cli():
     base_path = args.base_path
     save = args.save
 
-    # Read coco_annotations config
-    with open(os.path.join(base_path, conf), "r", encoding="utf-8") as f:
-        annotations = json.load(f)
-        categories = annotations['categories']
-        images = annotations['images']
-        annotations = annotations['annotations']
-
-    im = Image.open(os.path.join(base_path, images[image_idx]['file_name']))
-
-    def get_category(_id):
-        category = [category["name"] for category in categories if category["id"] == _id]
-        if category:
-            return str(category[0])
-        raise RuntimeError(f"Category {_id} is not defined in {os.path.join(base_path, conf)}")
-
-    def rle_to_binary_mask(rle):
-        """Converts a COCOs run-length encoding (RLE) to binary mask.
-        :param rle: Mask in RLE format
-        :return: a 2D binary numpy array where '1's represent the object
-        """
-        binary_array = np.zeros(np.prod(rle.get('size')), dtype=np.bool)
-        counts = rle.get('counts')
-
-        start = 0
-        for i in range(len(counts) - 1):
-            start += counts[i]
-            end = start + counts[i + 1]
-            binary_array[start:end] = (i + 1) % 2
-
-        binary_mask = binary_array.reshape(*rle.get('size'), order='F')
-
-        return binary_mask
-
-    font = ImageFont.load_default()
-    # Add bounding boxes and masks
-    for annotation in annotations:
-        if annotation["image_id"] == image_idx:
-            draw = ImageDraw.Draw(im)
-            bb = annotation['bbox']
-            draw.rectangle(((bb[0], bb[1]), (bb[0] + bb[2], bb[1] + bb[3])), fill=None, outline="red")
-            draw.text((bb[0] + 2, bb[1] + 2), get_category(annotation["category_id"]), font=font)
-            if isinstance(annotation["segmentation"], dict):
-                im.putalpha(255)
-                rle_seg = annotation["segmentation"]
-                item = rle_to_binary_mask(rle_seg).astype(np.uint8) * 255
-                item = Image.fromarray(item, mode='L')
-                overlay = Image.new('RGBA', im.size)
-                draw_ov = ImageDraw.Draw(overlay)
-                rand_color = np.random.randint(0, 256, 3)
-                draw_ov.bitmap((0, 0), item, fill=(rand_color[0], rand_color[1], rand_color[2], 128))
-                im = Image.alpha_composite(im, overlay)
-            else:
-                # go through all polygons and plot them
-                for item in annotation['segmentation']:
-                    poly = Image.new('RGBA', im.size)
-                    pdraw = ImageDraw.Draw(poly)
-                    rand_color = np.random.randint(0, 256, 3)
-                    pdraw.polygon(item, fill=(rand_color[0], rand_color[1], rand_color[2], 127),
-                                  outline=(255, 255, 255, 255))
-                    im.paste(poly, mask=poly)
+    # The index is only built on the first use of an annotation file, afterwards it is loaded from its sidecar file
+    annotation_file_path = os.path.join(base_path, conf)
+    index = CocoAnnotationIndex(annotation_file_path)
+
+    if args.image_range is not None or args.sample is not None:
+        if args.image_range is not None:
+            image_positions = list(range(args.image_range[0], min(args.image_range[1], len(index.images))))
+        else:
+            image_positions = []
+        if args.sample is not None:
+            candidates = image_positions if image_positions else list(range(len(index.images)))
+            random_state = np.random.default_rng(args.seed)
+            image_positions = sorted(random_state.choice(candidates, min(args.sample, len(candidates)),
+                                                         replace=False).tolist())
+        output_dir = args.output_dir if args.output_dir is not None else os.path.join(base_path, "coco_annotated")
+        save_annotated_images(annotation_file_path, image_positions, base_path, output_dir, max(1, args.workers))
+        return
+
+    im = draw_annotations(index, image_idx, base_path)
     if save:
         im.save(os.path.join(base_path, f'coco_annotated_{image_idx}.png'), "PNG")
     im.show()
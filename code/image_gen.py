@@ -2,10 +2,15 @@
 import bpy # blender python API
 import yaml
 import os
+import argparse
 import numpy as np
+from contextlib import nullcontext
+from mathutils import Vector
+from blenderproc.python.utility.Utility import Utility, KeyFrame
 
 # Constants and Configurations
 CONFIG_FILE = 'image_gen_config.yaml'
+PANDA_TABLE_OFFSET = 0.05  # Height of the Panda armature above the table location.
 
 def load_config(path):
     """
@@ -24,7 +29,7 @@ def load_config(path):
         config = yaml.safe_load(file)  # Use safe_load to prevent the execution of arbitrary code    
     return config
 
-def randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_dimensions):
+def randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_dimensions, frame=None):
     """
     Randomly position and rotate a workpiece on a table.
 
@@ -33,6 +38,7 @@ def randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_d
     table: The table object where the workpiece is placed.
     table_dimensions: The dimensions of the table.
     workpiece_dimensions: The dimensions of the workpiece.
+    frame (int, optional): The keyframe to store the new pose at. Defaults to None.
 
     """
     table_loc = table.get_location()
@@ -45,17 +51,38 @@ def randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_d
     top_surface_z = table_loc[2] + workpiece_height  # Calculate the Z position based on the workpiece height.
 
     # Update workpiece location and rotation
-    workpiece.set_location([new_x, new_y, top_surface_z])
+    workpiece.set_location([new_x, new_y, top_surface_z], frame=frame)
     rnd_rotation = np.random.uniform([0, 0, 0], [0, 0, np.pi])  # Randomize rotation around the Z-axis.
-    workpiece.set_rotation_euler(rnd_rotation)
+    workpiece.set_rotation_euler(rnd_rotation, frame=frame)
 
-def configure_camera_and_lighting(table, table_dimensions, config):
+def create_light(config):
+    """
+    Create the light of the scene. It is created once and only moved for each frame.
+
+    Args:
+    config: Configuration dictionary.
+
+    Returns:
+    The created light.
+
+    """
+    light = bproc.types.Light()
+    light.set_energy(config['light_energy'])
+    light.set_type(config['light_type'])
+    return light
+
+def configure_camera_and_lighting(table, table_dimensions, config, light, frame=None):
     """
     Configure the camera and lighting based on the table's location and specified dimensions.
 
     Args:
     table: The table object to focus the camera on.
     config: Configuration dictionary.
+    light: The persistent light of the scene, which is moved near the camera.
+    frame (int, optional): The keyframe to store the camera and light pose at. Defaults to None.
+
+    Returns:
+    The sampled 4x4 camera to world matrix.
 
     """
     centroid = table.get_local2world_mat()[:3, 3]  # Using the translation part of the matrix for the centroid
@@ -71,18 +98,16 @@ def configure_camera_and_lighting(table, table_dimensions, config):
     # Calculate camera rotation and set up the camera
     rotation_matrix = bproc.camera.rotation_from_forward_vec(poi - location)  # Calculate the rotation matrix to look at the POI.
     cam2world_matrix = bproc.math.build_transformation_mat(location, rotation_matrix)  # Build the transformation matrix for the camera.
-    bproc.camera.add_camera_pose(cam2world_matrix) 
+    bproc.camera.add_camera_pose(cam2world_matrix, frame=frame)
 
     # Set the camera lens to 35mm for a standard field of view.
     bpy.data.cameras['Camera'].lens = config['camera_lens']  
 
     # Configure lighting
-    light = bproc.types.Light()
-    light.set_energy(config['light_energy']) 
-    light.set_type(config['light_type'])  
-    light.set_location(location + np.array([1, -1, 2]))  # Position the light near the camera with some offset.
+    light.set_location(location + np.array([1, -1, 2]), frame=frame)  # Position the light near the camera with some offset.
+    return cam2world_matrix
 
-def set_random_armature_transform_near_table(armature_name, config):
+def set_random_armature_transform_near_table(armature_name, config, frame=None, pose_sampler=None):
     """
     Randomly sets the armature location near the table(hardcoded).
 
@@ -90,6 +115,8 @@ def set_random_armature_transform_near_table(armature_name, config):
     armature: The worker armature name to be transformed.
     table: The table object used as a reference for setting the armature.
     config: Configuration dictionary.
+    frame (int, optional): The keyframe to store the new transform at. Defaults to None.
+    pose_sampler (optional): The bproc.sampler.ArmaturePoseSampler of the worker. Defaults to None.
 
     """
     armature_obj = bpy.data.objects.get(armature_name) 
@@ -104,10 +131,12 @@ def set_random_armature_transform_near_table(armature_name, config):
     armature_obj.location = new_location  
     armature_obj.rotation_mode = 'XYZ'
     armature_obj.rotation_euler = fixed_rotation  
+    Utility.insert_keyframe(armature_obj, "location", frame)
+    Utility.insert_keyframe(armature_obj, "rotation_euler", frame)
 
     print(f"Armature '{armature_name}' updated to location: {new_location} and rotation: {fixed_rotation}")
 
-    randomize_arm_positions(armature_obj, config)  # Randomize the arm positions
+    randomize_arm_positions(armature_obj, config, frame, pose_sampler)  # Randomize the arm positions
 
 def create_sphere_at_location(location, diameter=0.4):
     """
@@ -141,7 +170,7 @@ def create_sphere_at_location(location, diameter=0.4):
     mat.set_principled_shader_value('Transmission', 1.0)  # Enable transmission for glass-like appearance.
     return sphere
 
-def update_sphere_position(sphere, armature, bone_name="Axis-7"):
+def update_sphere_position(sphere, armature, bone_name="Axis-7", frame=None, bone_head=None):
     """
     Update the position of a sphere to match the position of a specified bone in an armature.
 
@@ -149,12 +178,17 @@ def update_sphere_position(sphere, armature, bone_name="Axis-7"):
     sphere: The sphere object to be updated.
     armature: The armature containing the bone.
     bone_name (str): The name of the bone whose position to follow.
+    frame (int, optional): The keyframe to store the new location at. Defaults to None.
+    bone_head (optional): The head of the bone in armature space, e.g. computed by a pose sampler. Defaults to the head of the current pose.
 
     """
     bone = armature.pose.bones.get(bone_name) 
     if bone:
-        sphere.location = armature.matrix_world @ bone.head  # Calculate the global position of the bone and set the sphere's location.
-        bpy.context.view_layer.update()  
+        head = bone.head if bone_head is None else Vector(bone_head)
+        sphere.location = armature.matrix_world @ head  # Calculate the global position of the bone and set the sphere's location.
+        Utility.insert_keyframe(sphere, "location", frame)
+        with bproc.utility.measure_stage("scene_update"):
+            bpy.context.view_layer.update()
         print(f"Updated sphere location to: {sphere.location}")
 
 def load_and_manipulate_objects_from_blend(file_path, object_type=None, link=False):
@@ -203,7 +237,7 @@ def print_armature_bones(armature_name):
         print(f"Bone Name: {bone.name}, Parent: {parent_name}, Location: {bone.head}, Rotation: {bone.rotation_euler}")
     
 
-def randomize_panda_armature_poses(armature_name, table, table_dimensions, config, sphere=None):
+def randomize_panda_armature_poses(armature_name, table, table_dimensions, config, sphere=None, frame=None, pose_sampler=None):
 
     """
     Randomly adjusts the pose of a Panda robot armature based on the table dimensions.
@@ -213,6 +247,10 @@ def randomize_panda_armature_poses(armature_name, table, table_dimensions, confi
     table: The table object where the robot is placed.
     table_dimensions: The dimensions of the table.
     config: Configuration dictionary.
+    sphere: The safety zone sphere following the Axis-7 bone.
+    frame (int, optional): The keyframe to store the new pose at. Defaults to None.
+    pose_sampler (optional): The bproc.sampler.ArmaturePoseSampler of the robot. If given, the bone rotations are taken from its bank
+    of valid poses and written without switching into the pose mode. Defaults to None.
 
     """
     armature = bpy.data.objects.get(armature_name) 
@@ -222,12 +260,25 @@ def randomize_panda_armature_poses(armature_name, table, table_dimensions, confi
     # Generate a new position for the armature
     new_x = np.random.uniform(table_loc[0] - width/2, table_loc[0] + width/2) 
     new_y = np.random.uniform(table_loc[1] - depth/2, table_loc[1] + depth/2)  
-    top_surface_z = table_loc[2] + 0.05 # Set a slight offset for the Z position.
+    top_surface_z = table_loc[2] + PANDA_TABLE_OFFSET # Set a slight offset for the Z position.
 
     # Update the armature location and rotation
     armature.location = (new_x, new_y, top_surface_z)
     armature.rotation_mode = 'XYZ'
     armature.rotation_euler = (0, 0, np.random.uniform(-np.pi/4, np.pi/4))  # Randomize z-axis +/-45°.
+    Utility.insert_keyframe(armature, "location", frame)
+    Utility.insert_keyframe(armature, "rotation_euler", frame)
+
+    if pose_sampler is not None:
+        # Take a configuration without self collisions or table penetration from the bank
+        joint_rotations = pose_sampler.next_pose()
+        pose_sampler.apply(joint_rotations, frame)
+        if sphere is not None and "Axis-7" in pose_sampler.joint_names:
+            with bproc.utility.measure_stage("scene_update"):
+                bpy.context.view_layer.update()  # Update the world matrix of the moved armature
+            update_sphere_position(sphere, armature, "Axis-7", frame, pose_sampler.bone_head(joint_rotations, "Axis-7"))
+        print("Random rotations applied to Panda armature from the pose bank.")
+        return
 
     # Switch to pose mode to manipulate the armature bones.
     bpy.context.view_layer.objects.active = armature
@@ -240,110 +291,357 @@ def randomize_panda_armature_poses(armature_name, table, table_dimensions, confi
             random_angle = np.random.uniform(*limits)
             bone.rotation_mode = 'XYZ'
             bone.rotation_euler = (0, 0, random_angle) 
+            Utility.insert_keyframe(bone, "rotation_euler", frame)
 
-            if bone_name == "Axis-7":
-                update_sphere_position(sphere, armature, bone_name)  # Update sphere's position to Axis 7 bone during randomization
+            if bone_name == "Axis-7" and sphere is not None:
+                update_sphere_position(sphere, armature, bone_name, frame)  # Update sphere's position to Axis 7 bone during randomization
 
     # Return to object mode after manipulating the armature            
     bpy.ops.object.mode_set(mode='OBJECT')
     print("Random rotations applied to Panda armature with realistic limits.")
 
 
-def randomize_arm_positions(armature_obj, config):
+def worker_joint_limits(config):
+    """
+    Get the rotation limits of the randomized worker bones.
+
+    Args:
+    config: Configuration dictionary.
+
+    Returns:
+    dict: The [min, max] limits around the X, Y and Z axes per bone name.
+
+    """
+    joint_limits = {}
+    for bone_name in config['bones_to_randomize_worker']:
+        # Different ranges for realism: forward positioning, side-to-side movement and twist
+        x_limits, y_limits, z_limits = np.array([-0.52, 1.57]), np.array([-0.26, 1.57]), np.array([0, 0.3])
+        if 'Forearm' in bone_name:
+            # More restricted movement for forearms
+            x_limits, y_limits, z_limits = x_limits * 0.5, y_limits * 0.3, z_limits * 0.2
+        joint_limits[bone_name] = {'X': x_limits.tolist(), 'Y': y_limits.tolist(), 'Z': z_limits.tolist()}
+    return joint_limits
+
+def create_pose_samplers(config, robot_armature_name, worker_armature_name):
+    """
+    Create the pose banks of the robot and the worker, which sample their bone rotations in batches and reject
+    configurations with self collisions or, for the robot, penetrating the table.
+
+    Args:
+    config: Configuration dictionary.
+    robot_armature_name (str): The name of the robot armature.
+    worker_armature_name (str): The name of the worker armature.
+
+    Returns:
+    tuple: The bproc.sampler.ArmaturePoseSampler of the robot and of the worker, both are None if the pose bank is disabled.
+
+    """
+    pose_bank_config = config.get('pose_bank', {})
+    if not pose_bank_config.get('enabled', False):
+        return None, None
+    batch_size = pose_bank_config.get('batch_size', 1000)
+
+    robot_armature = bpy.data.objects.get(robot_armature_name)
+    # The table top in armature space, the robot is placed PANDA_TABLE_OFFSET above the table location
+    min_height = (pose_bank_config.get('robot_min_height_above_table', 0.0) - PANDA_TABLE_OFFSET) / robot_armature.scale[2]
+    robot_sampler = bproc.sampler.ArmaturePoseSampler(robot_armature, config['bones_to_randomize'],
+                                                      capsule_radii=pose_bank_config.get('robot_capsule_radii'),
+                                                      min_height=min_height, batch_size=batch_size)
+    worker_sampler = bproc.sampler.ArmaturePoseSampler(bpy.data.objects.get(worker_armature_name), worker_joint_limits(config),
+                                                       capsule_radii=pose_bank_config.get('worker_capsule_radii'),
+                                                       batch_size=batch_size)
+    return robot_sampler, worker_sampler
+
+def randomize_arm_positions(armature_obj, config, frame=None, pose_sampler=None):
     """
     Randomize the rotations of specified arm bones in an armature object.
     
     Args:
     armature_obj: The worker object whose arm positions will be randomized.
+    frame (int, optional): The keyframe to store the bone rotations at. Defaults to None.
+    pose_sampler (optional): The bproc.sampler.ArmaturePoseSampler of the worker. If given, the bone rotations are taken from its bank
+    of valid poses and written without switching into the pose mode. Defaults to None.
 
     """ 
+    if pose_sampler is not None:
+        # Take a configuration without self collisions from the bank
+        pose_sampler.apply(pose_sampler.next_pose(), frame)
+        print("Armature location and rotation updated with random arm positions from the pose bank.")
+        return
+
     # Switch to pose mode to manipulate the armature bones.
     bpy.context.view_layer.objects.active = armature_obj
     bpy.ops.object.mode_set(mode='POSE')   
-    for bone_name in config['bones_to_randomize_worker']:
+    for bone_name, limits in worker_joint_limits(config).items():
         bone = armature_obj.pose.bones.get(bone_name)  
         if bone:
             bone.rotation_mode = 'XYZ'
 
-            # Generate random rotation angles with different ranges for realism
-            x_angle = np.random.uniform(-0.52, 1.57)  # forward positioning
-            y_angle = np.random.uniform(-0.26, 1.57)  # side-to-side movement
-            z_angle = np.random.uniform(0, 0.3)  # twist
-
-            if 'Forearm' in bone_name:
-                # More restricted movement for forearms
-                rotation = (x_angle * 0.5, y_angle * 0.3, z_angle * 0.2)
-            else:
-                rotation = (x_angle, y_angle, z_angle)  
+            # Generate random rotation angles within the limits of the bone
+            rotation = tuple(np.random.uniform(*limits[axis]) for axis in ('X', 'Y', 'Z'))
 
             bone.rotation_euler = rotation  # Apply the calculated rotation to the bone
+            Utility.insert_keyframe(bone, "rotation_euler", frame)
             print(f"{bone_name} rotation set to: {bone.rotation_euler}")  
 
     bpy.ops.object.mode_set(mode='OBJECT')  # Return to object mode after modifying the armature
     print("Armature location and rotation updated with random arm positions.")
 
+def collect_armature_meshes(armature_name):
+    """
+    Collect the names of the mesh objects which belong to an armature, i.e. its (indirect) children and the meshes
+    deformed by it.
+
+    Args:
+    armature_name (str): The name of the armature.
+
+    Returns:
+    set: The names of the mesh objects.
+
+    """
+    armature = bpy.data.objects.get(armature_name)
+    mesh_names = set()
+    if armature is None:
+        return mesh_names
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        parent = obj.parent
+        while parent is not None and parent != armature:
+            parent = parent.parent
+        is_deformed = any(modifier.type == 'ARMATURE' and modifier.object == armature for modifier in obj.modifiers)
+        if parent == armature or is_deformed:
+            mesh_names.add(obj.name)
+    return mesh_names
+
+def estimate_visible_fractions(ray_caster, cam2world_matrix, visibility_categories, sqrt_number_of_rays, zone_ray_caster=None):
+    """
+    Estimate the fraction of the image covered by each category with a grid of rays sent from the camera.
+
+    Args:
+    ray_caster: The bproc.camera.SceneRayCaster of the opaque objects of the scene.
+    cam2world_matrix: The 4x4 camera to world matrix of the current scene state.
+    visibility_categories (dict): Maps each category name to the set of names of its mesh objects.
+    sqrt_number_of_rays (int): The square root of the number of rays.
+    zone_ray_caster: A bproc.camera.SceneRayCaster of only the transparent safety zone. The zone is visible where it
+    lies in front of the first opaque object. If None, the safety_zone fraction is not estimated.
+
+    Returns:
+    dict: The visible fraction of every category.
+
+    """
+    origin, directions = bproc.camera.camera_ray_bundle(cam2world_matrix, sqrt_number_of_rays)
+    # The ray casters only rebuild the trees of objects, which were moved or deformed by the armatures
+    distances, hit_objects = ray_caster.cast(origin, directions)
+    hits_per_object = np.bincount(hit_objects[hit_objects >= 0], minlength=len(ray_caster.objects))
+    object_names = [obj.get_name() for obj in ray_caster.objects]
+
+    fractions = {category: sum(int(hits) for name, hits in zip(object_names, hits_per_object) if name in mesh_names) / len(directions)
+                 for category, mesh_names in visibility_categories.items()}
+    if zone_ray_caster is not None:
+        # The safety zone does not hide the objects behind it, so it is not part of the occluders
+        zone_distances, _ = zone_ray_caster.cast(origin, directions)
+        fractions['safety_zone'] = np.count_nonzero(zone_distances < distances) / len(directions)
+    return fractions
+
 def render_scene(config, table, workpiece, robot_armature_name, worker_armature_name, table_dimensions, workpiece_dimensions, output_dir, sphere=None):
     """
     Render the scene multiple times with different randomizations and save the outputs.
 
+    The images are rendered in batches of config['batch_size']: every randomized scene state of a batch is stored
+    as its own keyframe, so that all of them are rendered within a single render call.
+
     Args:
     config: Configuration dictionary,
     workpiece: The workpiece object to be randomized.
     table: The table object where the workpiece is placed.
     table_dimensions: The dimensions of the table.
     workpiece_dimensions: The dimensions of the workpiece.
-    sphere: The sphere object to visualize the robot's reach.
+    sphere: The sphere object to visualize the robot's reach. If None, it is created once when config['safetyzone'] is set.
     robot_armature_name: Name of the robot object to be rendered.
     worker_armature_name: Name of the worker object to be rendered.
 
     """
-
-    for i in range(config['num_images']):
-        bproc.utility.reset_keyframes()  # Reset keyframes for each render to ensure a clean start.
-
-        # Configure camera and lighting for each render iteration.
-        configure_camera_and_lighting(table, table_dimensions, config)
-
-        # Create a safety zone sphere to visualize the robot's reach
-        if config['safetyzone']:
-            # Remove existing spheres before creating a new one
-            for obj in bpy.data.objects:
-                if obj.name.startswith('SafetyZone'):
-                    bpy.data.objects.remove(obj, do_unlink=True)
-            sphere = create_sphere_at_location([0, 0, 0], diameter= config['safety_zone_radius'])
-            sphere['category_id'] = config['category_ids']['SafetyZone']
-
-        # Randomize object positions and updates for each render.
-        randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_dimensions)
-        randomize_panda_armature_poses(robot_armature_name, table, table_dimensions, config, sphere)
-        set_random_armature_transform_near_table(worker_armature_name, config)
-
-        # Perform the rendering
-        bproc.renderer.set_max_amount_of_samples(128)  # Set the number of samples for rendering: default:1024.
-
-        data = bproc.renderer.render() 
-        seg_data = bproc.renderer.render_segmap(map_by=["instance", "class", "name"], default_values={"category_id": 0, "class_label": 'background'}) # Render segmentation map
-
-        # Save rendered images and segmentation maps
-        bproc.writer.write_coco_annotations(
-            output_dir= output_dir,
-            instance_segmaps=seg_data["instance_segmaps"],
-            instance_attribute_maps=seg_data["instance_attribute_maps"],
-            colors=data["colors"],
-            color_file_format="JPEG",
-            jpg_quality=100,
+    num_images = config['num_images']
+    batch_size = max(1, config.get('batch_size', 1))
+
+    # Set the number of samples for rendering: default:1024.
+    bproc.renderer.set_max_amount_of_samples(128)
+
+    if config['hdf5']:
+        # Enable normals output for the HDF5 container
+        bproc.renderer.enable_normals_output()
+
+    single_pass_segmentation = config.get('single_pass_segmentation', False)
+    # Outputs which are copied directly from the compositor instead of the temp files (only for batch_size 1)
+    in_memory_outputs = set(config.get('in_memory_outputs', []))
+    # Keep the segmentation materials between the segmentation renders instead of undoing them after every render
+    segmap_material_cache = config.get('segmap_material_cache', True)
+    if single_pass_segmentation:
+        # Take the segmentation maps from the object index pass of the RGB render instead of a second render
+        bproc.renderer.enable_segmentation_output(map_by=["instance", "class", "name"], default_values={"category_id": 0, "class_label": 'background'})
+
+    # The light and the safety zone are created once and only moved for each frame, so the scene does not grow over
+    # the iterations.
+    light = create_light(config)
+
+    # Create a safety zone sphere to visualize the robot's reach
+    if config['safetyzone'] and sphere is None:
+        # Remove existing spheres before creating a new one
+        for obj in bpy.data.objects:
+            if obj.name.startswith('SafetyZone'):
+                mesh = obj.data
+                bpy.data.objects.remove(obj, do_unlink=True)
+                if mesh is not None and mesh.users == 0:
+                    bpy.data.meshes.remove(mesh)  # Do not leave the mesh behind as an orphaned datablock
+        sphere = create_sphere_at_location([0, 0, 0], diameter= config['safety_zone_radius'])
+        sphere['category_id'] = config['category_ids']['SafetyZone']
+        if single_pass_segmentation:
+            # The new sphere needs its own object index to show up in the segmentation pass
+            sphere.pass_index = max(obj.pass_index for obj in bpy.data.objects) + 1
+
+    # Optionally take the bone rotations of the robot and the worker from banks of valid poses
+    robot_pose_sampler, worker_pose_sampler = create_pose_samplers(config, robot_armature_name, worker_armature_name)
+
+    # Optionally reject and resample scene states before rendering, in which the robot, the worker or the safety zone
+    # are hardly visible. Their visible fractions are estimated with a coarse grid of rays from the camera.
+    gate_config = config.get('visibility_gate', {})
+    ray_caster = None
+    zone_ray_caster = None
+    max_tries = 1
+    if gate_config.get('enabled', False):
+        visibility_categories = {
+            'robot': collect_armature_meshes(robot_armature_name),
+            'worker': collect_armature_meshes(worker_armature_name)
+        }
+        # Categories which do not exist in the scene are not checked
+        existing_categories = {category for category, mesh_names in visibility_categories.items() if mesh_names}
+        if sphere is not None:
+            existing_categories.add('safety_zone')
+        min_visible_fraction = {category: threshold for category, threshold in gate_config.get('min_visible_fraction', {}).items()
+                                if category in existing_categories}
+        # The transparent safety zone does not occlude anything, its visibility is estimated with its own ray caster
+        ray_caster = bproc.camera.SceneRayCaster([obj for obj in bproc.object.get_all_mesh_objects()
+                                                  if obj.blender_obj.visible_get() and obj.blender_obj != sphere])
+        if sphere is not None:
+            zone_ray_caster = bproc.camera.SceneRayCaster([bproc.types.MeshObject(sphere)])
+        max_tries = max(1, gate_config.get('max_tries', 10))
+    total_rejections = 0
+    total_gate_failures = 0
+
+    # Record the time of every stage per batch into metrics.jsonl next to the output. Nested stages like
+    # cycles_render, exr_decode, jpeg_write, coco_encode and hdf5_encode are measured inside BlenderProc, the
+    # depsgraph updates during the randomization are measured as scene_update.
+    metrics = None
+    if config.get('metrics', True):
+        metrics = bproc.utility.MetricsRegistry(os.path.join(output_dir, "metrics.jsonl")).activate()
+
+    # Optionally encode and write the outputs in background processes, while the next batch is rendered.
+    writer_workers = config.get('writer_workers', 0)
+    writer_pool = bproc.writer.AsyncWriterPool(num_workers=writer_workers) if writer_workers > 0 else None
+
+    # The HDF5 writer keeps track of the next frame index and, in consolidated mode, keeps its container open.
+    hdf5_consolidated = config.get('hdf5_consolidated', False)
+    hdf5_writer_context = nullcontext()
+    if config['hdf5']:
+        hdf5_writer_context = bproc.writer.Hdf5StreamWriter(
+            os.path.join(output_dir, "hdf5"),
             append_to_existing_output=True,
-            file_prefix='image_',
-            indent=2
+            consolidated=hdf5_consolidated,
+            frames_per_container=config.get('hdf5_frames_per_container'),
+            compression=config.get('hdf5_compression', 'gzip'),
+            compression_opts=config.get('hdf5_compression_level'),
+            writer_pool=None if hdf5_consolidated else writer_pool
         )
 
-        if config['hdf5']:
-            # Enable segmentation map and normals output for the HDF5 container
-            bproc.renderer.enable_normals_output()
-            # write the data to a .hdf5 container
-            bproc.writer.write_hdf5(output_dir + "/hdf5", data, append_to_existing_output=True)
-
-        print(f"Rendered and saved image {i+1}/{config['num_images']}") 
+    # The loaded frames of one batch are written before the next batch is rendered, or copied when handed to the
+    # writer processes, so the next batch can be loaded into the same arrays.
+    reuse_output_buffers = writer_pool is None or writer_pool.copies_arguments
+
+    # The coco annotations are collected frame by frame and written to coco_annotations.json once at the end.
+    # The writers are closed before the writer pool, so they can still collect their pending records.
+    with writer_pool or nullcontext(), hdf5_writer_context as hdf5_writer, bproc.writer.CocoStreamWriter(
+        output_dir=output_dir,
+        color_file_format="JPEG",
+        jpg_quality=100,
+        append_to_existing_output=True,
+        file_prefix='image_',
+        indent=2,
+        writer_pool=writer_pool
+    ) as coco_writer:
+        for batch_start in range(0, num_images, batch_size):
+            num_frames_in_batch = min(batch_size, num_images - batch_start)
+            bproc.utility.reset_keyframes()  # Reset keyframes for each batch to ensure a clean start.
+
+            batch_rejections = 0
+            batch_gate_failures = 0
+            with bproc.utility.measure_stage("randomization"):
+                for frame in range(num_frames_in_batch):
+                    # Store each randomized scene state as its own keyframe.
+                    with KeyFrame(frame):
+                        for _ in range(max_tries):
+                            # Configure camera and lighting for each frame.
+                            cam2world_matrix = configure_camera_and_lighting(table, table_dimensions, config, light, frame)
+
+                            # Randomize object positions and updates for each frame.
+                            randomize_workpiece_on_table(workpiece, table, table_dimensions, workpiece_dimensions, frame)
+                            randomize_panda_armature_poses(robot_armature_name, table, table_dimensions, config, sphere, frame,
+                                                           robot_pose_sampler)
+                            set_random_armature_transform_near_table(worker_armature_name, config, frame, worker_pose_sampler)
+
+                            if ray_caster is None:
+                                break
+                            with bproc.utility.measure_stage("visibility_gate"):
+                                fractions = estimate_visible_fractions(ray_caster, cam2world_matrix, visibility_categories,
+                                                                       gate_config.get('sqrt_number_of_rays', 24),
+                                                                       zone_ray_caster)
+                            if all(fractions[category] >= threshold for category, threshold in min_visible_fraction.items()):
+                                break
+                            batch_rejections += 1
+                            print(f"Rejected scene state of frame {frame}, visible fractions: {fractions}")
+                        else:
+                            # The budget is used up, the last scene state is rendered anyway to keep the number of images
+                            batch_gate_failures += 1
+                            print(f"Warning: No scene state of frame {frame} passed the visibility gate within {max_tries} tries")
+            total_rejections += batch_rejections
+            total_gate_failures += batch_gate_failures
+
+            # Render all keyframes of the batch at once
+            with bproc.utility.measure_stage("render"):
+                data = bproc.renderer.render(in_memory_keys=in_memory_outputs, reuse_output_buffers=reuse_output_buffers)
+            if single_pass_segmentation:
+                seg_data = data  # The segmentation maps were already rendered alongside the colors
+            else:
+                with bproc.utility.measure_stage("segmap_render"):
+                    seg_data = bproc.renderer.render_segmap(map_by=["instance", "class", "name"], default_values={"category_id": 0, "class_label": 'background'}, use_material_cache=segmap_material_cache, in_memory="segmap" in in_memory_outputs) # Render segmentation map
+
+            # Save rendered images and segmentation maps
+            with bproc.utility.measure_stage("coco_write"):
+                coco_writer.write(
+                    instance_segmaps=seg_data["instance_segmaps"],
+                    instance_attribute_maps=seg_data["instance_attribute_maps"],
+                    colors=data["colors"]
+                )
+
+            if hdf5_writer is not None:
+                # write the data to the .hdf5 container(s)
+                with bproc.utility.measure_stage("hdf5_write"):
+                    hdf5_writer.write(data)
+
+            if metrics is not None:
+                gate_values = {}
+                if ray_caster is not None:
+                    gate_values = {"visibility_rejections": batch_rejections, "visibility_gate_failures": batch_gate_failures}
+                metrics.end_frame(num_images=num_frames_in_batch, **gate_values)
+            print(f"Rendered and saved image {batch_start + num_frames_in_batch}/{num_images}") 
+
+    if ray_caster is not None:
+        print(f"Visibility gate: {total_rejections} scene states rejected, {total_gate_failures} frames rendered "
+              f"without passing the gate")
+
+    if metrics is not None:
+        # Print where the time went and append the summary to the metrics file
+        metrics.close()
 
 def assign_category_ids(category_dict):
     """
@@ -368,14 +666,25 @@ def main():
     # Get the base directory (where your script or config file is located)
     base_dir = os.path.dirname(os.path.abspath(__file__))
 
-    config_path = os.path.join(base_dir, CONFIG_FILE)
+    # Command line arguments override the config file, e.g. when running as one shard of `blenderproc generate`.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipeline_config', default=os.path.join(base_dir, CONFIG_FILE), help="Path to the config file.")
+    parser.add_argument('--num-images', dest='num_images', type=int, default=None, help="Overrides num_images of the config.")
+    parser.add_argument('--output-dir', dest='output_dir', default=None, help="Overrides output_dir of the config.")
+    parser.add_argument('--cpu-threads', dest='cpu_threads', type=int, default=0, help="Number of cpu threads used for rendering (0 = all).")
+    args, _ = parser.parse_known_args()
 
     # Load configuration settings from file.
-    config = load_config(config_path)
+    config = load_config(args.pipeline_config)
+    if args.num_images is not None:
+        config['num_images'] = args.num_images
 
     # Initialize BlenderProc.
     bproc.init()
 
+    # Limit the render threads, so that multiple processes can share the cpu cores.
+    bproc.renderer.set_cpu_threads(args.cpu_threads)
+
     # set the camera resolution
     bproc.camera.set_resolution(config['img_width'], config['img_height'])
 
@@ -386,7 +695,7 @@ def main():
     scene_path = os.path.join(base_dir, config['scene_path'])
     panda_path = os.path.join(base_dir, config['panda_path'])
     worker_path = os.path.join(base_dir, config['worker_path'])
-    output_dir = os.path.join(base_dir, config['output_dir'])
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir is not None else os.path.join(base_dir, config['output_dir'])
 
     # Load scene and objects from specified file paths.
     scene = bproc.loader.load_blend(path=scene_path)
@@ -3,6 +3,9 @@
 import os.path
 import numpy as np
 import bpy
+from scipy.ndimage import map_coordinates
+
+from blenderproc.python.camera.LensDistortionUtility import _RemapTables
 
 resource_folder = os.path.join(os.path.dirname(__file__), "..", "examples", "resources")
 
@@ -47,3 +50,76 @@ def test_camera_rotation_from_forward_vec(self):
         for x, y in zip(np.reshape(correct_roation_matrix, -1).tolist(), np.reshape(calc_rotation_matrix, -1).tolist()):
             self.assertAlmostEqual(x, y, places=6)
 
+    def test_camera_rotation_from_forward_vecs(self):
+        """ Tests if the batched camera rotations match the rotations of single forward vectors.
+        """
+        forward_vecs = np.random.normal(size=(100, 3))
+        # Also check looking straight up and down
+        forward_vecs[:2] = [[0, 0, -1], [0, 0, 1]]
+        inplane_rots = np.random.uniform(-np.pi, np.pi, 100)
+
+        calc_rotation_matrices = bproc.camera.rotation_from_forward_vecs(forward_vecs, inplane_rots=inplane_rots)
+
+        for forward_vec, inplane_rot, calc_rotation_matrix in zip(forward_vecs, inplane_rots, calc_rotation_matrices):
+            correct_rotation_matrix = bproc.camera.rotation_from_forward_vec(forward_vec, inplane_rot=inplane_rot)
+            np.testing.assert_allclose(calc_rotation_matrix, correct_rotation_matrix, atol=1e-5)
+
+    def test_lens_distortion_remap_nearest(self):
+        """ Tests if the nearest neighbor remapping is bit identical to scipy's map_coordinates.
+        """
+        rng = np.random.default_rng(0)
+        orig_res_y, orig_res_x = 12, 16
+        mapping_coords = rng.uniform(-3, [23, 27], (orig_res_y * orig_res_x, 2)).T
+        # Pixel centers, coordinates exactly between two pixels and coordinates outside of the image
+        mapping_coords[:, :3] = [[4, 4.5, -0.5], [7, 6.5, 19.5]]
+        mapping_coords[:, 3:6] = [[-2.5, 19.5, 0.49999], [21.5, -1, 18.5]]
+        remap_tables = _RemapTables(mapping_coords, orig_res_y, orig_res_x)
+
+        for dtype in [np.uint8, np.uint16, np.int32, np.float32, np.float64]:
+            for shape in [(20, 24), (20, 24, 3)]:
+                image = rng.uniform(0, 200, shape).astype(dtype)
+                if len(shape) == 2:
+                    correct = map_coordinates(image, mapping_coords, order=0, mode='nearest')
+                else:
+                    correct = np.stack([map_coordinates(image[:, :, channel], mapping_coords, order=0,
+                                                        mode='nearest') for channel in range(shape[2])], axis=-1)
+                correct = correct.reshape((orig_res_y, orig_res_x) + shape[2:])
+
+                image_distorted = remap_tables.remap_nearest(image)
+                self.assertEqual(image_distorted.dtype, dtype)
+                np.testing.assert_array_equal(image_distorted, correct)
+
+    def test_scene_ray_caster_moved_objects(self):
+        """ Tests if the hits of the scene ray caster follow objects, which are moved or deformed between casts.
+        """
+        bproc.clean_up(True)
+        static = bproc.object.create_primitive("CUBE")
+        moved = bproc.object.create_primitive("CUBE", location=[3, 0, 0])
+        deformed = bproc.object.create_primitive("CUBE", location=[-3, 0, 0])
+        # Moves all vertices along z, without changing the pose of the object
+        displace = deformed.blender_obj.modifiers.new("displace", "DISPLACE")
+        displace.direction = "Z"
+        displace.mid_level = 0.5
+        displace.strength = 0
+
+        ray_caster = bproc.camera.SceneRayCaster([static, moved, deformed])
+        # One ray straight down onto every cube
+        origins, directions = np.array([[0, 0, 10], [3, 0, 10], [-3, 0, 10]]), np.array([0, 0, -1])
+        distances, hit_objects = ray_caster.cast(origins, directions)
+        np.testing.assert_allclose(distances, [9, 9, 9], atol=1e-5)
+        np.testing.assert_array_equal(hit_objects, [0, 1, 2])
+
+        moved.set_location([3, 0, -2])
+        displace.strength = 1
+        distances, hit_objects = ray_caster.cast(origins, directions)
+        np.testing.assert_allclose(distances, [9, 11, 8.5], atol=1e-5)
+        np.testing.assert_array_equal(hit_objects, [0, 1, 2])
+        self.assertIs(ray_caster.hit_object(ray_caster.ray_cast([3, 0, 10], [0, 0, -1])[2]), moved)
+        static_tree = ray_caster._trees.static_tree
+
+        # Only the tree of the changed objects is rebuilt from now on
+        moved.set_location([3, 5, 0])
+        distances, hit_objects = ray_caster.cast(origins, directions)
+        np.testing.assert_allclose(distances, [9, np.inf, 8.5], atol=1e-5)
+        np.testing.assert_array_equal(hit_objects, [0, -1, 2])
+        self.assertIs(ray_caster._trees.static_tree, static_tree)
@@ -0,0 +1,76 @@
+import blenderproc as bproc
+
+import unittest
+import numpy as np
+
+from blenderproc.python.utility.CollisionUtility import CollisionUtility
+
+
+class UnitTestCheckCollision(unittest.TestCase):
+
+    def test_collision_index_broad_phase(self):
+        """ Tests if the collision index finds exactly the boxes whose world aligned bounding boxes overlap.
+        """
+        bproc.clean_up(True)
+        # Cubes with a half extent of one
+        center = bproc.object.create_primitive("CUBE")
+        overlapping = bproc.object.create_primitive("CUBE", location=[1.5, 0, 0])
+        touching = bproc.object.create_primitive("CUBE", location=[0, 2, 0])
+        far = bproc.object.create_primitive("CUBE", location=[5, 0, 0])
+        # The bounding box of the rotated cube reaches sqrt(2) from its center, so it stays clear of the center cube
+        rotated = bproc.object.create_primitive("CUBE", location=[0, 0, -2.5], rotation=[np.pi / 4, 0, 0])
+        boxes = [center, overlapping, touching, far, rotated]
+
+        collision_index = bproc.object.CollisionIndex(boxes)
+        self.assertEqual(len(collision_index), 5)
+        bb_min, bb_max = collision_index.bound_box_of(rotated)
+        np.testing.assert_allclose(bb_min, [-1, -np.sqrt(2), -2.5 - np.sqrt(2)], atol=1e-6)
+        np.testing.assert_allclose(bb_max, [1, np.sqrt(2), -2.5 + np.sqrt(2)], atol=1e-6)
+
+        # Touching bounding boxes also count as overlapping, the box itself is never returned
+        self.assertEqual(collision_index.overlapping_objects(center, boxes), [overlapping, touching])
+        self.assertEqual(collision_index.overlapping_objects(far, boxes), [])
+
+        # Moved boxes are only found after the index has been synced
+        far.set_location([0, 0, 1.5])
+        self.assertEqual(collision_index.overlapping_objects(center, boxes), [overlapping, touching])
+        collision_index.sync(boxes)
+        self.assertEqual(collision_index.overlapping_objects(center, boxes), [overlapping, touching, far])
+
+        collision_index.remove(overlapping)
+        self.assertNotIn(overlapping, collision_index)
+        self.assertEqual(len(collision_index), 4)
+        self.assertEqual(collision_index.overlapping_objects(center, [touching, far, rotated]), [touching, far])
+
+        # The narrow phase gives the same result with and without the broad phase, touching faces are left out
+        narrow_phase_boxes = [center, overlapping, far, rotated]
+        for obj in narrow_phase_boxes:
+            others = [other for other in narrow_phase_boxes if other != obj]
+            self.assertEqual(CollisionUtility.check_intersections(obj, bproc.object.BvhCache(), others, [],
+                                                                  collision_index),
+                             CollisionUtility.check_intersections(obj, None, others, []))
+
+    def test_bvh_cache_world_trees(self):
+        """ Tests if the world space trees are reused until their object is moved.
+        """
+        bproc.clean_up(True)
+        moved = bproc.object.create_primitive("CUBE")
+        static = bproc.object.create_primitive("CUBE", location=[1.5, 0, 0])
+        far = bproc.object.create_primitive("CUBE", location=[5, 0, 0])
+
+        bvh_cache = bproc.object.BvhCache()
+        self.assertTrue(bvh_cache.overlap(moved, static))
+        self.assertFalse(bvh_cache.overlap(moved, far))
+        moved_tree, static_tree = bvh_cache.world_tree(moved), bvh_cache.world_tree(static)
+        # Every cube has its own mesh and therefore its own local tree
+        self.assertEqual(len(bvh_cache), 3)
+
+        moved.set_location([4, 0, 0])
+        self.assertFalse(bvh_cache.overlap(moved, static))
+        self.assertTrue(bvh_cache.overlap(moved, far))
+        self.assertIsNot(bvh_cache.world_tree(moved), moved_tree)
+        self.assertIs(bvh_cache.world_tree(static), static_tree)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import blenderproc as bproc
+
+import unittest
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from blenderproc.scripts import generate
+
+
+class UnitTestCheckGenerate(unittest.TestCase):
+
+    def test_generate_split_into_shards(self):
+        """ Tests if the images are split evenly and shards without images are left out.
+        """
+        self.assertEqual(generate.split_into_shards(10, 3), [4, 3, 3])
+        self.assertEqual(generate.split_into_shards(9, 3), [3, 3, 3])
+        self.assertEqual(generate.split_into_shards(2, 4), [1, 1])
+
+    def test_generate_shard_seeds(self):
+        """ Tests if every shard gets its own seed, output dir and number of images.
+        """
+        with TemporaryDirectory() as temp_dir, mock.patch.object(generate.subprocess, "Popen") as popen:
+            popen.return_value.wait.return_value = 0
+            results = generate.run_shards("script.py", ["--config", "config.yaml"], temp_dir, [4, 3, 3], 42, 2,
+                                          None, [])
+
+            self.assertEqual(results, [(os.path.join(temp_dir, "shards", str(shard_id)), 0) for shard_id in range(3)])
+            self.assertEqual(popen.call_count, 3)
+            for shard_id, (call, shard_size) in enumerate(zip(popen.call_args_list, [4, 3, 3])):
+                cmd, env = call.args[0], call.kwargs["env"]
+                self.assertEqual(env["BLENDER_PROC_RANDOM_SEED"], str(42 + shard_id))
+                self.assertEqual(cmd[cmd.index("--num-images") + 1], str(shard_size))
+                self.assertEqual(cmd[cmd.index("--output-dir") + 1], os.path.join(temp_dir, "shards", str(shard_id)))
+                self.assertEqual(cmd[cmd.index("--config") + 1], "config.yaml")
+
+    def test_generate_merge_outputs(self):
+        """ Tests if the coco annotations and hdf5 containers of the shards are renumbered and merged into the
+        existing outputs.
+        """
+        with TemporaryDirectory() as temp_dir:
+            output_dir = os.path.join(temp_dir, "output")
+            os.makedirs(os.path.join(output_dir, "images"))
+            os.makedirs(os.path.join(output_dir, "hdf5"))
+            category = {"id": 1, "name": "robot", "supercategory": "coco_annotations"}
+            with open(os.path.join(output_dir, "coco_annotations.json"), "w", encoding="utf-8") as file:
+                json.dump({"info": {}, "categories": [category],
+                           "images": [{"id": 0, "file_name": "images/000000.jpg"}],
+                           "annotations": [{"id": 1, "image_id": 0, "category_id": 1}]}, file)
+            open(os.path.join(output_dir, "hdf5", "0.hdf5"), "w", encoding="utf-8").close()
+
+            shard_dirs = []
+            for shard_id in range(2):
+                shard_dir = os.path.join(temp_dir, "shards", str(shard_id))
+                os.makedirs(os.path.join(shard_dir, "images"))
+                os.makedirs(os.path.join(shard_dir, "hdf5"))
+                images, annotations = [], []
+                for image_id in range(2):
+                    file_name = f"images/{image_id:06d}.jpg"
+                    with open(os.path.join(shard_dir, file_name), "w", encoding="utf-8") as file:
+                        file.write(f"{shard_id}_{image_id}")
+                    images.append({"id": image_id, "file_name": file_name})
+                    annotations.append({"id": image_id + 1, "image_id": image_id, "category_id": 1})
+                with open(os.path.join(shard_dir, "coco_annotations.json"), "w", encoding="utf-8") as file:
+                    json.dump({"info": {}, "categories": [category], "images": images, "annotations": annotations},
+                              file)
+                for file_name in ["0.hdf5", "1.hdf5", "container_0000.hdf5"]:
+                    with open(os.path.join(shard_dir, "hdf5", file_name), "w", encoding="utf-8") as file:
+                        file.write(f"{shard_id}_{file_name}")
+                shard_dirs.append(shard_dir)
+
+            self.assertEqual(generate.merge_coco_annotations(shard_dirs, output_dir), 4)
+            self.assertEqual(generate.merge_hdf5_containers(shard_dirs, output_dir), 6)
+
+            with open(os.path.join(output_dir, "coco_annotations.json"), "r", encoding="utf-8") as file:
+                coco_annotations = json.load(file)
+            self.assertEqual(coco_annotations["categories"], [category])
+            self.assertEqual([image["id"] for image in coco_annotations["images"]], list(range(5)))
+            self.assertEqual([annotation["id"] for annotation in coco_annotations["annotations"]], list(range(1, 6)))
+            self.assertEqual([annotation["image_id"] for annotation in coco_annotations["annotations"]],
+                             list(range(5)))
+            for image, content in zip(coco_annotations["images"][1:], ["0_0", "0_1", "1_0", "1_1"]):
+                self.assertEqual(image["file_name"], f"images/{image['id']:06d}.jpg")
+                with open(os.path.join(output_dir, image["file_name"]), "r", encoding="utf-8") as file:
+                    self.assertEqual(file.read(), content)
+
+            self.assertEqual(sorted(os.listdir(os.path.join(output_dir, "hdf5"))),
+                             sorted(["0.hdf5", "1.hdf5", "2.hdf5", "3.hdf5", "4.hdf5",
+                                     "container_0000.hdf5", "container_0001.hdf5"]))
+            for file_name, content in [("1.hdf5", "0_0.hdf5"), ("4.hdf5", "1_1.hdf5"),
+                                       ("container_0001.hdf5", "1_container_0000.hdf5")]:
+                with open(os.path.join(output_dir, "hdf5", file_name), "r", encoding="utf-8") as file:
+                    self.assertEqual(file.read(), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
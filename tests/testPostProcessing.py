@@ -0,0 +1,132 @@
+import blenderproc as bproc
+
+import unittest
+import numpy as np
+from scipy import stats
+
+from blenderproc.python.camera import CameraUtility
+from blenderproc.python.postprocessing.PostProcessingUtility import oil_paint_filter, dist2depth, depth2dist, \
+    remove_segmap_noise, _PostProcessingUtility
+
+
+def shifted_copies_oil_paint_filter(image: np.ndarray, filter_size: int) -> np.ndarray:
+    """ The previous implementation of the oil paint filter: filter_size² shifted copies, stacked and reduced.
+    """
+    _min = -int(filter_size / 2)
+    _max = _min + filter_size
+    rows, cols = image.shape
+    channels = [image]
+    for p in range(_min, _max):
+        for q in range(_min, _max):
+            if p == 0 and q == 0:
+                continue
+            shifted = np.zeros_like(image)
+            shifted[max(p, 0):min(rows, rows + p), max(q, 0):min(cols, cols + q)] = \
+                image[max(-p, 0):min(rows - p, rows), max(-q, 0):min(cols - q, cols)]
+            channels.append(shifted)
+    return stats.mode(np.dstack(tuple(channels)), axis=2)[0].reshape(rows, cols)
+
+
+def sequential_remove_segmap_noise(image: np.ndarray) -> np.ndarray:
+    """ The previous implementation of remove_segmap_noise: the noisy pixels are replaced one after another.
+    """
+    for i, j, _ in _PostProcessingUtility.determine_noisy_pixels(image):
+        neighbors = _PostProcessingUtility.get_pixel_neighbors(image, i, j)
+        curr_val = image[i][j][0]
+        neighbor_vals = np.unique(np.array([image[p][q] for p, q in neighbors]))
+
+        min_val = 10000000000
+        min_idx = 0
+        for idx, n in enumerate(neighbor_vals):
+            if n - curr_val <= min_val:
+                min_val = n - curr_val
+                min_idx = idx
+        image[i][j] = neighbor_vals[min_idx]
+    return image
+
+
+class UnitTestCheckPostProcessing(unittest.TestCase):
+
+    def test_oil_paint_filter(self):
+        """ Tests if the oil paint filter on strided windows gives the same result as on shifted copies.
+        """
+        rng = np.random.default_rng(0)
+        # A depth like image with a few distinct values
+        depth = np.kron(rng.uniform(1, 5, (9, 9)), np.ones((6, 6)))[:50, :50].astype(np.float32)
+        depth += rng.integers(0, 3, depth.shape).astype(np.float32) * 0.01
+        frames = [depth + i for i in range(3)]
+
+        for filter_size in [3, 5]:
+            correct = shifted_copies_oil_paint_filter(depth.copy(), filter_size)
+            np.testing.assert_array_equal(oil_paint_filter(depth.copy(), filter_size, edges_only=False), correct)
+
+            correct_frames = [shifted_copies_oil_paint_filter(frame.copy(), filter_size) for frame in frames]
+            for num_workers in [1, 3]:
+                filtered_frames = oil_paint_filter([frame.copy() for frame in frames], filter_size,
+                                                   edges_only=False, num_workers=num_workers)
+                self.assertEqual(len(filtered_frames), len(frames))
+                for filtered_frame, correct_frame in zip(filtered_frames, correct_frames):
+                    np.testing.assert_array_equal(filtered_frame, correct_frame)
+
+    def test_remove_segmap_noise(self):
+        """ Tests if denoising all pixels at once gives the same result as replacing them one after another.
+        """
+        rng = np.random.default_rng(0)
+        for dtype in [np.float32, np.float64]:
+            frames = []
+            for _ in range(4):
+                # Blocks of a few object ids, scaled like the segmaps and large enough to not count as noise
+                ids = rng.integers(0, 5, (3, 3)) * 2
+                segmap = np.kron(ids, np.ones((15, 15)))[:40, :40] * 65536 / 37
+                # Stray pixels in the odd ids in between, some of them next to each other
+                noisy = rng.integers(0, 40, (12, 2))
+                segmap[noisy[:, 0], noisy[:, 1]] = (rng.integers(0, 4, 12) * 2 + 1 + rng.uniform(0, 1, 12)) * 65536 / 37
+                segmap[noisy[:4, 0], np.minimum(noisy[:4, 1] + 1, 39)] = (rng.integers(0, 4, 4) * 2 + 1.5) * 65536 / 37
+                frames.append(np.repeat(segmap[:, :, np.newaxis], 3, axis=2).astype(dtype))
+
+            correct_frames = [sequential_remove_segmap_noise(frame.copy()) for frame in frames]
+            self.assertTrue(all(np.any(frame != correct_frame) for frame, correct_frame in zip(frames, correct_frames)))
+            np.testing.assert_array_equal(remove_segmap_noise(frames[0].copy()), correct_frames[0])
+            for denoised_frame, correct_frame in zip(remove_segmap_noise([frame.copy() for frame in frames]),
+                                                     correct_frames):
+                np.testing.assert_array_equal(denoised_frame, correct_frame)
+
+    def test_dist2depth(self):
+        """ Tests the conversion between distance and depth of single images, stacks and in place.
+        """
+        CameraUtility.set_intrinsics_from_K_matrix(np.array([[300, 0, 31.5], [0, 300, 23.5], [0, 0, 1]]), 64, 48)
+        K = CameraUtility.get_intrinsics_as_K_matrix()
+        f, cx, cy = K[0, 0], K[0, 2], K[1, 2]
+        xs, ys = np.meshgrid(np.arange(64), np.arange(48))
+        ray_lengths = np.sqrt((xs - cx) ** 2 + (ys - cy) ** 2 + f ** 2)
+
+        rng = np.random.default_rng(0)
+        dist = rng.uniform(1, 5, (3, 48, 64))
+        original_dist = dist.copy()
+        correct_depth = dist * f / ray_lengths
+
+        # A stack is converted at once, but still returned as a list of images
+        depth = dist2depth(dist)
+        self.assertIsInstance(depth, list)
+        self.assertEqual(len(depth), 3)
+        np.testing.assert_allclose(np.stack(depth), correct_depth, rtol=1e-12)
+        np.testing.assert_allclose(dist2depth(dist[0]), correct_depth[0], rtol=1e-12)
+        np.testing.assert_allclose(np.stack(depth2dist(depth)), dist, rtol=1e-12)
+        # Without in_place the input is not changed
+        np.testing.assert_array_equal(dist, original_dist)
+
+        # In place, the stack is overwritten if it already has the requested dtype
+        dist_float32 = dist.astype(np.float32)
+        depth_float32 = dist2depth(dist_float32, dtype=np.float32, in_place=True)
+        self.assertTrue(all(np.shares_memory(image, dist_float32) for image in depth_float32))
+        self.assertEqual(depth_float32[0].dtype, np.float32)
+        np.testing.assert_allclose(dist_float32, correct_depth, rtol=1e-6)
+        # A different dtype always needs a copy
+        dist_copy = dist.copy()
+        depth_float32 = dist2depth(dist_copy, dtype=np.float32, in_place=True)
+        self.assertFalse(np.shares_memory(depth_float32[0], dist_copy))
+        np.testing.assert_array_equal(dist_copy, dist)
+
+
+if __name__ == '__main__':
+    unittest.main()
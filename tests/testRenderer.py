@@ -0,0 +1,69 @@
+import blenderproc as bproc
+
+import unittest
+import numpy as np
+import bpy
+
+from blenderproc.python.renderer.InMemoryOutputUtility import _InMemoryOutput
+from blenderproc.python.utility.Utility import UndoAfterExecution
+
+
+class UnitTestCheckRenderer(unittest.TestCase):
+
+    def test_segmap_material_cache_after_undo(self):
+        """ Tests if the cached segmentation materials are still found after an undo step between two renders.
+        """
+        bproc.clean_up(True)
+        with_material = bproc.object.create_primitive("CUBE", location=[-2.5, 0, 0])
+        with_material.add_material(bproc.material.create("original"))
+        without_material = bproc.object.create_primitive("CUBE")
+        # Uses the same mesh without any material slot
+        shared_mesh = bproc.object.create_primitive("CUBE", location=[2.5, 0, 0])
+        shared_mesh.blender_obj.data = without_material.get_mesh()
+
+        bproc.camera.set_resolution(64, 32)
+        bproc.camera.add_camera_pose(bproc.math.build_transformation_mat([0, 0, 15], [0, 0, 0]))
+
+        segmaps = bproc.renderer.render_segmap(map_by="instance", use_material_cache=True)
+        num_materials = len(bpy.data.materials)
+        # Every object is visible and has its own id
+        self.assertEqual(len(np.unique(segmaps["instance_segmaps"][0])), 4)
+
+        with UndoAfterExecution():
+            with_material.set_location([-2.5, 0, 1])
+
+        new_segmaps = bproc.renderer.render_segmap(map_by="instance", use_material_cache=True)
+        np.testing.assert_array_equal(new_segmaps["instance_segmaps"][0], segmaps["instance_segmaps"][0])
+        self.assertEqual(len(bpy.data.materials), num_materials)
+        # The original materials and the meshes are restored
+        self.assertEqual([material.get_name() for material in with_material.get_materials()], ["original"])
+        self.assertEqual(len(without_material.get_mesh().materials), 0)
+        self.assertEqual(len(shared_mesh.blender_obj.material_slots), 0)
+
+    def test_in_memory_output_png_values(self):
+        """ Tests if the linear, premultiplied compositor values are converted like blender writes them into pngs.
+        """
+        # Linear values of black, white, the 0.5 and 0.18 grey, the linear part of the sRGB curve and overexposure
+        linear = np.array([0, 1, 0.5, 0.18, 0.002, 4])
+        # The same values, premultiplied with an alpha of 1, 0.5 and 0, which removes the color
+        pixels = np.zeros((3, 6, 4), dtype=np.float32)
+        for row, alpha in enumerate([1, 0.5, 0]):
+            pixels[row, :, :3] = linear[:, np.newaxis] * alpha
+            pixels[row, :, 3] = alpha
+
+        png_8 = _InMemoryOutput._to_png_values(pixels, "8")
+        self.assertEqual(png_8.dtype, np.uint8)
+        np.testing.assert_array_equal(png_8[0, :, 0], [0, 255, 188, 118, 7, 255])
+        np.testing.assert_array_equal(png_8[1, :, 0], png_8[0, :, 0])
+        np.testing.assert_array_equal(png_8[2, :, 0], 0)
+        np.testing.assert_array_equal(png_8[:, :, 1], png_8[:, :, 0])
+        np.testing.assert_array_equal(png_8[:, :, 3], [[255] * 6, [128] * 6, [0] * 6])
+
+        png_16 = _InMemoryOutput._to_png_values(pixels, "16")
+        self.assertEqual(png_16.dtype, np.uint16)
+        np.testing.assert_array_equal(png_16[0, :, 0], [0, 65535, 48192, 30235, 1693, 65535])
+        np.testing.assert_array_equal(png_16[:, :, 3], [[65535] * 6, [32768] * 6, [0] * 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import blenderproc as bproc
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from blenderproc.python.sampler.ArmaturePoseSampler import ArmaturePoseSampler, _ArmaturePoseSamplerUtility
+
+
+class MockBoneCollection(dict):
+    """ Maps the names to the bones, but iterates over the bones like a blender collection.
+    """
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+def mock_bone_chain() -> SimpleNamespace:
+    """ Creates an armature with a chain of three bones: a root and a forearm pointing along y and a hand pointing
+    along -x in the rest pose.
+    """
+    rest_mats = [np.eye(4), np.eye(4), np.array([[0, -1, 0, 0], [1, 0, 0, 2], [0, 0, 1, 0], [0, 0, 0, 1]])]
+    rest_mats[1][1, 3] = 1
+    data_bones, pose_bones = MockBoneCollection(), MockBoneCollection()
+    parent = None
+    for name, rest_mat, length in zip(["root", "forearm", "hand"], rest_mats, [1, 1, 0.5]):
+        data_bones[name] = SimpleNamespace(name=name, parent=parent, children=[], matrix_local=rest_mat,
+                                           length=length)
+        if parent is not None:
+            parent.children.append(data_bones[name])
+        parent = data_bones[name]
+        pose_bones[name] = SimpleNamespace(matrix_basis=np.eye(4), location=[0, 0, 0], scale=[1, 1, 1],
+                                           rotation_mode="QUATERNION")
+    # The root keeps its current pose, which is moved along z
+    pose_bones["root"].matrix_basis[2, 3] = 3
+    return SimpleNamespace(name="arm", data=SimpleNamespace(bones=data_bones), pose=SimpleNamespace(bones=pose_bones))
+
+
+def brute_force_segment_distance(start: np.ndarray, end: np.ndarray, other_start: np.ndarray,
+                                 other_end: np.ndarray) -> float:
+    """ Searches the closest distance between two segments on a dense grid of points along the first segment.
+    """
+    points = start + np.linspace(0, 1, 20001)[:, np.newaxis] * (end - start)
+    other_direction = other_end - other_start
+    # The closest point on the second segment to every point is found by projection
+    t = np.clip((points - other_start) @ other_direction / max(other_direction @ other_direction, 1e-12), 0, 1)
+    return np.linalg.norm(points - (other_start + t[:, np.newaxis] * other_direction), axis=1).min()
+
+
+class UnitTestCheckSampler(unittest.TestCase):
+
+    def test_armature_pose_sampler_segment_distances(self):
+        """ Tests the closest distances between segments against a brute force search.
+        """
+        rng = np.random.default_rng(0)
+        segments = rng.uniform(-1, 1, (200, 4, 3))
+        # Parallel, collinear and crossing segments, and segments which are only points
+        segments[0] = [[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]]
+        segments[1] = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [3, 0, 0]]
+        segments[2] = [[0, 0, 0], [1, 0, 0], [0.5, 0, 0], [3, 0, 0]]
+        segments[3] = [[-1, 0, 0], [1, 0, 0], [0, -1, 0], [0, 1, 0]]
+        segments[4] = [[0, 0, 0], [0, 0, 0], [1, 1, 0], [1, -1, 0]]
+        segments[5] = [[0, 0, 0], [1, 0, 0], [2, 1, 0], [2, 1, 0]]
+        segments[6] = [[0, 0, 0], [0, 0, 0], [0, 3, 4], [0, 3, 4]]
+
+        distances = _ArmaturePoseSamplerUtility.segment_distances(segments[:, 0], segments[:, 1], segments[:, 2],
+                                                                   segments[:, 3])
+        self.assertEqual(distances.shape, (200,))
+        np.testing.assert_allclose(distances[:7], [1, 1, 0, 0, 1, np.sqrt(2), 5], atol=1e-9)
+        for segment, distance in zip(segments, distances):
+            self.assertAlmostEqual(distance, brute_force_segment_distance(*segment), places=3)
+
+    def test_armature_pose_sampler_forward_kinematics(self):
+        """ Tests the bone poses of a small bone chain, whose forearm is rotated around z.
+        """
+        armature = mock_bone_chain()
+        sampler = ArmaturePoseSampler(armature, {"forearm": [-np.pi, np.pi]}, rng=np.random.default_rng(0))
+        self.assertEqual(sampler.bone_names, ["root", "forearm", "hand"])
+        self.assertEqual(sampler.joint_names, ["forearm"])
+        self.assertEqual(armature.pose.bones["forearm"].rotation_mode, "XYZ")
+
+        angles = np.array([0, np.pi / 2, 0.3])
+        joint_rotations = np.zeros((3, 1, 3))
+        joint_rotations[:, 0, 2] = angles
+        heads_and_tails = sampler.bone_heads_and_tails(sampler.forward_kinematics(joint_rotations))
+        self.assertEqual(heads_and_tails.shape, (3, 3, 2, 3))
+
+        for angle, bone_positions in zip(angles, heads_and_tails):
+            sin, cos = np.sin(angle), np.cos(angle)
+            # The root is not randomized and keeps its pose, all children are moved along with it
+            hand_tail = [-sin - 0.5 * cos, 1 + cos - 0.5 * sin, 3]
+            np.testing.assert_allclose(bone_positions, [[[0, 0, 3], [0, 1, 3]],
+                                                        [[0, 1, 3], [-sin, 1 + cos, 3]],
+                                                        [[-sin, 1 + cos, 3], hand_tail]], atol=1e-9)
+            np.testing.assert_allclose(sampler.bone_head(np.array([[0, 0, angle]]), "hand"), [-sin, 1 + cos, 3],
+                                       atol=1e-9)
+
+        # Without capsules, every sampled pose is valid and within the limits
+        joint_rotations = sampler.sample_joint_rotations(100)
+        self.assertTrue(np.all(sampler.is_valid(joint_rotations)))
+        self.assertTrue(np.all(np.abs(joint_rotations[..., 2]) <= np.pi))
+        np.testing.assert_array_equal(joint_rotations[..., :2], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,17 @@
 import blenderproc as bproc
 
 import unittest
+import json
 import os.path
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from tempfile import TemporaryDirectory
 import numpy as np
 
 from blenderproc.python.tests.SilentMode import SilentMode
 from blenderproc.python.tests.TestsPathManager import test_path_manager
+from blenderproc.python.utility.MetricsUtility import MetricsRegistry, measure_stage, _MetricsUtility
 from blenderproc.python.utility.Utility import UndoAfterExecution
 
 
@@ -48,4 +54,70 @@ def test_math_util_transformation_mat(self):
         cam2world_matrix = bproc.math.build_transformation_mat(location, rotation_matrix)
 
         for x, y in zip(np.reshape(correct_cam2world_matrix, -1).tolist(), np.reshape(cam2world_matrix, -1).tolist()):
-            self.assertAlmostEqual(x, y)
\ No newline at end of file
+            self.assertAlmostEqual(x, y)
+
+    def test_math_util_transformation_mats(self):
+        """ Tests if the batched transformation matrices match the single transformation matrices
+        """
+        locations = np.random.uniform(-5, 5, (20, 3))
+        eulers = bproc.sampler.uniformSO3(size=20)
+
+        cam2world_matrices = bproc.math.build_transformation_mats(locations, eulers)
+
+        for location, euler, cam2world_matrix in zip(locations, eulers, cam2world_matrices):
+            correct_cam2world_matrix = bproc.math.build_transformation_mat(location, euler)
+            np.testing.assert_allclose(cam2world_matrix, correct_cam2world_matrix, atol=1e-6)
+
+    def test_metrics_registry_stages(self):
+        """ Tests if nested and decorated stages are recorded per frame and summarized when the registry is closed.
+        """
+        @measure_stage("decorated")
+        def decorated_stage():
+            time.sleep(0.005)
+
+        # Without an active registry, the stages are not measured
+        decorated_stage()
+
+        with TemporaryDirectory() as temp_dir:
+            metrics_file_path = os.path.join(temp_dir, "metrics", "metrics.jsonl")
+            metrics = MetricsRegistry(metrics_file_path, summary_at_exit=False).activate()
+            for frame in range(2):
+                with measure_stage("outer"):
+                    time.sleep(0.02)
+                    with metrics.stage("inner"):
+                        time.sleep(0.02)
+                for _ in range(frame + 1):
+                    decorated_stage()
+                metrics.end_frame(num_images=3, rejections=frame)
+
+            # The inner stage also counts towards the outer stage
+            self.assertGreater(metrics.percentiles("outer")[50], metrics.percentiles("inner")[50])
+            self.assertEqual(metrics.percentiles("missing"), {50: 0.0, 90: 0.0, 99: 0.0})
+            summary_lines = metrics.summary().split("\n")
+            self.assertTrue(summary_lines[0].startswith("Produced 6 images in 2 frames ("))
+            self.assertEqual([line.split()[0] for line in summary_lines[2:]], ["outer", "inner", "decorated"])
+
+            # A stage measured after the last end_frame() call is stored as a frame without images
+            with metrics.stage("inner"):
+                pass
+            with redirect_stdout(StringIO()) as output:
+                metrics.close()
+            self.assertIn("Produced 6 images in 3 frames", output.getvalue())
+            self.assertIsNone(_MetricsUtility.active_registry)
+
+            with open(metrics_file_path, "r", encoding="utf-8") as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual([record.get("frame") for record in records], [0, 1, 2, None])
+        self.assertEqual([record.get("images") for record in records], [3, 3, 0, 6])
+        self.assertEqual([record.get("rejections") for record in records], [0, 1, None, None])
+        self.assertEqual(sorted(records[0]["stages"]), ["decorated", "inner", "outer"])
+        self.assertEqual(sorted(records[2]["stages"]), ["inner"])
+        for record in records[:2]:
+            stages = record["stages"]
+            self.assertGreaterEqual(stages["inner"]["wall"], 0.02)
+            self.assertGreaterEqual(stages["outer"]["wall"], stages["inner"]["wall"] + 0.02)
+        # Every call of the decorated function is recorded
+        self.assertGreaterEqual(records[1]["stages"]["decorated"]["wall"], 0.01)
+        self.assertTrue(records[3]["summary"])
+        self.assertEqual(records[3]["frames"], 3)
+        self.assertEqual(sorted(records[3]["stages"]), ["decorated", "inner", "outer"])
@@ -0,0 +1,324 @@
+import blenderproc as bproc
+
+import unittest
+import json
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+from multiprocessing import shared_memory
+from tempfile import TemporaryDirectory
+
+import bpy
+import h5py
+import numpy as np
+
+from blenderproc.python.writer.CocoWriterUtility import _CocoWriterUtility, CocoStreamWriter, binary_mask_to_rle
+from blenderproc.python.reader.CocoAnnotationReader import CocoAnnotationIndex, rle_to_binary_mask
+from blenderproc.python.reader.Hdf5DatasetReader import Hdf5Dataset
+from blenderproc.python.writer.AsyncWriterUtility import AsyncWriterPool, _SharedArrayUtility
+from blenderproc.python.writer.WriterUtility import Hdf5StreamWriter
+
+
+@contextmanager
+def scene_frames(frame_start: int, frame_end: int):
+    """ Sets the frame range of the scene, which the hdf5 writers check the given outputs against.
+    """
+    scene = bpy.context.scene
+    previous = (scene.frame_start, scene.frame_end, scene.render.use_multiview)
+    scene.frame_start, scene.frame_end, scene.render.use_multiview = frame_start, frame_end, False
+    try:
+        yield
+    finally:
+        scene.frame_start, scene.frame_end, scene.render.use_multiview = previous
+
+
+def scale_arrays(data: dict, factor: int) -> dict:
+    """ Scales all arrays of the given data, used as writer function running in the workers.
+    """
+    return {key: [array * factor for array in arrays] for key, arrays in data.items()}
+
+
+def coco_frames(num_frames: int) -> Tuple[List[np.ndarray], List[List[Dict[str, Any]]], List[np.ndarray]]:
+    """ Creates the instance segmaps, instance attribute maps and color images of frames with a varying amount of
+    objects.
+    """
+    rng = np.random.default_rng(0)
+    instance_segmaps, instance_attribute_maps, colors = [], [], []
+    for frame in range(num_frames):
+        instance_segmap = np.zeros((12, 16), dtype=np.uint8)
+        attribute_map = [{"idx": 0, "category_id": 0}]
+        for idx in range(1, frame % 3 + 2):
+            instance_segmap[idx * 3:idx * 3 + 2, idx:idx * 4] = idx
+            attribute_map.append({"idx": idx, "category_id": idx % 2 + 1, "name": ["robot", "tool"][idx % 2]})
+        instance_segmaps.append(instance_segmap)
+        instance_attribute_maps.append(attribute_map)
+        colors.append(rng.integers(0, 255, (12, 16, 3), dtype=np.uint8))
+    return instance_segmaps, instance_attribute_maps, colors
+
+
+def load_coco_annotations(output_dir: str) -> Dict[str, Any]:
+    """ Loads the coco annotations written into the given directory, without the capture dates of the images.
+    """
+    with open(os.path.join(output_dir, "coco_annotations.json"), "r", encoding="utf-8") as file:
+        coco_annotations = json.load(file)
+    for image in coco_annotations["images"]:
+        del image["date_captured"]
+    return coco_annotations
+
+
+class UnitTestCheckWriter(unittest.TestCase):
+
+    def test_coco_instance_segmap_to_rles(self):
+        """ Tests if encoding all instances at once gives the same result as encoding every instance mask separately.
+        """
+        inst_segmap = np.zeros((48, 64), dtype=np.uint8)
+        inst_segmap[5:20, 3:30] = 1
+        inst_segmap[10:48, 20:25] = 2
+        inst_segmap[0:3, 60:64] = 3
+        inst_segmap[40:48, 0:64] = 4
+        inst_segmap[30, 10] = 5
+
+        instance_rles = _CocoWriterUtility.instance_segmap_to_rles(inst_segmap)
+
+        self.assertEqual(sorted(instance_rles.keys()), np.unique(inst_segmap).tolist())
+        for inst, (rle, bbox, area) in instance_rles.items():
+            binary_inst_mask = np.where(inst_segmap == inst, 1, 0)
+            self.assertEqual(rle, binary_mask_to_rle(binary_inst_mask))
+            self.assertEqual(bbox, _CocoWriterUtility.bbox_from_binary_mask(binary_inst_mask))
+            self.assertEqual(area, _CocoWriterUtility.calc_binary_mask_area(binary_inst_mask))
+
+    def test_coco_binary_mask_to_rle(self):
+        """ Tests the run-length encoding of masks starting with and without the object.
+        """
+        binary_mask = np.array([[1, 0, 0], [1, 1, 0]])
+        self.assertEqual(binary_mask_to_rle(binary_mask), {'counts': [0, 2, 1, 1, 2], 'size': [2, 3]})
+        self.assertEqual(binary_mask_to_rle(1 - binary_mask), {'counts': [2, 1, 1, 2], 'size': [2, 3]})
+
+    def test_coco_annotation_index(self):
+        """ Tests if the indexed annotations of every image match the annotations of the parsed coco file.
+        """
+        binary_mask = np.array([[1, 0, 0], [1, 1, 0]])
+        coco_annotations = {
+            "info": {"description": "Kamera über dem Tisch"},
+            "categories": [{"id": 1, "name": "robot"}, {"id": 2, "name": "Werkstück"}],
+            "images": [{"id": image_id, "file_name": f"images/{image_id:06d}.jpg"} for image_id in range(3)],
+            # The annotations of image 0 are not consecutive and image 2 has no annotations
+            "annotations": [
+                {"id": 1, "image_id": 0, "category_id": 1, "segmentation": binary_mask_to_rle(binary_mask)},
+                {"id": 2, "image_id": 1, "category_id": 2, "name": "Stück"},
+                {"id": 3, "image_id": 1, "category_id": 1, "bbox": [0, 1, 2, 3]},
+                {"id": 4, "image_id": 0, "category_id": 2, "name": "ß"}
+            ]
+        }
+
+        with TemporaryDirectory() as temp_dir:
+            for file_name, indent in [("indented.json", 2), ("compact.json", None)]:
+                annotation_file_path = os.path.join(temp_dir, file_name)
+                with open(annotation_file_path, "w", encoding="utf-8") as file:
+                    json.dump(coco_annotations, file, indent=indent, ensure_ascii=False)
+
+                for cache_index in [True, True, False]:
+                    index = CocoAnnotationIndex(annotation_file_path, cache_index=cache_index)
+                    self.assertEqual(index.images, coco_annotations["images"])
+                    self.assertEqual(index.image_ids, [0, 1, 2])
+                    self.assertEqual(index.category_name(2), "Werkstück")
+                    with self.assertRaises(RuntimeError):
+                        index.category_name(3)
+                    for image_id in range(3):
+                        self.assertEqual(index.annotations_of_image(image_id),
+                                         [annotation for annotation in coco_annotations["annotations"]
+                                          if annotation["image_id"] == image_id])
+                    segmentation = index.annotations_of_image(0)[0]["segmentation"]
+                    np.testing.assert_array_equal(rle_to_binary_mask(segmentation), binary_mask)
+                self.assertTrue(os.path.exists(annotation_file_path + CocoAnnotationIndex.index_file_suffix))
+
+    def test_hdf5_stream_writer_round_trip(self):
+        """ Tests if the frames written by the Hdf5StreamWriter are read back unchanged, in both layouts.
+        """
+        rng = np.random.default_rng(0)
+        output = {"colors": [rng.integers(0, 255, (4, 6, 3), dtype=np.uint8) for _ in range(3)],
+                  "depth": [rng.uniform(0, 10, (4, 6)).astype(np.float32) for _ in range(3)]}
+
+        with TemporaryDirectory() as temp_dir:
+            frames_dir = os.path.join(temp_dir, "frames")
+            with scene_frames(2, 5):
+                # The files are named after frame + offset, the next call continues after the highest index
+                with Hdf5StreamWriter(frames_dir) as writer:
+                    writer.write(output)
+                    writer.write(output)
+                with Hdf5StreamWriter(frames_dir) as writer:
+                    self.assertEqual(writer.next_index, 10)
+                    with self.assertRaises(Exception):
+                        writer.write({"colors": output["colors"][:2]})
+            self.assertEqual(sorted(os.listdir(frames_dir)), [f"{index}.hdf5" for index in [2, 3, 4, 7, 8, 9]])
+            for index, frame in zip([2, 3, 4, 7, 8, 9], [0, 1, 2, 0, 1, 2]):
+                with h5py.File(os.path.join(frames_dir, f"{index}.hdf5"), "r") as data:
+                    np.testing.assert_array_equal(data["colors"][()], output["colors"][frame])
+                    np.testing.assert_array_equal(data["depth"][()], output["depth"][frame])
+
+            containers_dir = os.path.join(temp_dir, "containers")
+            with scene_frames(0, 3):
+                with Hdf5StreamWriter(containers_dir, consolidated=True, frames_per_container=4) \
+                        as writer:
+                    writer.write(output)
+                    writer.write(output)
+                    self.assertEqual(writer.next_index, 6)
+            rows = []
+            for container_name, num_frames in [("container_0000.hdf5", 4), ("container_0001.hdf5", 2)]:
+                with h5py.File(os.path.join(containers_dir, container_name), "r") as data:
+                    self.assertEqual(data.attrs["num_frames"], num_frames)
+                    rows.extend(zip(data["colors"][()], data["depth"][()]))
+            self.assertEqual(len(rows), 6)
+            for frame, (colors, depth) in enumerate(rows):
+                np.testing.assert_array_equal(colors, output["colors"][frame % 3])
+                np.testing.assert_array_equal(depth, output["depth"][frame % 3])
+
+    def test_hdf5_dataset_round_trip(self):
+        """ Tests if the Hdf5Dataset reads the frames of both hdf5 layouts back in the order they were written.
+        """
+        rng = np.random.default_rng(1)
+        # More than ten frames, so the files have to be sorted by their index and not by their name
+        output = {"colors": [rng.integers(0, 255, (4, 6, 3), dtype=np.uint8) for _ in range(11)],
+                  "depth": [rng.uniform(0, 10, (4, 6)).astype(np.float32) for _ in range(11)]}
+
+        with TemporaryDirectory() as temp_dir:
+            frames_dir = os.path.join(temp_dir, "frames")
+            containers_dir = os.path.join(temp_dir, "containers")
+            with scene_frames(0, 11):
+                with Hdf5StreamWriter(frames_dir) as writer:
+                    writer.write(output)
+                with Hdf5StreamWriter(containers_dir, consolidated=True, frames_per_container=4) as writer:
+                    writer.write(output)
+
+            for cache_index in [True, True, False]:
+                with Hdf5Dataset([frames_dir, containers_dir], cache_index=cache_index) as dataset:
+                    self.assertEqual(len(dataset), 22)
+                    # The one file per frame containers also store the version as dataset
+                    self.assertEqual(sorted(dataset.keys), ["blender_proc_version", "colors", "depth"])
+                    self.assertEqual(dataset.key_info("colors"), ((4, 6, 3), np.dtype(np.uint8)))
+                    self.assertEqual(dataset.key_info("depth", 15), ((4, 6), np.dtype(np.float32)))
+                    self.assertEqual(dataset.frame_name(10), "10")
+                    self.assertEqual(dataset.frame(-1).file_label, "container_0002.hdf5 [2]")
+                    self.assertEqual(dataset.frame_name(-1), "container_0002_2")
+                    for frame_index, frame in enumerate(dataset):
+                        np.testing.assert_array_equal(frame["colors"], output["colors"][frame_index % 11])
+                        np.testing.assert_array_equal(frame["depth"], output["depth"][frame_index % 11])
+                    np.testing.assert_array_equal(dataset.read(5, "colors", np.s_[1:3, :, 0]),
+                                                  output["colors"][5][1:3, :, 0])
+                    np.testing.assert_array_equal(dataset.read(16, "colors", np.s_[1:3, :, 0]),
+                                                  output["colors"][5][1:3, :, 0])
+                self.assertTrue(os.path.exists(os.path.join(frames_dir, Hdf5Dataset.index_file_name)))
+
+            with Hdf5Dataset(containers_dir, keys=["depth"]) as dataset:
+                self.assertEqual(list(dataset.frame(3).keys()), ["depth"])
+                self.assertNotIn("colors", dataset[3])
+
+    def test_async_writer_pool_shared_memory(self):
+        """ Tests if arrays are handed over to the workers via shared memory, which is freed after the job.
+        """
+        rng = np.random.default_rng(0)
+        large, small = rng.integers(0, 100, (256, 256, 3)), np.arange(4)
+        data = {"arrays": [large, small]}
+
+        shared_blocks = []
+        shared_data = _SharedArrayUtility.share(data, shared_blocks, 1024)
+        # Only the large array is put into shared memory
+        self.assertEqual(len(shared_blocks), 1)
+        self.assertIs(shared_data["arrays"][1], small)
+        attached_blocks = []
+        resolved_data = _SharedArrayUtility.resolve(shared_data, attached_blocks)
+        np.testing.assert_array_equal(resolved_data["arrays"][0], large)
+        del resolved_data
+        for block in attached_blocks:
+            block.close()
+        _SharedArrayUtility.release(shared_blocks)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shared_blocks[0].name)
+
+        original_large = large.copy()
+        num_children = len(multiprocessing.active_children())
+        with AsyncWriterPool(num_workers=2, shared_memory_min_bytes=1024) as writer_pool:
+            if writer_pool.copies_arguments:
+                # All workers are started before the first job is submitted
+                self.assertEqual(len(multiprocessing.active_children()), num_children + 2)
+            futures = [writer_pool.submit(scale_arrays, data, factor) for factor in range(3)]
+            if writer_pool.copies_arguments:
+                # The arguments have already been copied, so they can be overwritten
+                large += 1
+            writer_pool.flush()
+        for factor, future in enumerate(futures):
+            result = future.result()
+            np.testing.assert_array_equal(result["arrays"][0], original_large * factor)
+            np.testing.assert_array_equal(result["arrays"][1], small * factor)
+
+    def test_async_writer_pool_backpressure(self):
+        """ Tests if submit() blocks until the oldest job has finished, if there are too many pending jobs.
+        """
+        with AsyncWriterPool(num_workers=1, max_pending=2) as writer_pool:
+            futures = [writer_pool.submit(time.sleep, 0.2) for _ in range(3)]
+            # The third submit had to wait for the first job, the third job has only just been started
+            self.assertTrue(futures[0].done())
+            self.assertFalse(futures[2].done())
+        self.assertTrue(all(future.done() for future in futures))
+
+
+    def test_coco_stream_writer_recovery(self):
+        """ Tests if a run, which was killed while writing the journal, is continued with the following ids.
+        """
+        instance_segmaps, instance_attribute_maps, colors = coco_frames(5)
+
+        with TemporaryDirectory() as temp_dir:
+            reference_dir, output_dir = os.path.join(temp_dir, "reference"), os.path.join(temp_dir, "output")
+            with CocoStreamWriter(reference_dir) as writer:
+                writer.write(instance_segmaps, instance_attribute_maps, colors)
+            reference = load_coco_annotations(reference_dir)
+            self.assertEqual([image["id"] for image in reference["images"]], list(range(5)))
+            self.assertEqual([annotation["id"] for annotation in reference["annotations"]], list(range(1, 10)))
+
+            # The first run is killed while it writes the record of its third frame
+            writer = CocoStreamWriter(output_dir)
+            writer.write(instance_segmaps[:2], instance_attribute_maps[:2], colors[:2])
+            writer.write(instance_segmaps[2:3], instance_attribute_maps[2:3], colors[2:3])
+            journal_path = os.path.join(output_dir, CocoStreamWriter.journal_file_name)
+            with open(journal_path, "rb+") as file:
+                file.truncate(os.path.getsize(journal_path) - 20)
+            self.assertFalse(os.path.exists(os.path.join(output_dir, "coco_annotations.json")))
+
+            # The second run drops the incomplete record and writes the lost frame again, reusing its ids
+            with CocoStreamWriter(output_dir) as writer:
+                writer.write(instance_segmaps[2:], instance_attribute_maps[2:], colors[2:])
+            self.assertFalse(os.path.exists(journal_path))
+            coco_annotations = load_coco_annotations(output_dir)
+            for key in ["categories", "images", "annotations"]:
+                self.assertEqual(coco_annotations[key], reference[key])
+            self.assertEqual(sorted(os.listdir(os.path.join(output_dir, "images"))),
+                             [f"{image_id:06d}.png" for image_id in range(5)])
+
+    def test_coco_stream_writer_pool(self):
+        """ Tests if the frames encoded in the writer pool give the same annotations as encoded in this process.
+        """
+        instance_segmaps, instance_attribute_maps, colors = coco_frames(7)
+
+        with TemporaryDirectory() as temp_dir:
+            reference_dir, output_dir = os.path.join(temp_dir, "reference"), os.path.join(temp_dir, "output")
+            with CocoStreamWriter(reference_dir) as writer:
+                writer.write(instance_segmaps, instance_attribute_maps, colors)
+
+            with AsyncWriterPool(num_workers=2, max_pending=2) as writer_pool, \
+                    CocoStreamWriter(output_dir, writer_pool=writer_pool) as writer:
+                for frame in range(0, 7, 2):
+                    writer.write(instance_segmaps[frame:frame + 2], instance_attribute_maps[frame:frame + 2],
+                                 colors[frame:frame + 2])
+
+            reference, coco_annotations = load_coco_annotations(reference_dir), load_coco_annotations(output_dir)
+            for key in ["categories", "images", "annotations"]:
+                self.assertEqual(coco_annotations[key], reference[key])
+            self.assertEqual(sorted(os.listdir(os.path.join(output_dir, "images"))),
+                             sorted(os.listdir(os.path.join(reference_dir, "images"))))
+
+
+
+if __name__ == '__main__':
+    unittest.main()